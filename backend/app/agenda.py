@@ -0,0 +1,247 @@
+"""
+Индекс мероприятий участников eventum (agenda).
+
+Индекс - обратный индекс движка групп: для каждого участника хранится список
+(event_id, kind) в порядке начала мероприятий, где kind:
+    member    - участник входит в event_group мероприятия (с учетом вложенных групп)
+    applicant - участник подал заявку на мероприятие
+
+Мероприятия без event_group видны всем участникам и хранятся одним общим
+списком. Индекс строится из EventumGroupGraph и нескольких запросов на весь
+eventum и хранится в памяти процесса вместе с версией данных eventum (как
+индекс занятости), поэтому "мои регистрации",
+регистрации участника и календарь участника получают ID мероприятий без
+вычисления групп, а сами мероприятия загружают одним запросом по ID.
+
+Вместе с индексом хранятся настройки регистраций (вместимость, allowed_group,
+волны), счетчики записанных и состав allowed_group, поэтому список доступных
+для записи мероприятий тоже вычисляется в памяти.
+"""
+import threading
+from collections import OrderedDict
+
+from .caching import get_eventum_version_key
+from .schedule import IntervalIndex
+from .utils import EventumGroupGraph
+
+# Сколько индексов eventum держать в памяти процесса
+AGENDA_CACHE_SIZE = 32
+
+_agenda_cache = OrderedDict()  # {eventum_id: (версия данных eventum, AgendaIndex)}
+_agenda_lock = threading.Lock()
+
+KIND_MEMBER = 'member'
+KIND_APPLICANT = 'applicant'
+
+# Поля мероприятий и их регистраций, хранящиеся в индексе
+EVENT_FIELDS = (
+    'id', 'name', 'start_time', 'end_time', 'event_group_id',
+    'registration__registration_type', 'registration__max_participants', 'registration__allowed_group_id',
+)
+
+
+class AgendaIndex:
+    """Мероприятия каждого участника eventum и счетчики участников мероприятий."""
+
+    def __init__(self, events, group_graph, applicants, event_waves=None):
+        """
+        Args:
+            events: iterable словарей с полями EVENT_FIELDS в порядке начала
+            group_graph: EventumGroupGraph того же eventum
+            applicants: {event_id: set(participant_id)} заявок на мероприятия
+            event_waves: {event_id: tuple(wave_id)} волн регистраций мероприятий
+        """
+        from .models import EventRegistration
+
+        self.button_type = EventRegistration.RegistrationType.BUTTON
+        self.event_order = []
+        self.public_event_ids = []
+        self.events = {}
+        self.registrations = {}
+        self.registration_types = {}
+        self.participant_counts = {}
+        self.registered_counts = {}
+        self.allowed_members = {}
+        self.event_waves = event_waves or {}
+        self.entries = {}
+
+        for row in events:
+            event_id = row['id']
+            event_group_id = row['event_group_id']
+            registration_type = row['registration__registration_type']
+            self.event_order.append(event_id)
+            self.events[event_id] = (row['name'], row['start_time'], row['end_time'])
+            self.registration_types[event_id] = registration_type
+            event_applicants = applicants.get(event_id, ())
+
+            if registration_type is not None:
+                allowed_group_id = row['registration__allowed_group_id']
+                self.registrations[event_id] = {
+                    'registration_type': registration_type,
+                    'max_participants': row['registration__max_participants'],
+                    'allowed_group_id': allowed_group_id,
+                    'event_group_id': event_group_id,
+                }
+                # Состав каждой allowed_group вычисляется один раз на все регистрации
+                if allowed_group_id and allowed_group_id not in self.allowed_members:
+                    self.allowed_members[allowed_group_id] = frozenset(group_graph.get_participant_ids(allowed_group_id))
+
+            members = group_graph.get_participant_ids(event_group_id) if event_group_id else ()
+            if event_group_id is None:
+                self.public_event_ids.append(event_id)
+            self.participant_counts[event_id] = len(members)
+            if registration_type == self.button_type:
+                self.registered_counts[event_id] = len(members)
+            elif registration_type is not None:
+                self.registered_counts[event_id] = len(event_applicants)
+
+            for participant_id in members:
+                self.entries.setdefault(participant_id, []).append((event_id, KIND_MEMBER))
+            for participant_id in event_applicants:
+                self.entries.setdefault(participant_id, []).append((event_id, KIND_APPLICANT))
+
+        self.entries = {participant_id: tuple(items) for participant_id, items in self.entries.items()}
+        self.public_ids = frozenset(self.public_event_ids)
+        self._positions = {event_id: position for position, event_id in enumerate(self.event_order)}
+        self._last_kinds = (None, {})
+
+    @classmethod
+    def build(cls, eventum, group_graph=None):
+        """Строит индекс: граф групп, мероприятия с регистрациями, заявки и волны."""
+        from .models import Event, EventRegistration, EventWave
+
+        if group_graph is None:
+            group_graph = EventumGroupGraph(eventum)
+        events = Event.objects.filter(eventum=eventum).order_by('start_time', 'id').values(*EVENT_FIELDS)
+        applicants = {}
+        rows = EventRegistration.applicants.through.objects.filter(
+            eventregistration__event__eventum=eventum
+        ).values_list('eventregistration__event_id', 'participant_id')
+        for event_id, participant_id in rows:
+            applicants.setdefault(event_id, set()).add(participant_id)
+        event_waves = {}
+        rows = EventWave.registrations.through.objects.filter(
+            eventwave__eventum=eventum
+        ).order_by('eventwave_id').values_list('eventregistration__event_id', 'eventwave_id')
+        for event_id, wave_id in rows:
+            event_waves[event_id] = event_waves.get(event_id, ()) + (wave_id,)
+        return cls(events, group_graph, applicants, event_waves)
+
+    def kinds(self, participant_id):
+        """{event_id: set(kind)} мероприятий участника (последний результат запоминается)."""
+        # Индекс общий для потоков процесса, поэтому пара читается и заменяется целиком
+        last_kinds = self._last_kinds
+        if last_kinds[0] != participant_id:
+            result = {}
+            for event_id, kind in self.entries.get(participant_id, ()):
+                result.setdefault(event_id, set()).add(kind)
+            last_kinds = (participant_id, result)
+            self._last_kinds = last_kinds
+        return last_kinds[1]
+
+    def is_registered(self, participant_id, event_id):
+        """
+        Записан ли участник на мероприятие (как EventSerializer.get_is_registered):
+        для button - входит в event_group, для application - в event_group или в заявках.
+        """
+        registration_type = self.registration_types.get(event_id)
+        if registration_type is None:
+            return False
+        kinds = self.kinds(participant_id).get(event_id, ())
+        if registration_type == self.button_type:
+            return KIND_MEMBER in kinds
+        return bool(kinds)
+
+    def is_participant(self, participant_id, event_id):
+        """Участвует ли участник в мероприятии (как EventSerializer.get_is_participant)."""
+        if event_id in self.public_ids:
+            return True
+        return KIND_MEMBER in self.kinds(participant_id).get(event_id, ())
+
+    def registered_event_ids(self, participant_id):
+        """
+        ID мероприятий, на которые участник записан или подал заявку, в порядке начала.
+
+        Для button участник записан, если входит в event_group, для application -
+        только если подал заявку: участник event_group без заявки сюда не попадает
+        (в отличие от is_registered).
+        """
+        # Записи участника уже упорядочены по началу мероприятий
+        result = []
+        for event_id, kind in self.entries.get(participant_id, ()):
+            registration_type = self.registration_types.get(event_id)
+            if registration_type is None:
+                continue
+            if kind == (KIND_MEMBER if registration_type == self.button_type else KIND_APPLICANT):
+                result.append(event_id)
+        return result
+
+    def schedule_event_ids(self, participant_id):
+        """ID мероприятий расписания участника (общие и его групп) в порядке начала."""
+        event_ids = set(self.public_ids)
+        event_ids.update(event_id for event_id, kind in self.entries.get(participant_id, ()) if kind == KIND_MEMBER)
+        return sorted(event_ids, key=self._positions.__getitem__)
+
+    def available_event_ids(self, participant_id, forbid_overlaps=False):
+        """
+        ID мероприятий, на которые участник еще может записаться, в порядке начала.
+
+        Те же проверки, что при записи (EventViewSet.register): участник входит
+        в allowed_group, еще не записан, регистрация по кнопке не заполнена.
+        Кроме того, исключаются мероприятия волн, в которых участник уже
+        записан на другое мероприятие, и, если forbid_overlaps, мероприятия,
+        пересекающиеся по времени с его записями. Открыта ли регистрация в
+        eventum, проверяет вызывающий код.
+        """
+        registered_ids = list(dict.fromkeys(
+            event_id for event_id, _ in self.entries.get(participant_id, ())
+            if self.is_registered(participant_id, event_id)
+        ))
+        busy_waves = {wave_id for event_id in registered_ids for wave_id in self.event_waves.get(event_id, ())}
+        overlaps = None
+        if forbid_overlaps:
+            overlaps = IntervalIndex(
+                (self.events[event_id][1], self.events[event_id][2], event_id) for event_id in registered_ids
+            )
+        registered_ids = set(registered_ids)
+
+        result = []
+        for event_id in self.event_order:
+            registration = self.registrations.get(event_id)
+            if registration is None or event_id in registered_ids:
+                continue
+            allowed_group_id = registration['allowed_group_id']
+            if allowed_group_id and participant_id not in self.allowed_members[allowed_group_id]:
+                continue
+            if registration['registration_type'] == self.button_type:
+                if not registration['event_group_id']:
+                    continue
+                max_participants = registration['max_participants']
+                if max_participants and self.registered_counts[event_id] >= max_participants:
+                    continue
+            if any(wave_id in busy_waves for wave_id in self.event_waves.get(event_id, ())):
+                continue
+            _, start_time, end_time = self.events[event_id]
+            if overlaps is not None and overlaps.has_overlap(start_time, end_time):
+                continue
+            result.append(event_id)
+        return result
+
+
+def get_agenda_index(eventum, group_graph=None):
+    """Индекс из памяти процесса (если версия данных eventum не изменилась) или построенный заново."""
+    version = get_eventum_version_key(eventum)
+    with _agenda_lock:
+        cached = _agenda_cache.get(eventum.id)
+        if cached is not None and cached[0] == version:
+            _agenda_cache.move_to_end(eventum.id)
+            return cached[1]
+
+    # Индекс строится вне блокировки: потоки, одновременно построившие его, получат одинаковый результат
+    index = AgendaIndex.build(eventum, group_graph=group_graph)
+    with _agenda_lock:
+        _agenda_cache[eventum.id] = (version, index)
+        _agenda_cache.move_to_end(eventum.id)
+        while len(_agenda_cache) > AGENDA_CACHE_SIZE:
+            _agenda_cache.popitem(last=False)
+    return index
@@ -0,0 +1,166 @@
+"""
+Аналитика распределения участников по мероприятиям.
+
+Матрица инцидентности "участник × мероприятие" хранится по столбцам:
+для каждого мероприятия - целое число, в котором бит i означает участника
+с индексом i. Пересечения и объединения столбцов считаются побитовыми
+операциями над целыми, а мощности - через int.bit_count(), поэтому попарные
+совпадения вычисляются без перебора участников.
+"""
+from itertools import combinations
+
+from .utils import EventumGroupGraph
+
+
+class MembershipMatrix:
+    """Разреженная матрица участник × мероприятие в виде битовых столбцов."""
+
+    def __init__(self, participant_ids, columns):
+        """
+        Args:
+            participant_ids: Упорядоченный список ID участников (строки матрицы)
+            columns: {event_id: iterable(participant_id)} - ненулевые элементы столбцов
+        """
+        self.participant_ids = list(participant_ids)
+        self.row_index = {participant_id: index for index, participant_id in enumerate(self.participant_ids)}
+        self.columns = {}
+        self.row_counts = [0] * len(self.participant_ids)
+
+        for event_id, members in columns.items():
+            bits = 0
+            for participant_id in members:
+                index = self.row_index.get(participant_id)
+                if index is None:
+                    continue
+                bits |= 1 << index
+                self.row_counts[index] += 1
+            self.columns[event_id] = bits
+
+    def column_count(self, event_id):
+        """Количество ненулевых элементов столбца."""
+        return self.columns.get(event_id, 0).bit_count()
+
+    def co_occurrence(self):
+        """
+        Попарные пересечения столбцов.
+
+        Returns:
+            list: [(event_id_a, event_id_b, count)] только для ненулевых пар
+        """
+        result = []
+        for (first_id, first_bits), (second_id, second_bits) in combinations(self.columns.items(), 2):
+            count = (first_bits & second_bits).bit_count()
+            if count:
+                result.append((first_id, second_id, count))
+        return result
+
+    def empty_rows(self):
+        """ID участников, у которых нет ни одного ненулевого элемента."""
+        union = 0
+        for bits in self.columns.values():
+            union |= bits
+        missing = ~union & ((1 << len(self.participant_ids)) - 1)
+
+        result = []
+        while missing:
+            lowest = missing & -missing
+            result.append(self.participant_ids[lowest.bit_length() - 1])
+            missing ^= lowest
+        return result
+
+    def row_count_distribution(self):
+        """Распределение количества ненулевых элементов по строкам: {k: число участников}."""
+        distribution = {}
+        for count in self.row_counts:
+            distribution[count] = distribution.get(count, 0) + 1
+        return dict(sorted(distribution.items()))
+
+
+def get_scope_events(eventum, wave_id=None, tag_id=None):
+    """
+    Мероприятия области анализа: волна, тег или весь eventum (мероприятия с регистрацией).
+    """
+    from .models import Event
+
+    events = Event.objects.filter(eventum=eventum).select_related('registration')
+    if wave_id is not None:
+        events = events.filter(registration__waves__id=wave_id)
+    elif tag_id is not None:
+        events = events.filter(tags__id=tag_id)
+    else:
+        events = events.filter(registration__isnull=False)
+    return list(events.distinct().order_by('start_time', 'id'))
+
+
+def build_membership_report(eventum, events, group_graph=None):
+    """
+    Строит отчет по матрицам заявок и мест для набора мероприятий.
+
+    Заявки - applicants для регистрации по заявкам и состав event_group для
+    регистрации по кнопке; места - состав event_group мероприятия.
+
+    Returns:
+        dict: Готовые таблицы для ответа API
+    """
+    from .models import EventRegistration
+
+    if group_graph is None:
+        group_graph = EventumGroupGraph(eventum)
+
+    seats = {}
+    applications = {}
+    application_registration_ids = {}
+    for event in events:
+        seats[event.id] = group_graph.get_participant_ids(event.event_group_id) if event.event_group_id else set()
+        registration = getattr(event, 'registration', None)
+        if registration is None:
+            applications[event.id] = set()
+        elif registration.registration_type == EventRegistration.RegistrationType.APPLICATION:
+            application_registration_ids[registration.id] = event.id
+            applications[event.id] = set()
+        else:
+            applications[event.id] = seats[event.id]
+
+    if application_registration_ids:
+        applicant_rows = EventRegistration.applicants.through.objects.filter(
+            eventregistration_id__in=application_registration_ids.keys()
+        ).values_list('eventregistration_id', 'participant_id')
+        for registration_id, participant_id in applicant_rows:
+            applications[application_registration_ids[registration_id]].add(participant_id)
+
+    participant_ids = sorted(group_graph.all_participant_ids)
+    application_matrix = MembershipMatrix(participant_ids, applications)
+    seat_matrix = MembershipMatrix(participant_ids, seats)
+
+    participants_map = group_graph.participants_map
+    unassigned = [
+        {
+            'id': participant_id,
+            'name': participants_map[participant_id].name,
+            'applications_count': application_matrix.row_counts[application_matrix.row_index[participant_id]],
+        }
+        for participant_id in seat_matrix.empty_rows()
+    ]
+    unassigned.sort(key=lambda item: (item['name'], item['id']))
+
+    return {
+        'participants_count': len(participant_ids),
+        'events': [
+            {
+                'id': event.id,
+                'name': event.name,
+                'applications_count': application_matrix.column_count(event.id),
+                'seats_count': seat_matrix.column_count(event.id),
+            }
+            for event in events
+        ],
+        'co_occurrence': [
+            {'event_ids': [first_id, second_id], 'count': count}
+            for first_id, second_id, count in application_matrix.co_occurrence()
+        ],
+        'unassigned': unassigned,
+        'applications_distribution': [
+            {'applications_count': applications_count, 'participants_count': participants_count}
+            for applications_count, participants_count in application_matrix.row_count_distribution().items()
+        ],
+    }
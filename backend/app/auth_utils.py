@@ -6,6 +6,7 @@ from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework.response import Response
 from rest_framework import status
+from .caching import get_eventum_by_slug, get_user_membership
 from .models import Eventum, UserRole, Participant
 
 
@@ -30,10 +31,9 @@ def get_eventum_from_request(request, view=None, kwargs=None):
     if not eventum_slug:
         raise Http404("Eventum slug not found in URL")
     
-    # Получаем eventum по slug
-    try:
-        eventum = Eventum.objects.get(slug=eventum_slug)
-    except Eventum.DoesNotExist:
+    # Получаем eventum по slug (из кэша строк Eventum)
+    eventum = get_eventum_by_slug(eventum_slug)
+    if eventum is None:
         raise Http404(f"Eventum with slug '{eventum_slug}' not found")
     
     # Кэшируем результат
@@ -60,6 +60,87 @@ def get_user_role_in_eventum(user, eventum):
     return None
 
 
+class ViewerContext:
+    """
+    Роль и участник текущего пользователя в eventum.
+
+    Загружается лениво при первом обращении: членство берется из кэша
+    (get_user_membership), а при промахе - одним запросом (организаторство и
+    участник - подзапросами к UserRole и Participant). Контекст хранится в
+    request, поэтому разрешения, views и сериализаторы не повторяют запросы.
+    """
+
+    def __init__(self, user, eventum):
+        self.user = user
+        self.eventum = eventum
+        self._loaded = False
+        self._is_organizer = False
+        self._participant = None
+
+    def _load_membership(self):
+        from django.db.models import Exists, OuterRef, Subquery
+
+        participants = Participant.objects.filter(user=self.user, eventum=OuterRef('pk'))
+        row = Eventum.objects.filter(pk=self.eventum.pk).annotate(
+            is_organizer=Exists(UserRole.objects.filter(user=self.user, eventum=OuterRef('pk'), role='organizer')),
+            participant_id=Subquery(participants.values('id')[:1]),
+            participant_name=Subquery(participants.values('name')[:1]),
+        ).values_list('is_organizer', 'participant_id', 'participant_name').first()
+        if row is None:
+            return False, None, None
+        return bool(row[0]), row[1], row[2]
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.user or not self.user.is_authenticated:
+            return
+
+        is_organizer, participant_id, participant_name = get_user_membership(
+            self.user.pk, self.eventum.pk, self._load_membership
+        )
+        self._is_organizer = bool(is_organizer)
+        if participant_id is not None:
+            participant = Participant.from_db(
+                Participant.objects.db, ['id', 'eventum_id', 'user_id', 'name'],
+                [participant_id, self.eventum.pk, self.user.pk, participant_name]
+            )
+            # Связанные объекты уже известны - обращение к ним не делает запросов
+            participant.eventum = self.eventum
+            participant.user = self.user
+            self._participant = participant
+
+    @property
+    def participant(self):
+        """Participant пользователя в eventum или None."""
+        self._load()
+        return self._participant
+
+    @property
+    def is_organizer(self):
+        self._load()
+        return self._is_organizer
+
+    @property
+    def role(self):
+        """'organizer', 'participant' или None (как get_user_role_in_eventum)."""
+        if self.is_organizer:
+            return 'organizer'
+        if self.participant is not None:
+            return 'participant'
+        return None
+
+
+def get_viewer_context(request, eventum):
+    """ViewerContext текущего пользователя, общий для всего запроса."""
+    viewer = getattr(request, '_viewer_context', None)
+    if viewer is None or viewer.eventum.pk != eventum.pk:
+        viewer = ViewerContext(request.user, eventum)
+        request._viewer_context = viewer
+    return viewer
+
+
 def require_authentication(view_func):
     """
     Декоратор для проверки аутентификации пользователя.
@@ -127,7 +208,7 @@ def require_eventum_role(required_roles):
             
             try:
                 eventum = get_eventum_from_request(request, view, kwargs)
-                user_role = get_user_role_in_eventum(request.user, eventum)
+                user_role = get_viewer_context(request, eventum).role
                 
                 if user_role not in required_roles:
                     return Response(
@@ -161,11 +242,15 @@ class EventumMixin:
             self._cached_eventum = get_eventum_from_request(self.request, self)
         return self._cached_eventum
     
+    def get_viewer(self):
+        """ViewerContext текущего пользователя в eventum"""
+        return get_viewer_context(self.request, self.get_eventum())
+    
     def get_user_role(self):
         """Получить роль текущего пользователя в eventum"""
         if not hasattr(self, '_cached_user_role'):
             eventum = self.get_eventum()
-            self._cached_user_role = get_user_role_in_eventum(self.request.user, eventum)
+            self._cached_user_role = self.get_viewer().role
         return self._cached_user_role
     
     def is_organizer(self):
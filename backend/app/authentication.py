@@ -1,67 +1,83 @@
-from rest_framework.authentication import BaseAuthentication
-from rest_framework_simplejwt.tokens import AccessToken
-from django.contrib.auth import get_user_model
-from django.contrib.auth.models import AnonymousUser
 import logging
 
+from django.core.exceptions import ValidationError
+from rest_framework.authentication import BaseAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .caching import get_user_row
+
 logger = logging.getLogger(__name__)
 
+def get_tokens_for_user(user):
+    """RefreshToken пользователя (в access token - только его ID)."""
+    return RefreshToken.for_user(user)
+
+
+def get_token_user(access_token):
+    """
+    Пользователь из проверенного access token без запроса к БД.
+
+    Из токена берется только ID: остальные поля в нем устарели бы на срок
+    жизни токена. Если строка пользователя уже есть в кэше процесса,
+    пользователь собирается из нее целиком; иначе поля загружаются при первом
+    обращении (см. TokenUser).
+    """
+    from .models import TokenUser
+
+    # simplejwt хранит ID пользователя в токене строкой
+    user_id = TokenUser._meta.pk.to_python(access_token[api_settings.USER_ID_CLAIM])
+    return TokenUser.from_row(get_user_row(user_id, load=False) or {'id': user_id})
+
+
 class QueryTokenAuthentication(BaseAuthentication):
     """
     Кастомная аутентификация для Django REST Framework через:
     - Authorization header (Bearer token) - приоритет для wildcard доменов
     - Query параметры (access_token, token)
     - POST данные (access_token, token)
+
+    Невалидный токен из заголовка отклоняется сразу (401), как это делал
+    JWTAuthentication; невалидный токен из параметров игнорируется.
     """
-    
-    def authenticate(self, request):
-        # Получаем токен из различных источников
-        token = None
-        
+
+    def get_token(self, request):
+        """Возвращает (token, из заголовка ли он) или (None, False)."""
         # 1. Из заголовка Authorization (приоритет для wildcard доменов)
         auth_header = request.META.get('HTTP_AUTHORIZATION', '')
         if auth_header.startswith('Bearer '):
-            token = auth_header[7:]  # Убираем 'Bearer '
-            logger.info(f"QueryTokenAuthentication: Token found in Authorization header")
-        
-        # 2. Из query параметра 'access_token'
-        elif 'access_token' in request.GET:
-            token = request.GET['access_token']
-            logger.info(f"QueryTokenAuthentication: Token found in access_token query parameter")
-        
-        # 3. Из query параметра 'token' (альтернатива)
-        elif 'token' in request.GET:
-            token = request.GET['token']
-            logger.info(f"QueryTokenAuthentication: Token found in token query parameter")
-        
-        # 4. Из POST данных (для POST запросов)
-        elif request.method == 'POST' and hasattr(request, 'data'):
-            if 'access_token' in request.data:
-                token = request.data['access_token']
-                logger.info(f"QueryTokenAuthentication: Token found in POST data access_token")
-            elif 'token' in request.data:
-                token = request.data['token']
-                logger.info(f"QueryTokenAuthentication: Token found in POST data token")
-        
+            return auth_header[7:], True  # Убираем 'Bearer '
+
+        # 2. Из query параметра 'access_token' или 'token' (альтернатива)
+        for param in ('access_token', 'token'):
+            if param in request.GET:
+                return request.GET[param], False
+
+        # 3. Из POST данных (для POST запросов)
+        if request.method == 'POST' and hasattr(request, 'data'):
+            for param in ('access_token', 'token'):
+                if param in request.data:
+                    return request.data[param], False
+
+        return None, False
+
+    def authenticate(self, request):
+        token, from_header = self.get_token(request)
         if not token:
-            logger.info("QueryTokenAuthentication: No token found")
             return None
-        
+
         try:
-            # Валидируем JWT токен
+            # Валидируем JWT токен (подпись, срок действия, тип)
             access_token = AccessToken(token)
-            user_id = access_token['user_id']
-            
-            # Получаем пользователя
-            User = get_user_model()
-            user = User.objects.get(id=user_id)
-            
-            logger.info(f"QueryTokenAuthentication: User authenticated: {user.name} (ID: {user.id})")
-            return (user, token)
-            
-        except Exception as e:
-            logger.error(f"QueryTokenAuthentication: Token validation error: {e}")
+            user = get_token_user(access_token)
+        except (TokenError, KeyError, ValidationError) as e:
+            logger.debug(f"QueryTokenAuthentication: Token validation error: {e}")
+            if from_header:
+                raise InvalidToken(str(e))
             return None
-    
+
+        return (user, token)
+
     def authenticate_header(self, request):
         return 'Bearer'
@@ -35,14 +35,11 @@ class EventumScopedViewSet(EventumMixin, viewsets.ModelViewSet):
         request = self.request
         participant = None
         participant_id = None
+        viewer = self.get_viewer() if request else None
         
-        # ЗАГРУЖАЕМ participant заранее, если пользователь аутентифицирован
-        if request and request.user.is_authenticated:
-            try:
-                from .models import Participant
-                participant = Participant.objects.select_related('user', 'eventum').get(user=request.user, eventum=eventum)
-            except Participant.DoesNotExist:
-                participant = None
+        # Участник текущего пользователя (из ViewerContext, без отдельного запроса)
+        if viewer is not None:
+            participant = viewer.participant
         
         # Проверяем query-параметр для просмотра от лица другого участника
         participant_param = request.query_params.get('participant') if request else None
@@ -52,20 +49,14 @@ class EventumScopedViewSet(EventumMixin, viewsets.ModelViewSet):
             except (TypeError, ValueError):
                 participant_id = None
             
-            if participant_id:
-                # Разрешаем указывать participant только организаторам данного eventum
-                from .models import Participant, UserRole
-                is_organizer = UserRole.objects.filter(
-                    user=request.user, 
-                    eventum=eventum, 
-                    role='organizer'
-                ).exists()
-                if is_organizer:
-                    try:
-                        participant = Participant.objects.select_related('user', 'eventum').get(id=participant_id, eventum=eventum)
-                    except Participant.DoesNotExist:
-                        # Игнорируем неверный participant_id
-                        pass
+            # Разрешаем указывать participant только организаторам данного eventum
+            if participant_id and viewer.is_organizer:
+                from .models import Participant
+                try:
+                    participant = Participant.objects.select_related('user', 'eventum').get(id=participant_id, eventum=eventum)
+                except Participant.DoesNotExist:
+                    # Игнорируем неверный participant_id
+                    pass
         
         return participant, participant_id
     
@@ -74,6 +65,7 @@ class EventumScopedViewSet(EventumMixin, viewsets.ModelViewSet):
         context = super().get_serializer_context()
         eventum = self.get_eventum()
         context['eventum'] = eventum
+        context['viewer'] = self.get_viewer()
         context['user_role'] = self.get_user_role()
         
         # Получаем participant для контекста
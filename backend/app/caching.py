@@ -0,0 +1,286 @@
+"""
+Версии данных eventum для инвалидации кэшей.
+
+Кэшированные представления (календари, индексы расписания) строятся по ключу,
+включающему версию данных eventum. Версии хранятся в строке Eventum в БД,
+поэтому изменение, сделанное в одном воркере, сразу видно всем остальным.
+
+Строки Eventum по slug кэшируются в памяти процесса и, если настроен общий
+для воркеров кэш (Redis, Memcached и т.п.), в нем. Запись в памяти процесса
+используется не дольше EVENTUM_LOCAL_CACHE_TIMEOUT секунд, после чего
+перечитывается из общего кэша (его инвалидирует воркер, изменивший eventum)
+или из БД, поэтому изменения флагов и версий eventum видны всем воркерам не
+позже чем через это время. Локальный кэш процесса (LocMemCache, используется
+по умолчанию) общим не считается: удаление из него в одном воркере не видно
+остальным. Так же кэшируется членство пользователя в eventum (организатор,
+участник) для проверок прав, а в памяти процесса - строки пользователей,
+загруженные при аутентификации.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+# Сколько строк Eventum держать в памяти процесса
+EVENTUM_CACHE_SIZE = 256
+
+# Сколько записей о членстве пользователей держать в памяти процесса
+MEMBERSHIP_CACHE_SIZE = 4096
+
+_eventums = OrderedDict()  # {slug: (строка Eventum, время загрузки)}
+_eventums_lock = threading.Lock()
+
+_memberships = OrderedDict()  # {(user_id, eventum_id): (членство, время загрузки)}
+_memberships_lock = threading.Lock()
+
+# Сколько строк пользователей держать в памяти процесса
+USER_CACHE_SIZE = 1024
+
+_users = OrderedDict()  # {user_id: (строка UserProfile, время загрузки)}
+_users_lock = threading.Lock()
+
+# Счетчики попаданий и промахов кэшей этого процесса
+_stats = {'eventums': Counter(), 'memberships': Counter(), 'users': Counter()}
+
+# Бэкенды кэша, которые не разделяются между воркерами
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def has_shared_cache():
+    """Разделяет ли кэш по умолчанию данные между воркерами (и их инвалидацию)."""
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+def bump_eventum_versions(eventum_id, schedule=False, membership=False):
+    """
+    Увеличивает версии данных eventum после фиксации текущей транзакции.
+
+    Args:
+        eventum_id: ID eventum
+        schedule: Изменились мероприятия, локации или теги
+        membership: Изменились участники, группы или регистрации
+    """
+    if not eventum_id or not (schedule or membership):
+        return
+
+    def apply():
+        from .models import Eventum
+
+        updates = {'changed_at': timezone.now()}
+        if schedule:
+            updates['schedule_version'] = F('schedule_version') + 1
+        if membership:
+            updates['membership_version'] = F('membership_version') + 1
+        Eventum.objects.filter(pk=eventum_id).update(**updates)
+        invalidate_cached_eventum(eventum_id)
+
+    transaction.on_commit(apply)
+
+
+def get_eventum_version_key(eventum):
+    """Строка версии данных eventum для ключей кэша и ETag."""
+    return f"{eventum.schedule_version}.{eventum.membership_version}"
+
+
+def _get_slug_cache_key(slug):
+    return f"eventum:slug:{slug}"
+
+
+def _get_id_cache_key(eventum_id):
+    return f"eventum:slug-of:{eventum_id}"
+
+
+def get_eventum_by_slug(slug):
+    """
+    Eventum по slug из памяти процесса, общего кэша или БД.
+
+    Каждый вызов возвращает новый объект, собранный из закэшированной строки,
+    так что изменения объекта в одном запросе не видны другим.
+
+    Returns:
+        Eventum или None, если eventum не найден
+    """
+    from .models import Eventum
+
+    now = time.monotonic()
+    row = None
+    with _eventums_lock:
+        entry = _eventums.get(slug)
+        if entry is not None and now - entry[1] < getattr(settings, 'EVENTUM_LOCAL_CACHE_TIMEOUT', 5):
+            _eventums.move_to_end(slug)
+            row = entry[0]
+            _stats['eventums']['hits'] += 1
+
+    if row is None:
+        shared = has_shared_cache()
+        row = cache.get(_get_slug_cache_key(slug)) if shared else None
+        _stats['eventums']['shared_hits' if row is not None else 'misses'] += 1
+        if row is None:
+            fields = [field.attname for field in Eventum._meta.concrete_fields]
+            row = Eventum.objects.filter(slug=slug).values(*fields).first()
+            if row is None:
+                return None
+            if shared:
+                timeout = getattr(settings, 'EVENTUM_CACHE_TIMEOUT', 5 * 60)
+                cache.set_many({
+                    _get_slug_cache_key(slug): row,
+                    _get_id_cache_key(row['id']): slug,
+                }, timeout)
+        with _eventums_lock:
+            _eventums[slug] = (row, now)
+            _eventums.move_to_end(slug)
+            while len(_eventums) > EVENTUM_CACHE_SIZE:
+                _eventums.popitem(last=False)
+
+    return Eventum.from_db(Eventum.objects.db, list(row), list(row.values()))
+
+
+def invalidate_cached_eventum(eventum_id, slug=None):
+    """
+    Удаляет строку Eventum из памяти процесса и общего кэша.
+
+    Прежний slug переименованного eventum находится по записям в памяти
+    процесса и по ключу eventum:slug-of:{id} общего кэша.
+    """
+    slugs = {slug} if slug else set()
+    with _eventums_lock:
+        for cached_slug, (row, _) in list(_eventums.items()):
+            if row['id'] == eventum_id or cached_slug in slugs:
+                del _eventums[cached_slug]
+                slugs.add(cached_slug)
+        _stats['eventums']['invalidations'] += 1
+
+    if not has_shared_cache():
+        return
+    shared_slug = cache.get(_get_id_cache_key(eventum_id))
+    if shared_slug:
+        slugs.add(shared_slug)
+    cache.delete_many([_get_slug_cache_key(item) for item in slugs] + [_get_id_cache_key(eventum_id)])
+
+
+def _get_membership_cache_key(user_id, eventum_id):
+    return f"membership:{user_id}:{eventum_id}"
+
+
+def get_user_membership(user_id, eventum_id, load):
+    """
+    Членство пользователя в eventum из памяти процесса, общего кэша или БД.
+
+    Запись в памяти процесса используется не дольше MEMBERSHIP_LOCAL_CACHE_TIMEOUT
+    секунд, поэтому отзыв роли виден всем воркерам не позже чем через это время.
+    Общий кэш используется только если он действительно общий для воркеров
+    (см. has_shared_cache): иначе отозванная роль оставалась бы в кэше других
+    воркеров до MEMBERSHIP_CACHE_TIMEOUT.
+
+    Args:
+        load: Функция без аргументов, загружающая членство из БД
+
+    Returns:
+        tuple: (is_organizer, participant_id, participant_name)
+    """
+    key = (user_id, eventum_id)
+    now = time.monotonic()
+    with _memberships_lock:
+        entry = _memberships.get(key)
+        if entry is not None and now - entry[1] < getattr(settings, 'MEMBERSHIP_LOCAL_CACHE_TIMEOUT', 5):
+            _memberships.move_to_end(key)
+            _stats['memberships']['hits'] += 1
+            return entry[0]
+
+    shared = has_shared_cache()
+    cache_key = _get_membership_cache_key(user_id, eventum_id)
+    membership = cache.get(cache_key) if shared else None
+    _stats['memberships']['shared_hits' if membership is not None else 'misses'] += 1
+    if membership is None:
+        membership = tuple(load())
+        if shared:
+            cache.set(cache_key, membership, getattr(settings, 'MEMBERSHIP_CACHE_TIMEOUT', 5 * 60))
+
+    with _memberships_lock:
+        _memberships[key] = (membership, now)
+        _memberships.move_to_end(key)
+        while len(_memberships) > MEMBERSHIP_CACHE_SIZE:
+            _memberships.popitem(last=False)
+    return membership
+
+
+def invalidate_user_membership(user_id, eventum_id):
+    """Удаляет членство пользователя в eventum из памяти процесса и общего кэша."""
+    if not user_id or not eventum_id:
+        return
+    with _memberships_lock:
+        _memberships.pop((user_id, eventum_id), None)
+        _stats['memberships']['invalidations'] += 1
+    if has_shared_cache():
+        cache.delete(_get_membership_cache_key(user_id, eventum_id))
+
+
+def invalidate_eventum_memberships(eventum_id):
+    """Удаляет из памяти процесса членство всех пользователей в eventum."""
+    with _memberships_lock:
+        for key in [key for key in _memberships if key[1] == eventum_id]:
+            del _memberships[key]
+
+
+def get_user_row(user_id, load=True):
+    """
+    Строка UserProfile (все поля) из памяти процесса или БД.
+
+    Запись используется не дольше USER_CACHE_TIMEOUT секунд: изменения профиля
+    в других воркерах видны не позже чем через это время.
+
+    Args:
+        load: Загрузить строку из БД при промахе
+
+    Returns:
+        dict или None, если пользователь не найден (или load=False и строки нет в памяти)
+    """
+    from .models import UserProfile
+
+    now = time.monotonic()
+    with _users_lock:
+        entry = _users.get(user_id)
+        if entry is not None and now - entry[1] < getattr(settings, 'USER_CACHE_TIMEOUT', 60):
+            _users.move_to_end(user_id)
+            _stats['users']['hits'] += 1
+            return entry[0]
+    if not load:
+        return None
+
+    _stats['users']['misses'] += 1
+    fields = [field.attname for field in UserProfile._meta.concrete_fields]
+    row = UserProfile.objects.filter(pk=user_id).values(*fields).first()
+    if row is None:
+        return None
+    with _users_lock:
+        _users[user_id] = (row, now)
+        _users.move_to_end(user_id)
+        while len(_users) > USER_CACHE_SIZE:
+            _users.popitem(last=False)
+    return row
+
+
+def invalidate_user_row(user_id):
+    """Удаляет строку пользователя из памяти процесса."""
+    with _users_lock:
+        _users.pop(user_id, None)
+        _stats['users']['invalidations'] += 1
+
+
+def get_cache_stats():
+    """Счетчики и размеры кэшей eventum, членства и пользователей в памяти этого процесса."""
+    with _eventums_lock:
+        eventums = dict(_stats['eventums'], size=len(_eventums))
+    with _memberships_lock:
+        memberships = dict(_stats['memberships'], size=len(_memberships))
+    with _users_lock:
+        users = dict(_stats['users'], size=len(_users))
+    return {'eventums': eventums, 'memberships': memberships, 'users': users}
@@ -0,0 +1,291 @@
+"""
+Массовая выгрузка календарей всех участников eventum.
+
+Все данные из БД собираются в основном процессе один раз: граф групп,
+блоки VEVENT мероприятий и состав групп мероприятий. Рендеринг календарей
+распределяется по пулу процессов, которые работают только с простыми
+структурами данных и не обращаются к БД. Готовые календари по мере
+поступления пишутся в ZIP-архив или в каталог.
+
+Задачи выгрузки через API хранятся в CALENDAR_EXPORT_ROOT/<eventum_id>/ парами
+<job_id>.json (статус) и <job_id>.zip (архив). Запуск задач сериализуется
+файловой блокировкой: на eventum выполняется не больше одной задачи, всего -
+не больше CALENDAR_EXPORT_MAX_JOBS, а старые выгрузки удаляются через
+CALENDAR_EXPORT_TTL.
+"""
+import contextlib
+import json
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - нет на Windows
+    resource = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - нет на Windows
+    fcntl = None
+
+from django.db import connections
+
+from .ics import assemble_calendar, get_event_fragment_map, render_calendar_header
+from .utils import EventumGroupGraph
+
+# Данные, переданные в процесс пула через initializer
+_worker_data = None
+
+
+def collect_export_data(eventum):
+    """
+    Собирает данные для рендеринга календарей всех участников.
+
+    Returns:
+        dict: Только простые типы, пригодные для передачи в процессы пула
+    """
+    from .models import Event
+
+    group_graph = EventumGroupGraph(eventum)
+    events = list(
+        Event.objects.filter(eventum=eventum).order_by('start_time', 'id').values_list('id', 'event_group_id')
+    )
+    event_ids = [event_id for event_id, _ in events]
+    fragments = get_event_fragment_map(eventum, event_ids)
+    group_members = {
+        event_group_id: frozenset(group_graph.get_participant_ids(event_group_id))
+        for event_group_id in {event_group_id for _, event_group_id in events if event_group_id}
+    }
+    participants = sorted(
+        ((participant.id, participant.name) for participant in group_graph.participants_map.values()),
+        key=lambda item: item[0]
+    )
+
+    return {
+        'eventum_slug': eventum.slug,
+        'eventum_name': eventum.name,
+        'events': events,
+        'fragments': fragments,
+        'group_members': group_members,
+        'participants': participants,
+    }
+
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+
+def _render_chunk(participants):
+    """Рендерит календари пачки участников: [(имя файла, тело календаря)]."""
+    data = _worker_data
+    result = []
+    for participant_id, participant_name in participants:
+        header = render_calendar_header(
+            f"{data['eventum_name']} - {participant_name}",
+            f'Календарь мероприятий для участника {participant_name}'
+        )
+        fragments = [
+            data['fragments'][event_id]
+            for event_id, event_group_id in data['events']
+            if event_id in data['fragments']
+            and (event_group_id is None or participant_id in data['group_members'][event_group_id])
+        ]
+        filename = f"eventum-{data['eventum_slug']}-{participant_id}.ics"
+        result.append((filename, assemble_calendar(header, fragments)))
+    return result
+
+
+def _get_peak_memory_kb():
+    """Пиковое потребление памяти основным процессом и процессами пула (КБ)."""
+    if resource is None:
+        return None
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+
+
+def export_calendars(eventum, output_path, output_format='zip', workers=None, chunk_size=200):
+    """
+    Выгружает календари всех участников eventum.
+
+    Args:
+        eventum: Объект Eventum
+        output_path: Путь к ZIP-архиву или каталогу
+        output_format: 'zip' или 'dir'
+        workers: Количество процессов пула (1 - рендеринг в текущем процессе)
+        chunk_size: Количество участников в одной задаче пула
+
+    Returns:
+        dict: Статистика выгрузки
+    """
+    if output_format not in ('zip', 'dir'):
+        raise ValueError(f"Unknown output format: {output_format}")
+
+    started = time.perf_counter()
+    data = collect_export_data(eventum)
+    participants = data['participants']
+    chunks = [participants[i:i + chunk_size] for i in range(0, len(participants), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+
+    if output_format == 'zip':
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        archive = zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED)
+    else:
+        os.makedirs(output_path, exist_ok=True)
+        archive = None
+
+    def write(filename, body):
+        if archive is not None:
+            archive.writestr(filename, body)
+        else:
+            with open(os.path.join(output_path, filename), 'wb') as file:
+                file.write(body)
+
+    files_count = 0
+    bytes_count = 0
+    try:
+        if workers == 1 or len(chunks) <= 1:
+            _init_worker(data)
+            results = map(_render_chunk, chunks)
+            executor = None
+        else:
+            # Соединения с БД не должны наследоваться процессами пула
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data,))
+            results = executor.map(_render_chunk, chunks)
+
+        try:
+            for rendered in results:
+                for filename, body in rendered:
+                    write(filename, body)
+                    files_count += 1
+                    bytes_count += len(body)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+    finally:
+        if archive is not None:
+            archive.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        'participants_count': files_count,
+        'events_count': len(data['events']),
+        'bytes': bytes_count,
+        'elapsed_seconds': round(elapsed, 3),
+        'calendars_per_second': round(files_count / elapsed, 1) if elapsed else None,
+        'peak_memory_kb': _get_peak_memory_kb(),
+        'workers': 1 if executor is None else workers,
+    }
+
+
+def get_export_dir(eventum):
+    """Каталог выгрузок eventum."""
+    from django.conf import settings
+
+    return os.path.join(settings.CALENDAR_EXPORT_ROOT, str(eventum.id))
+
+
+def get_export_paths(eventum, job_id):
+    """Пути к архиву и файлу статуса задачи выгрузки."""
+    export_dir = get_export_dir(eventum)
+    return os.path.join(export_dir, f"{job_id}.zip"), os.path.join(export_dir, f"{job_id}.json")
+
+
+def write_export_status(status_path, **status):
+    """Атомарно записывает статус задачи выгрузки."""
+    os.makedirs(os.path.dirname(status_path), exist_ok=True)
+    tmp_path = f"{status_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(status, file, ensure_ascii=False)
+    os.replace(tmp_path, status_path)
+
+
+def read_export_status(status_path):
+    """Статус задачи выгрузки или None, если задачи нет."""
+    try:
+        with open(status_path, encoding='utf-8') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+@contextlib.contextmanager
+def export_lock():
+    """Блокировка запуска выгрузок, общая для всех процессов сервера."""
+    from django.conf import settings
+
+    os.makedirs(settings.CALENDAR_EXPORT_ROOT, exist_ok=True)
+    with open(os.path.join(settings.CALENDAR_EXPORT_ROOT, '.lock'), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _iter_export_jobs():
+    """(eventum_id, job_id, status_path, статус, возраст в секундах) всех задач выгрузки."""
+    from django.conf import settings
+
+    root = settings.CALENDAR_EXPORT_ROOT
+    now = time.time()
+    try:
+        eventum_dirs = os.listdir(root)
+    except FileNotFoundError:
+        return
+    for eventum_dir in eventum_dirs:
+        export_dir = os.path.join(root, eventum_dir)
+        if not os.path.isdir(export_dir):
+            continue
+        for filename in os.listdir(export_dir):
+            job_id, ext = os.path.splitext(filename)
+            if ext != '.json':
+                continue
+            status_path = os.path.join(export_dir, filename)
+            try:
+                age = now - os.path.getmtime(status_path)
+            except FileNotFoundError:
+                continue
+            yield eventum_dir, job_id, status_path, read_export_status(status_path), age
+
+
+def _is_active(export_status, age):
+    """
+    Выполняется ли задача: статус pending/running, обновленный не раньше
+    CALENDAR_EXPORT_TIMEOUT (задача упавшего процесса перестает считаться активной).
+    """
+    from django.conf import settings
+
+    return (
+        export_status is not None
+        and export_status.get('status') in ('pending', 'running')
+        and age < settings.CALENDAR_EXPORT_TIMEOUT
+    )
+
+
+def get_active_exports():
+    """{eventum_id: job_id} выполняющихся задач выгрузки."""
+    return {
+        eventum_dir: job_id
+        for eventum_dir, job_id, _, export_status, age in _iter_export_jobs()
+        if _is_active(export_status, age)
+    }
+
+
+def cleanup_exports():
+    """Удаляет статусы и архивы невыполняющихся задач старше CALENDAR_EXPORT_TTL."""
+    from django.conf import settings
+
+    for _, _, status_path, export_status, age in _iter_export_jobs():
+        if age < settings.CALENDAR_EXPORT_TTL or _is_active(export_status, age):
+            continue
+        for path in (status_path, f"{os.path.splitext(status_path)[0]}.zip"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
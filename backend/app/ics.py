@@ -0,0 +1,263 @@
+"""
+Генерация календарей iCalendar для участников eventum.
+
+Тело календаря зависит только от данных eventum, поэтому кэшируется по ключу
+(eventum, участник, версия данных) и отдается с ETag/Last-Modified. Временные
+метки внутри VEVENT берутся из реального времени изменения мероприятий, так что
+при неизменных данных тело календаря байт-в-байт одинаковое.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.http import quote_etag
+from icalendar import Calendar, Event as ICalEvent
+
+from .agenda import get_agenda_index
+from .caching import get_eventum_version_key
+from .locations import get_event_location_ids, get_location_index
+
+# Рекомендуемый клиентам интервал обновления календаря
+REFRESH_INTERVAL_MINUTES = 5
+
+
+def build_event_component(event, eventum, location_description=None):
+    """Создает VEVENT для мероприятия (location_description - из LocationIndex.describe)."""
+    ical_event = ICalEvent()
+
+    # Уникальный ID события
+    ical_event.add('uid', f'event-{event.id}-{eventum.slug}@eventum.local')
+    ical_event.add('summary', event.name)
+
+    # Описание мероприятия
+    description_parts = []
+    if event.description:
+        description_parts.append(event.description)
+    if location_description:
+        description_parts.append(location_description)
+    if description_parts:
+        ical_event.add('description', '\n'.join(description_parts))
+
+    ical_event.add('dtstart', event.start_time)
+    ical_event.add('dtend', event.end_time)
+
+    # Временные метки берутся из реальных изменений мероприятия,
+    # чтобы тело календаря не менялось без изменения данных
+    ical_event.add('dtstamp', event.updated_at)
+    ical_event.add('created', event.created_at)
+    ical_event.add('last-modified', event.updated_at)
+
+    ical_event.add('status', 'CONFIRMED')
+    return ical_event
+
+
+def build_calendar(name, description):
+    """Создает пустой календарь с общими свойствами."""
+    cal = Calendar()
+    cal.add('prodid', '-//Eventum//Eventum Calendar//RU')
+    cal.add('version', '2.0')
+    cal.add('calscale', 'GREGORIAN')
+    cal.add('method', 'PUBLISH')
+    cal.add('X-WR-CALNAME', name)
+    cal.add('X-WR-CALDESC', description)
+
+    # Формат: PT{minutes}M означает "Period Time {minutes} Minutes"
+    cal.add('REFRESH-INTERVAL', f'PT{REFRESH_INTERVAL_MINUTES}M')
+    # X-PUBLISHED-TTL - нестандартное свойство, но лучше поддерживается macOS Calendar
+    cal.add('X-PUBLISHED-TTL', f'PT{REFRESH_INTERVAL_MINUTES}M')
+    return cal
+
+
+CALENDAR_FOOTER = b'END:VCALENDAR\r\n'
+
+
+def render_calendar_header(name, description):
+    """Начало календаря (свойства VCALENDAR) без завершающей строки END:VCALENDAR."""
+    body = build_calendar(name, description).to_ical()
+    return body[:-len(CALENDAR_FOOTER)]
+
+
+def render_event_fragment(event, eventum, location_description=None):
+    """Готовый текст блока VEVENT мероприятия."""
+    return build_event_component(event, eventum, location_description).to_ical()
+
+
+def assemble_calendar(header, fragments):
+    """Собирает календарь из заголовка и готовых блоков VEVENT."""
+    return b''.join([header, *fragments, CALENDAR_FOOTER])
+
+
+def _get_fragment_cache_key(eventum, event_id, stamp):
+    # Время изменения мероприятия обновляется и при изменении его локаций и тегов,
+    # поэтому изменение одного мероприятия инвалидирует только его блок;
+    # slug eventum входит в UID блока
+    return f"ics:vevent:{eventum.id}:{eventum.slug}:{event_id}:{stamp}"
+
+
+def get_event_stamps(eventum):
+    """
+    Времена изменения мероприятий eventum из кэша (по версии расписания) или БД.
+
+    Returns:
+        dict: {event_id: str}
+    """
+    from .models import Event
+
+    cache_key = f"ics:stamps:{eventum.id}:{eventum.schedule_version}"
+    stamps = cache.get(cache_key)
+    if stamps is None:
+        stamps = {
+            event_id: updated_at.isoformat()
+            for event_id, updated_at in Event.objects.filter(eventum=eventum).values_list('id', 'updated_at')
+        }
+        cache.set(cache_key, stamps, getattr(settings, 'ICS_CACHE_TIMEOUT', 60 * 60))
+    return stamps
+
+
+def render_event_fragments(eventum, event_ids=None):
+    """
+    Рендерит блоки VEVENT мероприятий eventum (всех или event_ids).
+
+    Returns:
+        dict: {event_id: bytes}
+    """
+    from .models import Event
+
+    location_index = get_location_index(eventum)
+    event_location_ids = get_event_location_ids(eventum)
+    events = Event.objects.filter(eventum=eventum).only(
+        'id', 'name', 'description', 'start_time', 'end_time', 'created_at', 'updated_at'
+    )
+    if event_ids is not None:
+        events = events.filter(id__in=event_ids)
+    return {
+        event.id: render_event_fragment(
+            event, eventum, location_index.describe(event_location_ids.get(event.id, ()))
+        )
+        for event in events
+    }
+
+
+def get_event_fragment_map(eventum, event_ids):
+    """
+    Блоки VEVENT мероприятий event_ids: {event_id: bytes}.
+
+    Блоки общие для всех участников eventum и кэшируются по мероприятию и
+    времени его изменения: рендерятся заново только блоки, которых нет в кэше.
+    """
+    stamps = get_event_stamps(eventum)
+    keys = {
+        event_id: _get_fragment_cache_key(eventum, event_id, stamps[event_id])
+        for event_id in event_ids if event_id in stamps
+    }
+    cached = cache.get_many(list(keys.values()))
+
+    missing_ids = [event_id for event_id, key in keys.items() if key not in cached]
+    if missing_ids:
+        rendered = render_event_fragments(eventum, missing_ids)
+        to_cache = {keys[event_id]: fragment for event_id, fragment in rendered.items()}
+        cache.set_many(to_cache, getattr(settings, 'ICS_CACHE_TIMEOUT', 60 * 60))
+        cached.update(to_cache)
+
+    return {event_id: cached[key] for event_id, key in keys.items() if key in cached}
+
+
+def get_event_fragments(eventum, event_ids):
+    """Блоки VEVENT для мероприятий в порядке event_ids (см. get_event_fragment_map)."""
+    fragments = get_event_fragment_map(eventum, event_ids)
+    return [fragments[event_id] for event_id in event_ids if event_id in fragments]
+
+
+def get_participant_event_ids(eventum, participant_id):
+    """
+    ID мероприятий участника в порядке начала из индекса мероприятий участников:
+    мероприятия без event_group видны всем участникам, остальные - только
+    участникам группы (та же логика, что в EventSerializer.get_is_participant).
+    """
+    return get_agenda_index(eventum).schedule_event_ids(participant_id)
+
+
+def render_participant_calendar(eventum, participant):
+    """Генерирует тело календаря участника из кэшированных блоков VEVENT."""
+    header = render_calendar_header(
+        f'{eventum.name} - {participant.name}',
+        f'Календарь мероприятий для участника {participant.name}'
+    )
+    event_ids = get_participant_event_ids(eventum, participant.id)
+    return assemble_calendar(header, get_event_fragments(eventum, event_ids))
+
+
+# Количество мероприятий в одной порции потоковой выдачи
+FEED_CHUNK_SIZE = 500
+
+
+def get_feed_event_ids(eventum, tag_id=None, location_ids=None):
+    """
+    ID мероприятий публичной ленты в порядке начала, без загрузки объектов в память.
+
+    Args:
+        tag_id: Только мероприятия с тегом
+        location_ids: Только мероприятия в этих локациях (например, поддерево из LocationIndex)
+    """
+    from .models import Event
+
+    events = Event.objects.filter(eventum=eventum)
+    if tag_id is not None:
+        events = events.filter(tags__id=tag_id)
+    if location_ids is not None:
+        events = events.filter(locations__id__in=location_ids)
+    if tag_id is not None or location_ids is not None:
+        events = events.distinct()
+    return events.order_by('start_time', 'id').values_list('id', flat=True).iterator(chunk_size=FEED_CHUNK_SIZE)
+
+
+def iter_feed_calendar(eventum, name, description, event_ids):
+    """
+    Потоковая генерация календаря: заголовок, блоки VEVENT порциями и завершение.
+
+    Args:
+        event_ids: Итератор ID мероприятий в нужном порядке
+    """
+    yield render_calendar_header(name, description)
+
+    chunk = []
+    for event_id in event_ids:
+        chunk.append(event_id)
+        if len(chunk) >= FEED_CHUNK_SIZE:
+            yield b''.join(get_event_fragments(eventum, chunk))
+            chunk = []
+    if chunk:
+        yield b''.join(get_event_fragments(eventum, chunk))
+
+    yield CALENDAR_FOOTER
+
+
+def get_calendar_validators(eventum, *parts):
+    """
+    ETag и Last-Modified (timestamp) для календаря.
+
+    ETag строится из версии данных eventum и дополнительных частей ключа,
+    Last-Modified - из времени последнего изменения данных eventum.
+    """
+    etag = quote_etag('-'.join(['ics', str(eventum.id), *map(str, parts), get_eventum_version_key(eventum)]))
+    last_modified = None
+    changed_at = eventum.changed_at
+    if changed_at:
+        if timezone.is_naive(changed_at):
+            changed_at = timezone.make_aware(changed_at)
+        last_modified = int(changed_at.timestamp())
+    return etag, last_modified
+
+
+def get_participant_calendar(eventum, participant):
+    """
+    Тело календаря участника из кэша (по версии данных eventum) или сгенерированное заново.
+
+    Returns:
+        bytes: Тело календаря
+    """
+    cache_key = f"ics:participant:{eventum.id}:{participant.id}:{get_eventum_version_key(eventum)}"
+    body = cache.get(cache_key)
+    if body is None:
+        body = render_participant_calendar(eventum, participant)
+        cache.set(cache_key, body, getattr(settings, 'ICS_CACHE_TIMEOUT', 60 * 60))
+    return body
@@ -0,0 +1,254 @@
+"""
+Индекс иерархии локаций eventum.
+
+Все локации eventum загружаются одним запросом в виде плоских строк, после
+чего упорядоченные списки детей, цепочки предков, полные пути и эффективные
+адреса вычисляются в памяти и запоминаются. Индекс кэшируется по версии
+расписания eventum, которая меняется при любом изменении локаций, и служит
+общей моделью для всех endpoints локаций.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+# Поля локации, хранящиеся в индексе
+LOCATION_FIELDS = ('id', 'parent_id', 'name', 'slug', 'kind', 'address', 'floor', 'notes')
+
+
+class LocationIndex:
+    """Плоская карта, дети, цепочки предков, полные пути и адреса локаций одного eventum."""
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows: iterable словарей с полями LOCATION_FIELDS
+        """
+        self.nodes = {}
+        self.parents = {}
+        self.names = {}
+        self.addresses = {}
+        for row in sorted(rows, key=lambda item: item['id']):
+            location_id = row['id']
+            self.nodes[location_id] = row
+            self.parents[location_id] = row['parent_id']
+            self.names[location_id] = row['name']
+            self.addresses[location_id] = row['address']
+
+        # Дети в порядке названия (без учета регистра); None - корневые локации
+        self.children = {}
+        for location_id, parent_id in self.parents.items():
+            self.children.setdefault(parent_id, []).append(location_id)
+        for location_ids in self.children.values():
+            location_ids.sort(key=lambda item: self.names[item].lower())
+
+        self._ancestors = {}
+        self._descendants = None
+        self._effective_addresses = {}
+        self._descriptions = {}
+
+    @classmethod
+    def build(cls, eventum):
+        """Строит индекс одним запросом к БД."""
+        from .models import Location
+
+        rows = Location.objects.filter(eventum=eventum).values(*LOCATION_FIELDS)
+        return cls(rows)
+
+    def __contains__(self, location_id):
+        return location_id in self.parents
+
+    def ancestors(self, location_id):
+        """ID локаций от корня до location_id включительно."""
+        if location_id not in self._ancestors:
+            chain = []
+            visited = set()
+            current = location_id
+            # Защита от циклов в некорректных данных
+            while current is not None and current in self.parents and current not in visited:
+                visited.add(current)
+                chain.append(current)
+                current = self.parents[current]
+            self._ancestors[location_id] = tuple(reversed(chain))
+        return self._ancestors[location_id]
+
+    def full_path(self, location_id):
+        """Полный путь локации от корня, например "Корпус 1, Аудитория 101"."""
+        return ', '.join(self.names[item] for item in self.ancestors(location_id))
+
+    def descendants(self, location_id):
+        """
+        ID локации и всех ее потомков.
+
+        Индекс потомков строится один раз для всех локаций по цепочкам предков:
+        каждая локация добавляется в множества всех своих предков.
+        """
+        if self._descendants is None:
+            descendants = {item: {item} for item in self.parents}
+            for item in self.parents:
+                for ancestor in self.ancestors(item)[:-1]:
+                    descendants[ancestor].add(item)
+            self._descendants = {item: frozenset(members) for item, members in descendants.items()}
+        return self._descendants.get(location_id, frozenset())
+
+    def effective_address(self, location_id):
+        """Адрес локации или ближайшего предка с адресом."""
+        if location_id not in self._effective_addresses:
+            address = None
+            for item in reversed(self.ancestors(location_id)):
+                if self.addresses[item]:
+                    address = self.addresses[item]
+                    break
+            self._effective_addresses[location_id] = address
+        return self._effective_addresses[location_id]
+
+    def describe(self, location_ids):
+        """
+        Строка с описанием мест проведения мероприятия или None.
+
+        Общая часть путей всех локаций выносится в начало строки вместе с общим
+        адресом, у отдельных локаций остается только их собственная часть пути.
+        Результат запоминается для каждого набора локаций.
+
+        Args:
+            location_ids: tuple ID локаций мероприятия
+        """
+        location_ids = tuple(item for item in location_ids if item in self.parents)
+        if location_ids not in self._descriptions:
+            self._descriptions[location_ids] = self._describe(location_ids)
+        return self._descriptions[location_ids]
+
+    def _describe(self, location_ids):
+        if not location_ids:
+            return None
+
+        if len(location_ids) == 1:
+            location_id = location_ids[0]
+            address = self.effective_address(location_id)
+            path = self.full_path(location_id)
+            return f"Место: {path} ({address})" if address else f"Место: {path}"
+
+        # Общий префикс - общие предки всех локаций (по ID, а не по строкам)
+        chains = [self.ancestors(location_id) for location_id in location_ids]
+        common_length = 0
+        for items in zip(*chains):
+            if any(item != items[0] for item in items):
+                break
+            common_length += 1
+        common_chain = chains[0][:common_length]
+        common_prefix = ', '.join(self.names[item] for item in common_chain)
+
+        # Общий адрес: одинаковый у всех локаций или адрес общего предка,
+        # если он сам является одной из локаций мероприятия
+        addresses = [self.effective_address(location_id) for location_id in location_ids]
+        common_address = addresses[0] if addresses[0] and all(item == addresses[0] for item in addresses) else None
+        if not common_address and common_chain and common_chain[-1] in location_ids:
+            common_address = self.effective_address(common_chain[-1])
+
+        location_paths = []
+        for location_id, chain, address in zip(location_ids, chains, addresses):
+            remaining = ', '.join(self.names[item] for item in chain[common_length:])
+            path_to_show = remaining or self.names[location_id]
+            if address and address != common_address:
+                location_paths.append(f"{path_to_show} ({address})")
+            else:
+                location_paths.append(path_to_show)
+
+        prefix_parts = []
+        if common_prefix:
+            prefix_parts.append(common_prefix)
+        if common_address:
+            prefix_parts.append(f"({common_address})")
+        if prefix_parts:
+            location_paths.insert(0, ' '.join(prefix_parts))
+
+        return f"Место: {'; '.join(location_paths)}"
+
+    def serialize(self, location_id, flat=False):
+        """
+        Представление локации для API (те же поля, что у LocationSerializer).
+
+        Args:
+            flat: Вместо вложенных детей вернуть parent_id и children_ids
+        """
+        node = self.nodes[location_id]
+        parent_id = node['parent_id']
+        parent = self.nodes.get(parent_id)
+        data = {
+            'id': location_id,
+            'name': node['name'],
+            'slug': node['slug'],
+            'kind': node['kind'],
+            'address': node['address'],
+            'floor': node['floor'],
+            'notes': node['notes'],
+        }
+        if flat:
+            data['parent_id'] = parent_id
+            data['children_ids'] = list(self.children.get(location_id, []))
+        else:
+            data['parent'] = {
+                'id': parent['id'],
+                'name': parent['name'],
+                'slug': parent['slug'],
+                'kind': parent['kind'],
+            } if parent else None
+            data['children'] = [self.serialize(child_id) for child_id in self.children.get(location_id, [])]
+        data['full_path'] = self.full_path(location_id)
+        data['effective_address'] = self.effective_address(location_id)
+        return data
+
+    def serialize_many(self, location_ids, flat=False):
+        return [self.serialize(location_id, flat=flat) for location_id in location_ids]
+
+    def walk(self, root_ids):
+        """ID локаций поддеревьев root_ids в порядке обхода в глубину (без рекурсии)."""
+        result = []
+        stack = list(reversed(root_ids))
+        while stack:
+            location_id = stack.pop()
+            result.append(location_id)
+            stack.extend(reversed(self.children.get(location_id, [])))
+        return result
+
+
+def get_location_index(eventum):
+    """Индекс локаций eventum из кэша (по версии расписания) или построенный заново."""
+    cache_key = f"locations:model:{eventum.id}:{eventum.schedule_version}"
+    index = cache.get(cache_key)
+    if index is None:
+        index = LocationIndex.build(eventum)
+        cache.set(cache_key, index, getattr(settings, 'ICS_CACHE_TIMEOUT', 60 * 60))
+    return index
+
+
+def get_event_location_ids(eventum):
+    """
+    Локации мероприятий eventum одним запросом к промежуточной таблице.
+
+    Returns:
+        dict: {event_id: tuple(location_id)} в порядке добавления локаций
+    """
+    from .models import Event
+
+    result = {}
+    rows = Event.locations.through.objects.filter(
+        event__eventum=eventum
+    ).order_by('id').values_list('event_id', 'location_id')
+    for event_id, location_id in rows:
+        result.setdefault(event_id, []).append(location_id)
+    return {event_id: tuple(location_ids) for event_id, location_ids in result.items()}
+
+
+def get_location_payload(eventum, name, build):
+    """
+    Готовое представление локаций для API из кэша (по версии расписания).
+
+    Args:
+        name: Часть ключа кэша, описывающая представление
+        build: Функция LocationIndex -> данные ответа; вызывается только при промахе кэша
+    """
+    cache_key = f"locations:payload:{eventum.id}:{eventum.schedule_version}:{name}"
+    data = cache.get(cache_key)
+    if data is None:
+        data = build(get_location_index(eventum))
+        cache.set(cache_key, data, getattr(settings, 'ICS_CACHE_TIMEOUT', 60 * 60))
+    return data
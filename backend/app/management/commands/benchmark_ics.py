@@ -0,0 +1,108 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.ics import (
+    assemble_calendar,
+    build_calendar,
+    build_event_component,
+    render_calendar_header,
+    render_event_fragment,
+)
+from app.locations import get_event_location_ids, get_location_index
+from app.models import Event, Eventum
+from app.utils import EventumGroupGraph
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает стоимость генерации календарей участников: полный рендер "
+        "через icalendar для каждого мероприятия и склейку готовых блоков VEVENT"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('eventum_slug', help="Slug eventum")
+        parser.add_argument('--participants', type=int, default=100, help="Сколько участников использовать")
+        parser.add_argument('--repeat', type=int, default=3, help="Количество повторов каждого замера")
+
+    def handle(self, *args, **options):
+        try:
+            eventum = Eventum.objects.get(slug=options['eventum_slug'])
+        except Eventum.DoesNotExist:
+            raise CommandError(f"Eventum '{options['eventum_slug']}' не найден")
+
+        group_graph = EventumGroupGraph(eventum)
+        participants = sorted(group_graph.participants_map.values(), key=lambda p: p.id)[:options['participants']]
+        if not participants:
+            raise CommandError("В eventum нет участников")
+
+        events = list(Event.objects.filter(eventum=eventum).order_by('start_time', 'id'))
+        events_by_id = {event.id: event for event in events}
+        location_index = get_location_index(eventum)
+        event_location_ids = get_event_location_ids(eventum)
+        descriptions = {
+            event.id: location_index.describe(event_location_ids.get(event.id, ()))
+            for event in events
+        }
+
+        # Состав мероприятий участников считается заранее, чтобы сравнивать только рендер
+        feeds = []
+        for participant in participants:
+            event_ids = [
+                event.id for event in events
+                if event.event_group_id is None or group_graph.has_participant(event.event_group_id, participant.id)
+            ]
+            feeds.append((participant, event_ids))
+        total_events = sum(len(event_ids) for _, event_ids in feeds)
+
+        def render_full():
+            bodies = []
+            for participant, event_ids in feeds:
+                cal = build_calendar(
+                    f'{eventum.name} - {participant.name}',
+                    f'Календарь мероприятий для участника {participant.name}'
+                )
+                for event_id in event_ids:
+                    cal.add_component(build_event_component(events_by_id[event_id], eventum, descriptions[event_id]))
+                bodies.append(cal.to_ical())
+            return bodies
+
+        def render_fragments():
+            return {event.id: render_event_fragment(event, eventum, descriptions[event.id]) for event in events}
+
+        def render_joined(fragments):
+            bodies = []
+            for participant, event_ids in feeds:
+                header = render_calendar_header(
+                    f'{eventum.name} - {participant.name}',
+                    f'Календарь мероприятий для участника {participant.name}'
+                )
+                bodies.append(assemble_calendar(header, [fragments[event_id] for event_id in event_ids]))
+            return bodies
+
+        def measure(func, *func_args):
+            best = None
+            result = None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                result = func(*func_args)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            return best, result
+
+        full_time, full_bodies = measure(render_full)
+        fragments_time, fragments = measure(render_fragments)
+        joined_time, joined_bodies = measure(render_joined, fragments)
+
+        if full_bodies != joined_bodies:
+            raise CommandError("Склеенные календари отличаются от полного рендера")
+
+        feeds_count = len(feeds)
+        self.stdout.write(f"Eventum: {eventum.slug}, мероприятий: {len(events)}, календарей: {feeds_count}, "
+                          f"мероприятий в календаре в среднем: {total_events / feeds_count:.1f}")
+        self.stdout.write(f"Полный рендер:        {full_time * 1000 / feeds_count:.3f} мс/календарь, "
+                          f"{full_time * 1000 / max(total_events, 1):.3f} мс/мероприятие")
+        self.stdout.write(f"Рендер блоков VEVENT: {fragments_time * 1000:.3f} мс на eventum (один раз на версию расписания)")
+        self.stdout.write(f"Склейка блоков:       {joined_time * 1000 / feeds_count:.3f} мс/календарь")
+        if joined_time:
+            self.stdout.write(self.style.SUCCESS(f"Ускорение: x{full_time / joined_time:.1f}"))
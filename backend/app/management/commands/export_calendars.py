@@ -0,0 +1,55 @@
+import traceback
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.calendar_export import export_calendars, write_export_status
+from app.models import Eventum
+
+
+class Command(BaseCommand):
+    help = "Выгружает календари всех участников eventum в ZIP-архив или каталог"
+
+    def add_arguments(self, parser):
+        parser.add_argument('eventum_slug', help="Slug eventum")
+        parser.add_argument('--output', required=True, help="Путь к ZIP-архиву или каталогу")
+        parser.add_argument('--format', choices=['zip', 'dir'], default='zip', help="Формат выгрузки")
+        parser.add_argument('--workers', type=int, default=None, help="Количество процессов (по умолчанию - число CPU)")
+        parser.add_argument('--chunk-size', type=int, default=200, help="Участников в одной задаче процесса")
+        parser.add_argument('--status-file', default=None, help="JSON-файл для статуса выгрузки (используется API)")
+
+    def handle(self, *args, **options):
+        status_file = options['status_file']
+
+        try:
+            eventum = Eventum.objects.get(slug=options['eventum_slug'])
+        except Eventum.DoesNotExist:
+            if status_file:
+                write_export_status(status_file, status='failed', error='Eventum not found')
+            raise CommandError(f"Eventum '{options['eventum_slug']}' не найден")
+
+        if status_file:
+            write_export_status(status_file, status='running')
+
+        try:
+            stats = export_calendars(
+                eventum,
+                options['output'],
+                output_format=options['format'],
+                workers=options['workers'],
+                chunk_size=options['chunk_size'],
+            )
+        except Exception as exc:
+            if status_file:
+                write_export_status(status_file, status='failed', error=str(exc))
+            self.stderr.write(traceback.format_exc())
+            raise CommandError(f"Ошибка выгрузки: {exc}")
+
+        if status_file:
+            write_export_status(status_file, status='done', **stats)
+
+        peak_memory = f"{stats['peak_memory_kb'] / 1024:.1f} МБ" if stats['peak_memory_kb'] is not None else "н/д"
+        self.stdout.write(self.style.SUCCESS(
+            f"Выгружено календарей: {stats['participants_count']} ({stats['bytes']} байт) "
+            f"за {stats['elapsed_seconds']} с, {stats['calendars_per_second']} календарей/с, "
+            f"процессов: {stats['workers']}, пиковая память: {peak_memory}"
+        ))
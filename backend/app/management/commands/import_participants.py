@@ -0,0 +1,44 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import Eventum
+from app.participant_import import IMPORT_FORMATS, ParticipantImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = "Импортирует участников eventum из CSV или JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument('eventum_slug', help="Slug eventum")
+        parser.add_argument('path', help="Путь к CSV (с заголовком name,vk_id) или JSONL файлу")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, default=None, help="Формат файла (по умолчанию - по расширению)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Строк в одной пачке вставки")
+        parser.add_argument('--dry-run', action='store_true', help="Только проверить строки, ничего не сохранять")
+
+    def handle(self, *args, **options):
+        try:
+            eventum = Eventum.objects.get(slug=options['eventum_slug'])
+        except Eventum.DoesNotExist:
+            raise CommandError(f"Eventum '{options['eventum_slug']}' не найден")
+
+        input_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if input_format not in IMPORT_FORMATS:
+            raise CommandError(f"Неизвестный формат файла: {input_format}")
+
+        importer = ParticipantImporter(eventum, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        with open(options['path'], encoding='utf-8-sig', newline='') as file:
+            for progress in importer.run(read_rows(file, input_format)):
+                if not progress.get('done'):
+                    self.stdout.write(
+                        f"Обработано строк: {progress['processed']} ({progress['rows_per_second']} строк/с)"
+                    )
+
+        for error in progress['error_details']:
+            self.stderr.write(f"Строка {error['row']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Проверено' if progress['dry_run'] else 'Импортировано'} строк: {progress['processed']} "
+            f"за {progress['elapsed_seconds']} с ({progress['rows_per_second']} строк/с): "
+            f"создано {progress['created']}, обновлено {progress['updated']}, "
+            f"без изменений {progress['unchanged']}, ошибок {progress['errors']}"
+        ))
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0036_rename_event_group_v2_column'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventum',
+            name='forbid_overlapping_registrations',
+            field=models.BooleanField(default=False, help_text='Запрещать участникам записываться на пересекающиеся по времени мероприятия'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0037_add_forbid_overlapping_registrations_to_eventum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventum',
+            name='schedule_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Версия расписания: мероприятия, локации, теги'),
+        ),
+        migrations.AddField(
+            model_name='eventum',
+            name='membership_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Версия состава: участники, группы, регистрации'),
+        ),
+        migrations.AddField(
+            model_name='eventum',
+            name='changed_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Время последнего изменения расписания или состава', null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
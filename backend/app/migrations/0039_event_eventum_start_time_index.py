@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0038_eventum_versions_event_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['eventum', 'start_time'], name='app_event_eventum_a7e245_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+def fill_location_paths(apps, schema_editor):
+    Location = apps.get_model('app', 'Location')
+    parents = dict(Location.objects.values_list('id', 'parent_id'))
+    paths = {}
+
+    def build_path(location_id):
+        # Итеративно поднимаемся до корня или до уже вычисленного предка
+        chain = []
+        current = location_id
+        while current is not None and current not in paths and current not in chain:
+            chain.append(current)
+            current = parents.get(current)
+        prefix = paths.get(current, '/')
+        for item in reversed(chain):
+            prefix = f"{prefix}{item}/"
+            paths[item] = prefix
+        return paths[location_id]
+
+    locations = list(Location.objects.only('id', 'path'))
+    for location in locations:
+        location.path = build_path(location.id)
+    Location.objects.bulk_update(locations, ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0039_event_eventum_start_time_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=500),
+        ),
+        migrations.RunPython(fill_location_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0040_location_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventum',
+            name='forbid_location_double_booking',
+            field=models.BooleanField(default=False, help_text='Запрещать пересекающиеся по времени мероприятия в одной локации'),
+        ),
+    ]
@@ -1,10 +1,19 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models.signals import post_save, m2m_changed, post_delete
+from django.db import models, transaction
+from django.db.models import CharField, Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import post_save, m2m_changed, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 
+from .caching import (
+    bump_eventum_versions,
+    invalidate_cached_eventum,
+    invalidate_eventum_memberships,
+    invalidate_user_membership,
+    invalidate_user_row,
+)
 from .utils import generate_unique_slug
 
 class Eventum(models.Model):
@@ -23,6 +32,33 @@ class Eventum(models.Model):
         default=True,
         help_text="Отображать ли вкладку расписания участникам"
     )
+    forbid_overlapping_registrations = models.BooleanField(
+        default=False,
+        help_text="Запрещать участникам записываться на пересекающиеся по времени мероприятия"
+    )
+    forbid_location_double_booking = models.BooleanField(
+        default=False,
+        help_text="Запрещать пересекающиеся по времени мероприятия в одной локации"
+    )
+    # Версии данных для кэшей (календари, индексы); меняются только через bump_eventum_versions
+    schedule_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Версия расписания: мероприятия, локации, теги"
+    )
+    membership_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Версия состава: участники, группы, регистрации"
+    )
+    changed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Время последнего изменения расписания или состава"
+    )
+
+    VERSION_FIELDS = ('schedule_version', 'membership_version', 'changed_at')
 
     def save(self, *args, **kwargs):
         # Если slug не предоставлен, генерируем его из названия
@@ -31,6 +67,12 @@ class Eventum(models.Model):
         # Если slug предоставлен, но уже существует, делаем его уникальным
         elif Eventum.objects.exclude(pk=self.pk).filter(slug=self.slug).exists():
             self.slug = generate_unique_slug(self, self.slug)
+        # Не перезаписываем версии устаревшими значениями из загруженного объекта
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in self.VERSION_FIELDS
+            ]
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -53,6 +95,7 @@ class Participant(models.Model):
             models.Index(fields=['eventum']),  # Для фильтрации по eventum
             models.Index(fields=['user']),     # Для поиска по пользователю
             models.Index(fields=['name']),     # Для поиска по имени
+            models.Index(fields=['eventum', 'name', 'id']),  # Для keyset-пагинации списка
         ]
     
     def clean(self):
@@ -609,6 +652,13 @@ class Event(models.Model):
         related_name='linked_event',
         help_text="Опциональная связь 1:1 с группой"
     )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['eventum', 'start_time']),
+        ]
     
     def save(self, *args, **kwargs):
         # Валидация происходит в сериализаторе
@@ -721,6 +771,40 @@ class UserProfile(AbstractUser):
         return f"{self.name} (VK: {self.vk_id})"
 
 
+class TokenUser(UserProfile):
+    """
+    Пользователь, восстановленный из JWT без запроса к БД.
+
+    Из токена известен только id, остальные поля отложены и при первом
+    обращении к любому из них загружаются все вместе - из кэша строк
+    пользователей процесса или одним запросом. Если пользователь удален,
+    обращение завершается AuthenticationFailed (401), а не ошибкой сервера.
+    """
+
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_row(cls, row):
+        """Пользователь из словаря {attname: значение}; отсутствующие поля откладываются."""
+        fields = [field.attname for field in cls._meta.concrete_fields if field.attname in row]
+        return cls.from_db(cls.objects.db, fields, [row[field] for field in fields])
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        deferred = self.get_deferred_fields()
+        if fields is None or from_queryset is not None or not deferred or not set(fields) <= deferred:
+            return super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
+        from rest_framework.exceptions import AuthenticationFailed
+        from .caching import get_user_row
+
+        row = get_user_row(self.pk)
+        if row is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        for attname in deferred:
+            setattr(self, attname, row[attname])
+
+
 class Location(models.Model):
     """Локации для проведения мероприятий"""
     class Kind(models.TextChoices):
@@ -741,6 +825,8 @@ class Location(models.Model):
     address = models.CharField(max_length=300, blank=True)
     floor = models.CharField(max_length=20, blank=True)
     notes = models.TextField(blank=True)
+    # Материализованный путь от корня: "/<id корня>/.../<id>/"
+    path = models.CharField(max_length=500, blank=True, default='', editable=False, db_index=True)
     
     class Meta:
         unique_together = ('eventum', 'slug')
@@ -752,7 +838,64 @@ class Location(models.Model):
             base_value = self.name if not self.slug else self.slug
             self.slug = generate_unique_slug(self, base_value, scope_fields=['eventum'])
         self.full_clean()
-        super().save(*args, **kwargs)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'path'}
+
+        with transaction.atomic():
+            if self.pk is None:
+                super().save(*args, **kwargs)
+                self.path = f"{self._get_parent_path()}{self.pk}/"
+                Location.objects.filter(pk=self.pk).update(path=self.path)
+            else:
+                # Путь потомков обновляется до сохранения, чтобы обработчики
+                # post_save уже видели поддерево на новом месте
+                self._update_path()
+                super().save(*args, **kwargs)
+
+    def _get_parent_path(self):
+        """Путь родительской локации из БД ("/" для корневой локации)."""
+        if not self.parent_id:
+            return '/'
+        return Location.objects.filter(pk=self.parent_id).values_list('path', flat=True).first() or '/'
+
+    def _update_path(self):
+        """Вычисляет путь сохраненной локации и переносит поддерево одним UPDATE."""
+        stored = Location.objects.filter(pk=self.pk).values_list('path', 'parent_id').first()
+        if stored and stored[0] and stored[1] == self.parent_id:
+            self.path = stored[0]
+            return
+
+        self.path = f"{self._get_parent_path()}{self.pk}/"
+        old_path = stored[0] if stored else None
+        if old_path and old_path != self.path:
+            Location.objects.filter(
+                eventum_id=self.eventum_id,
+                path__startswith=old_path
+            ).exclude(pk=self.pk).update(
+                path=Concat(Value(self.path), Substr('path', len(old_path) + 1), output_field=CharField())
+            )
+
+    @property
+    def ancestor_ids(self):
+        """ID предков от корня до родителя (по материализованному пути)."""
+        return [int(item) for item in self.path.strip('/').split('/') if item][:-1]
+
+    def get_ancestors(self):
+        """Предки от корня до родителя одним запросом."""
+        if not hasattr(self, '_ancestors_cache'):
+            ancestor_ids = self.ancestor_ids
+            ancestors = Location.objects.in_bulk(ancestor_ids) if ancestor_ids else {}
+            self._ancestors_cache = [ancestors[item] for item in ancestor_ids if item in ancestors]
+        return self._ancestors_cache
+
+    def get_descendants(self):
+        """Все потомки локации (queryset по префиксу пути)."""
+        return Location.objects.filter(
+            eventum_id=self.eventum_id,
+            path__startswith=self.path
+        ).exclude(pk=self.pk)
     
     def clean(self):
         # Проверяем, что родительская локация принадлежит тому же eventum
@@ -785,17 +928,13 @@ class Location(models.Model):
             self._check_for_cycles()
     
     def _check_for_cycles(self):
-        """Проверяет, не создается ли цикл в иерархии локаций"""
-        visited = set()
-        current = self.parent
-        
-        while current:
-            if current.id in visited:
-                raise ValidationError("Обнаружен цикл в иерархии локаций")
-            if current.id == self.id:
-                raise ValidationError("Локация не может быть родителем самой себе")
-            visited.add(current.id)
-            current = current.parent
+        """Проверяет, не создается ли цикл в иерархии локаций (по пути родителя)"""
+        if self.pk is None:
+            return
+        if self.parent_id == self.pk:
+            raise ValidationError("Локация не может быть родителем самой себе")
+        if f"/{self.pk}/" in self._get_parent_path():
+            raise ValidationError("Обнаружен цикл в иерархии локаций")
     
     def __str__(self):
         return f"{self.name} ({self.eventum.name})"
@@ -1028,3 +1167,167 @@ def validate_event_tags(sender, instance, action, pk_set, **kwargs):
     pass
 
 
+
+
+# Инвалидация версий данных eventum (кэши календарей и индексов расписания)
+
+def _related_eventum_id(instance, relation_name):
+    """eventum_id связанного объекта без лишнего запроса, если объект уже загружен."""
+    field = instance._meta.get_field(relation_name)
+    if field.is_cached(instance):
+        related = getattr(instance, relation_name)
+        return related.eventum_id if related is not None else None
+    related_id = getattr(instance, field.attname)
+    if related_id is None:
+        return None
+    return field.related_model.objects.filter(pk=related_id).values_list('eventum_id', flat=True).first()
+
+
+@receiver(post_save, sender=Eventum)
+def bump_versions_on_eventum_change(sender, instance, created, **kwargs):
+    if not created:
+        bump_eventum_versions(instance.id, schedule=True)
+
+
+@receiver(post_save, sender=Eventum)
+@receiver(post_delete, sender=Eventum)
+def invalidate_eventum_cache(sender, instance, **kwargs):
+    # Сразу и после фиксации: иначе параллельный запрос может успеть
+    # закэшировать строку, прочитанную до фиксации транзакции
+    eventum_id, slug = instance.id, instance.slug
+    invalidate_cached_eventum(eventum_id, slug)
+    transaction.on_commit(lambda: invalidate_cached_eventum(eventum_id, slug))
+    if kwargs.get('created') or kwargs.get('signal') is post_delete:
+        # ID удаленного eventum может достаться новому (например, в SQLite) -
+        # членство с этим ID в памяти процесса больше не относится к нему
+        invalidate_eventum_memberships(eventum_id)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender=TokenUser)
+@receiver(post_delete, sender=TokenUser)
+def invalidate_user_cache(sender, instance, **kwargs):
+    invalidate_user_row(instance.pk)
+
+
+@receiver(pre_save, sender=UserRole)
+@receiver(pre_save, sender=Participant)
+def remember_previous_membership(sender, instance, update_fields=None, **kwargs):
+    """Запоминает прежних пользователя и eventum записи: их членство тоже нужно сбросить."""
+    instance._previous_membership = None
+    if instance.pk is None or (update_fields is not None and not {'user', 'eventum'} & set(update_fields)):
+        return
+    instance._previous_membership = sender.objects.filter(pk=instance.pk).values_list('user_id', 'eventum_id').first()
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+def invalidate_membership_cache(sender, instance, **kwargs):
+    # Членство и нового, и прежнего пользователя (участника могли перепривязать
+    # к другому пользователю или отвязать); как и для Eventum - сразу и после
+    # фиксации транзакции
+    memberships = {(instance.user_id, instance.eventum_id)}
+    previous = getattr(instance, '_previous_membership', None)
+    if previous:
+        memberships.add(previous)
+
+    def invalidate():
+        for user_id, eventum_id in memberships:
+            invalidate_user_membership(user_id, eventum_id)
+
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=EventTag)
+@receiver(post_delete, sender=EventTag)
+def bump_schedule_version(sender, instance, **kwargs):
+    bump_eventum_versions(instance.eventum_id, schedule=True)
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def bump_schedule_version_on_location_change(sender, instance, **kwargs):
+    if kwargs.get('signal') is post_save and not kwargs.get('created') and instance.path:
+        # Описание места входит в текст мероприятия - обновляем время изменения
+        # мероприятий в локации и во всем ее поддереве (путь потомков тоже мог измениться)
+        Event.objects.filter(
+            locations__path__startswith=instance.path
+        ).update(updated_at=timezone.now())
+    bump_eventum_versions(instance.eventum_id, schedule=True)
+
+
+@receiver(pre_delete, sender=Location)
+def touch_events_on_location_delete(sender, instance, **kwargs):
+    # Связи с мероприятиями удаляются каскадно без m2m_changed, а описание
+    # места входит в текст мероприятия
+    if instance.path:
+        Event.objects.filter(
+            locations__path__startswith=instance.path
+        ).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Event.locations.through)
+@receiver(m2m_changed, sender=Event.tags.through)
+def bump_schedule_version_on_event_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    event_ids = pk_set if reverse else {instance.pk}
+    if event_ids:
+        Event.objects.filter(pk__in=event_ids).update(updated_at=timezone.now())
+    bump_eventum_versions(instance.eventum_id, schedule=True)
+
+
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+@receiver(post_save, sender=ParticipantGroup)
+@receiver(post_delete, sender=ParticipantGroup)
+def bump_membership_version(sender, instance, **kwargs):
+    bump_eventum_versions(instance.eventum_id, membership=True)
+
+
+@receiver(post_save, sender=ParticipantGroupParticipantRelation)
+@receiver(post_delete, sender=ParticipantGroupParticipantRelation)
+@receiver(post_save, sender=ParticipantGroupGroupRelation)
+@receiver(post_delete, sender=ParticipantGroupGroupRelation)
+def bump_membership_version_on_group_relation(sender, instance, **kwargs):
+    bump_eventum_versions(_related_eventum_id(instance, 'group'), membership=True)
+
+
+@receiver(post_save, sender=EventRegistration)
+@receiver(post_delete, sender=EventRegistration)
+def bump_membership_version_on_registration(sender, instance, **kwargs):
+    bump_eventum_versions(_related_eventum_id(instance, 'event'), membership=True)
+
+
+@receiver(post_save, sender=EventWave)
+@receiver(post_delete, sender=EventWave)
+def bump_membership_version_on_wave_change(sender, instance, **kwargs):
+    bump_eventum_versions(instance.eventum_id, membership=True)
+
+
+@receiver(m2m_changed, sender=EventWave.registrations.through)
+def bump_membership_version_on_wave_registrations(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance - регистрация, ее eventum берется через мероприятие
+        bump_eventum_versions(_related_eventum_id(instance, 'event'), membership=True)
+    else:
+        bump_eventum_versions(instance.eventum_id, membership=True)
+
+
+@receiver(m2m_changed, sender=EventRegistration.applicants.through)
+def bump_membership_version_on_applicants(sender, instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        eventum_id = instance.eventum_id
+    else:
+        eventum_id = _related_eventum_id(instance, 'event')
+    bump_eventum_versions(eventum_id, membership=True)
@@ -0,0 +1,137 @@
+"""
+"Сейчас и далее" для экранов на площадке.
+
+Мероприятия eventum хранятся в памяти процесса как IntervalIndex,
+отсортированный по началу, и пересобираются только при смене версии
+расписания. Текущие мероприятия находятся бинарным поиском по началу и
+префиксному максимуму концов, ближайшие - бинарным поиском первого
+мероприятия после текущего момента. Готовые ответы дополнительно
+кэшируются на несколько секунд, поэтому частые опросы с экранов почти не
+доходят до БД.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .locations import get_location_index
+from .schedule import IntervalIndex
+
+# Сколько снимков расписания держать в памяти процесса
+SNAPSHOT_CACHE_SIZE = 32
+
+_snapshots = OrderedDict()
+_snapshots_lock = threading.Lock()
+
+
+class ScheduleSnapshot:
+    """Неизменяемый снимок мероприятий eventum для быстрых запросов по времени."""
+
+    def __init__(self, rows, event_location_ids):
+        """
+        Args:
+            rows: iterable (event_id, name, start, end)
+            event_location_ids: {event_id: tuple(location_id)}
+        """
+        self.index = IntervalIndex(
+            (start, end, (event_id, name, event_location_ids.get(event_id, ())))
+            for event_id, name, start, end in rows
+        )
+
+    @classmethod
+    def build(cls, eventum):
+        from .locations import get_event_location_ids
+        from .models import Event
+
+        rows = Event.objects.filter(eventum=eventum).values_list('id', 'name', 'start_time', 'end_time')
+        return cls(rows, get_event_location_ids(eventum))
+
+    def now_next(self, moment, location_ids=None, limit=3):
+        """
+        Текущие и ближайшие мероприятия.
+
+        Args:
+            moment: Момент времени
+            location_ids: Множество локаций (поддерево) или None для всего eventum
+            limit: Сколько ближайших мероприятий вернуть
+
+        Returns:
+            tuple: (текущие, ближайшие) - списки кортежей (start, end, (event_id, name, location_ids))
+        """
+        def matches(item):
+            return location_ids is None or any(location_id in location_ids for location_id in item[2][2])
+
+        current = [item for item in self.index.active_at(moment) if matches(item)]
+        upcoming = []
+        for item in self.index.starting_after(moment):
+            if len(upcoming) >= limit:
+                break
+            if matches(item):
+                upcoming.append(item)
+        return current, upcoming
+
+
+def get_schedule_snapshot(eventum):
+    """Снимок расписания eventum из памяти процесса (по версии расписания)."""
+    key = (eventum.id, eventum.schedule_version)
+    with _snapshots_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is not None:
+            _snapshots.move_to_end(key)
+            return snapshot
+
+    snapshot = ScheduleSnapshot.build(eventum)
+    with _snapshots_lock:
+        # Снимки прежних версий этого eventum больше не нужны
+        for stale_key in [item for item in _snapshots if item[0] == eventum.id]:
+            del _snapshots[stale_key]
+        _snapshots[key] = snapshot
+        while len(_snapshots) > SNAPSHOT_CACHE_SIZE:
+            _snapshots.popitem(last=False)
+    return snapshot
+
+
+def _serialize(item):
+    start, end, (event_id, name, location_ids) = item
+    return {
+        'id': event_id,
+        'name': name,
+        'start_time': start.isoformat(),
+        'end_time': end.isoformat(),
+        'location_ids': list(location_ids),
+    }
+
+
+def get_now_next(eventum, location_id=None, limit=3):
+    """
+    Ответ "сейчас и далее" с коротким кэшированием.
+
+    Ключ кэша включает версию расписания, поэтому изменения расписания
+    видны сразу, а время жизни ограничивает запаздывание "текущего" момента.
+
+    Returns:
+        dict или None, если локация не найдена в eventum
+    """
+    cache_key = f"now-next:{eventum.id}:{eventum.schedule_version}:{location_id or 0}:{limit}"
+    data = cache.get(cache_key)
+    if data is not None:
+        return data
+
+    location_ids = None
+    if location_id is not None:
+        location_index = get_location_index(eventum)
+        if location_id not in location_index:
+            return None
+        location_ids = location_index.descendants(location_id)
+
+    moment = timezone.now()
+    current, upcoming = get_schedule_snapshot(eventum).now_next(moment, location_ids=location_ids, limit=limit)
+    data = {
+        'generated_at': moment.isoformat(),
+        'now': [_serialize(item) for item in current],
+        'next': [_serialize(item) for item in upcoming],
+    }
+    cache.set(cache_key, data, getattr(settings, 'NOW_NEXT_CACHE_TIMEOUT', 15))
+    return data
@@ -0,0 +1,246 @@
+"""
+Индекс занятости локаций eventum.
+
+Для каждой локации хранятся отсортированные интервалы занятости
+(IntervalIndex) с учетом всех ее потомков: здание занято, если занята
+хотя бы одна его аудитория. Проверка "свободна ли локация в [start, end)"
+выполняется бинарным поиском по интервалам локации.
+
+Индекс хранится в памяти процесса и обновляется инкрементально: при смене
+версии расписания загружаются только мероприятия, измененные после
+последнего обновления (по Event.updated_at), и список ID для поиска удаленных.
+Если изменилась сама иерархия локаций, индекс строится заново.
+
+Индекс, отданный вызывающему коду, не изменяется: обновление строит новый
+индекс (копируя только затронутые IntervalIndex) и подменяет его в кэше, поэтому
+потоки читают индекс без блокировок. Обновление одного eventum выполняется под
+его собственной блокировкой и не задерживает запросы к другим eventum.
+"""
+import threading
+from collections import OrderedDict
+
+from .locations import get_location_index
+from .schedule import IntervalIndex
+
+# Сколько индексов eventum держать в памяти процесса
+OCCUPANCY_CACHE_SIZE = 32
+
+_occupancy_cache = OrderedDict()  # {eventum_id: {'version', 'watermark', 'index'}}
+_occupancy_lock = threading.Lock()
+_eventum_locks = {}  # {eventum_id: Lock} - обновление индекса одного eventum
+
+
+class OccupancyIndex:
+    """Интервалы занятости локаций, агрегированные вверх по иерархии."""
+
+    def __init__(self, location_index, rows=()):
+        """
+        Args:
+            location_index: LocationIndex eventum
+            rows: iterable (event_id, event_name, start, end, location_id) - строки связи мероприятие-локация
+        """
+        self.location_index = location_index
+        self.events = {}  # {event_id: (name, start, end, tuple(location_id))}
+        self.direct = {}  # {location_id: IntervalIndex} - мероприятия непосредственно в локации
+        self.subtree = {}  # {location_id: IntervalIndex} - мероприятия в локации и ее потомках
+
+        events = {}
+        for event_id, name, start, end, location_id in rows:
+            entry = events.setdefault(event_id, (name, start, end, []))
+            entry[3].append(location_id)
+
+        direct = {}
+        subtree = {}
+        for event_id, (name, start, end, location_ids) in events.items():
+            self.events[event_id] = (name, start, end, tuple(location_ids))
+            for location_id in self._known(location_ids):
+                direct.setdefault(location_id, []).append((start, end, event_id))
+            for location_id in self._covered(location_ids):
+                subtree.setdefault(location_id, []).append((start, end, event_id))
+
+        self.direct = {location_id: IntervalIndex(items) for location_id, items in direct.items()}
+        self.subtree = {location_id: IntervalIndex(items) for location_id, items in subtree.items()}
+
+    @classmethod
+    def build(cls, eventum, location_index=None):
+        """Строит индекс одним запросом к промежуточной таблице мероприятие-локация."""
+        if location_index is None:
+            location_index = get_location_index(eventum)
+        return cls(location_index, _load_rows(eventum=eventum))
+
+    def _known(self, location_ids):
+        return [location_id for location_id in location_ids if location_id in self.location_index]
+
+    def _covered(self, location_ids):
+        """Локации мероприятия и все их предки (каждая один раз)."""
+        covered = set()
+        for location_id in self._known(location_ids):
+            covered.update(self.location_index.ancestors(location_id))
+        return covered
+
+    def _writable(self, attr, location_id):
+        """IntervalIndex локации из self.<attr>, который можно изменять: общий с исходным индексом копируется."""
+        intervals = getattr(self, attr)
+        if (attr, location_id) not in self._copied:
+            self._copied.add((attr, location_id))
+            source = intervals.get(location_id)
+            intervals[location_id] = source.copy() if source is not None else IntervalIndex()
+        return intervals[location_id]
+
+    def _remove_event(self, event_id):
+        entry = self.events.pop(event_id, None)
+        if entry is None:
+            return
+        location_ids = entry[3]
+        for location_id in self._known(location_ids):
+            self._writable('direct', location_id).remove(event_id)
+        for location_id in self._covered(location_ids):
+            self._writable('subtree', location_id).remove(event_id)
+
+    def _add_event(self, event_id, name, start, end, location_ids):
+        self.events[event_id] = (name, start, end, tuple(location_ids))
+        for location_id in self._known(location_ids):
+            self._writable('direct', location_id).add(start, end, event_id)
+        for location_id in self._covered(location_ids):
+            self._writable('subtree', location_id).add(start, end, event_id)
+
+    def with_changes(self, location_index, rows, changed_event_ids, existing_event_ids=None):
+        """
+        Новый индекс с примененными изменениями; текущий индекс не изменяется.
+
+        Args:
+            location_index: Актуальный LocationIndex с той же иерархией
+            rows: Актуальные строки (event_id, event_name, start, end, location_id) измененных мероприятий
+            changed_event_ids: ID измененных мероприятий (в том числе оставшихся без локаций)
+            existing_event_ids: Все текущие ID мероприятий eventum для поиска удаленных
+
+        Returns:
+            OccupancyIndex
+        """
+        index = object.__new__(type(self))
+        index.location_index = location_index
+        index.events = dict(self.events)
+        index.direct = dict(self.direct)
+        index.subtree = dict(self.subtree)
+        index._copied = set()
+        index._apply_changes(rows, changed_event_ids, existing_event_ids)
+        del index._copied
+        return index
+
+    def _apply_changes(self, rows, changed_event_ids, existing_event_ids):
+        if existing_event_ids is not None:
+            for event_id in set(self.events) - set(existing_event_ids):
+                self._remove_event(event_id)
+
+        updated = {}
+        for event_id, name, start, end, location_id in rows:
+            entry = updated.setdefault(event_id, (name, start, end, []))
+            entry[3].append(location_id)
+
+        for event_id in changed_event_ids:
+            self._remove_event(event_id)
+            if event_id in updated:
+                name, start, end, location_ids = updated[event_id]
+                self._add_event(event_id, name, start, end, location_ids)
+
+    def is_free(self, location_id, start, end):
+        """
+        Свободна ли локация в [start, end): нет мероприятий ни в ней самой и ее
+        потомках, ни непосредственно в ее предках (мероприятие на всю площадку
+        занимает и все ее помещения).
+        """
+        busy = self.subtree.get(location_id)
+        if busy is not None and busy.has_overlap(start, end):
+            return False
+        for ancestor_id in self.location_index.ancestors(location_id)[:-1]:
+            busy = self.direct.get(ancestor_id)
+            if busy is not None and busy.has_overlap(start, end):
+                return False
+        return True
+
+    def free_locations(self, start, end, location_ids=None):
+        """ID свободных в [start, end) локаций (по умолчанию - всех локаций eventum)."""
+        if location_ids is None:
+            location_ids = self.location_index.parents.keys()
+        return [location_id for location_id in location_ids if self.is_free(location_id, start, end)]
+
+    def timeline(self, location_id, start=None, end=None, include_descendants=True):
+        """
+        Мероприятия локации в порядке начала.
+
+        Returns:
+            list: Кортежи (start, end, event_id); при заданных start/end - только пересекающиеся
+        """
+        busy = (self.subtree if include_descendants else self.direct).get(location_id)
+        if busy is None:
+            return []
+        if start is None and end is None:
+            return list(busy)
+        if start is None:
+            start = min(item[0] for item in busy) if len(busy) else end
+        if end is None:
+            end = max(item[1] for item in busy) if len(busy) else start
+        return busy.overlapping(start, end)
+
+
+def _load_rows(**filters):
+    from .models import Event
+
+    return Event.locations.through.objects.filter(
+        **{f'event__{key}': value for key, value in filters.items()}
+    ).values_list(
+        'event_id', 'event__name', 'event__start_time', 'event__end_time', 'location_id'
+    ).order_by('event_id', 'id')
+
+
+def get_occupancy_index(eventum):
+    """
+    Индекс занятости eventum из памяти процесса с инкрементальным обновлением.
+
+    Returns:
+        OccupancyIndex
+    """
+    from django.db.models import Max
+    from .models import Event
+
+    with _occupancy_lock:
+        cached = _occupancy_cache.get(eventum.id)
+        if cached is not None:
+            _occupancy_cache.move_to_end(eventum.id)
+            if cached['version'] == eventum.schedule_version:
+                return cached['index']
+        eventum_lock = _eventum_locks.setdefault(eventum.id, threading.Lock())
+
+    # Запросы выполняются вне общей блокировки; обновление одного eventum - один поток
+    with eventum_lock:
+        with _occupancy_lock:
+            cached = _occupancy_cache.get(eventum.id)
+        if cached is not None and cached['version'] == eventum.schedule_version:
+            return cached['index']
+
+        location_index = get_location_index(eventum)
+        watermark = Event.objects.filter(eventum=eventum).aggregate(value=Max('updated_at'))['value']
+
+        if cached is not None and cached['index'].location_index.parents == location_index.parents:
+            changed = Event.objects.filter(eventum=eventum)
+            if cached['watermark'] is not None:
+                # >= вместо >: повторное применение изменения безопасно, пропуск - нет
+                changed = changed.filter(updated_at__gte=cached['watermark'])
+            changed_event_ids = list(changed.values_list('id', flat=True))
+            rows = _load_rows(id__in=changed_event_ids) if changed_event_ids else []
+            existing_event_ids = Event.objects.filter(eventum=eventum).values_list('id', flat=True)
+            index = cached['index'].with_changes(location_index, rows, changed_event_ids, existing_event_ids)
+        else:
+            index = OccupancyIndex.build(eventum, location_index=location_index)
+
+        with _occupancy_lock:
+            _occupancy_cache[eventum.id] = {
+                'version': eventum.schedule_version,
+                'watermark': watermark,
+                'index': index,
+            }
+            _occupancy_cache.move_to_end(eventum.id)
+            while len(_occupancy_cache) > OCCUPANCY_CACHE_SIZE:
+                evicted_id, _ = _occupancy_cache.popitem(last=False)
+                _eventum_locks.pop(evicted_id, None)
+        return index
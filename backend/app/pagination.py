@@ -0,0 +1,122 @@
+"""
+Постраничная выдача по ключу (keyset) без COUNT(*).
+
+Страница начинается строго после последней строки предыдущей страницы по
+упорядочению (например, (name, id)), поэтому стоимость запроса не растет с
+номером страницы и не требует подсчета всех строк. Курсор - закодированные
+значения полей упорядочения последней строки.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация по уникальному упорядочению ordering.
+
+    Включается query-параметрами page_size или cursor; без них список
+    отдается целиком, как раньше.
+    """
+    ordering = ('name', 'id')
+    # Типы значений полей ordering в курсоре
+    ordering_types = (str, int)
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_default_page_size(self):
+        return getattr(settings, 'KEYSET_PAGE_SIZE', 100)
+
+    def get_max_page_size(self):
+        return getattr(settings, 'KEYSET_MAX_PAGE_SIZE', 1000)
+
+    def is_requested(self, request):
+        return self.page_size_query_param in request.query_params or self.cursor_query_param in request.query_params
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, TypeError, ValueError):
+            return self.get_default_page_size()
+        return max(1, min(page_size, self.get_max_page_size()))
+
+    def encode_cursor(self, values):
+        raw = json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # bool - подкласс int, но ID им не бывает
+        for value, value_type in zip(values, self.ordering_types):
+            if not isinstance(value, value_type) or isinstance(value, bool):
+                raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def get_after_filter(self, values):
+        """Условие "строго после values" для лексикографического упорядочения."""
+        condition = Q()
+        for index in reversed(range(len(self.ordering))):
+            equal = {field: value for field, value in zip(self.ordering[:index], values)}
+            condition = Q(**equal, **{f'{self.ordering[index]}__gt': values[index]}) | condition
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self.get_after_filter(cursor))
+
+        # Лишняя строка показывает, есть ли следующая страница
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        page = rows[:self.page_size]
+        self.next_cursor = None
+        if self.has_next:
+            self.next_cursor = self.encode_cursor([getattr(page[-1], field) for field in self.ordering])
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('next_cursor', self.next_cursor),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
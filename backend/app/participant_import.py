@@ -0,0 +1,226 @@
+"""
+Массовый импорт участников eventum из CSV или JSONL.
+
+Строка импорта: name и/или vk_id (пользователь с таким vk_id должен
+существовать). Участник с пользователем ищется по пользователю, без
+пользователя - по имени (как в ParticipantResource); найденные участники
+обновляются, остальные создаются.
+
+Существующие участники eventum загружаются в словари один раз, пользователи -
+одним запросом на пачку строк. Строки валидируются в памяти и сохраняются
+пачками через bulk_create/bulk_update, без Participant.save()/full_clean() и
+сигналов, поэтому версия состава eventum и кэш членства обновляются вручную
+после фиксации каждой пачки: импорт, прерванный ошибкой или отключением
+клиента, не оставляет зафиксированных строк с устаревшими кэшами.
+"""
+import csv
+import json
+import time
+
+from django.db import transaction
+
+from .caching import bump_eventum_versions, invalidate_user_membership
+
+# Сколько ошибок строк возвращать в итоговом отчете
+MAX_REPORTED_ERRORS = 100
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+
+def read_rows(stream, input_format):
+    """
+    Строки импорта из текстового потока.
+
+    Args:
+        input_format: 'csv' (с заголовком) или 'jsonl' (объект JSON в каждой строке)
+
+    Yields:
+        dict строки или None для строки, которую не удалось разобрать
+    """
+    if input_format == 'csv':
+        yield from csv.DictReader(stream)
+    elif input_format == 'jsonl':
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f"Unknown import format: {input_format}")
+
+
+class ParticipantImporter:
+    """Импорт строк участников в eventum пачками."""
+
+    def __init__(self, eventum, batch_size=1000, dry_run=False):
+        from .models import Participant
+
+        self.eventum = eventum
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.name_max_length = Participant._meta.get_field('name').max_length
+
+        # Участники eventum: с пользователем - по user_id, без пользователя - по имени
+        self.by_user = {}
+        self.by_name = {}
+        for participant in Participant.objects.filter(eventum=eventum).only('id', 'eventum_id', 'user_id', 'name'):
+            if participant.user_id:
+                self.by_user[participant.user_id] = participant
+            else:
+                self.by_name.setdefault(participant.name, participant)
+
+        self.seen_vk_ids = set()
+        self.stats = {'processed': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'errors': 0}
+        self.errors = []
+
+    def _error(self, row_number, message):
+        self.stats['errors'] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'error': message})
+
+    @staticmethod
+    def _parse_vk_id(row):
+        value = row.get('vk_id')
+        if value is None or (isinstance(value, str) and not value.strip()):
+            return None
+        if isinstance(value, bool):
+            raise ValueError
+        return int(value)
+
+    def _load_users(self, batch):
+        """{vk_id: (user_id, name)} для пользователей пачки одним запросом."""
+        from .models import UserProfile
+
+        vk_ids = set()
+        for _, row in batch:
+            try:
+                vk_id = self._parse_vk_id(row) if row is not None else None
+            except (TypeError, ValueError):
+                continue
+            if vk_id is not None:
+                vk_ids.add(vk_id)
+        if not vk_ids:
+            return {}
+        return {
+            vk_id: (user_id, name)
+            for vk_id, user_id, name in UserProfile.objects.filter(vk_id__in=vk_ids).values_list('vk_id', 'id', 'name')
+        }
+
+    def _process_batch(self, batch):
+        from .models import Participant
+
+        users = self._load_users(batch)
+        to_create = []
+        to_update = {}
+        touched_user_ids = set()
+
+        for row_number, row in batch:
+            self.stats['processed'] += 1
+            if row is None:
+                self._error(row_number, 'Row must be an object')
+                continue
+
+            name = str(row.get('name') or '').strip()
+            try:
+                vk_id = self._parse_vk_id(row)
+            except (TypeError, ValueError):
+                self._error(row_number, 'vk_id must be an integer')
+                continue
+
+            user_id = None
+            if vk_id is not None:
+                if vk_id not in users:
+                    self._error(row_number, f'User with vk_id {vk_id} not found')
+                    continue
+                if vk_id in self.seen_vk_ids:
+                    self._error(row_number, f'Duplicate vk_id {vk_id}')
+                    continue
+                self.seen_vk_ids.add(vk_id)
+                user_id, user_name = users[vk_id]
+                # Как Participant.clean: без имени используется имя пользователя
+                name = name or user_name
+
+            if not name:
+                self._error(row_number, 'name is required')
+                continue
+            if len(name) > self.name_max_length:
+                self._error(row_number, f'name is longer than {self.name_max_length} characters')
+                continue
+
+            if user_id is None:
+                if name in self.by_name:
+                    self.stats['unchanged'] += 1
+                    continue
+                participant = Participant(eventum_id=self.eventum.id, name=name)
+                self.by_name[name] = participant
+                to_create.append(participant)
+                continue
+
+            participant = self.by_user.get(user_id)
+            if participant is None:
+                # Привязываем пользователя к существующему участнику с тем же именем
+                participant = self.by_name.get(name)
+                if participant is not None and participant.pk is not None:
+                    del self.by_name[name]
+                    participant.user_id = user_id
+                    to_update[participant.pk] = participant
+                else:
+                    participant = Participant(eventum_id=self.eventum.id, user_id=user_id, name=name)
+                    to_create.append(participant)
+                self.by_user[user_id] = participant
+                touched_user_ids.add(user_id)
+            elif participant.name != name:
+                participant.name = name
+                to_update[participant.pk] = participant
+                touched_user_ids.add(user_id)
+            else:
+                self.stats['unchanged'] += 1
+
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+        if not self.dry_run and (to_create or to_update):
+            with transaction.atomic():
+                Participant.objects.bulk_create(to_create, batch_size=self.batch_size)
+                Participant.objects.bulk_update(list(to_update.values()), ['name', 'user'], batch_size=self.batch_size)
+                # bulk-операции не вызывают сигналы - обновляем версию и кэш
+                # членства вручную после фиксации именно этой пачки
+                bump_eventum_versions(self.eventum.id, membership=True)
+                transaction.on_commit(lambda: self._invalidate_memberships(touched_user_ids))
+
+    def _invalidate_memberships(self, user_ids):
+        for user_id in user_ids:
+            invalidate_user_membership(user_id, self.eventum.id)
+
+    def run(self, rows):
+        """
+        Импортирует строки, выдавая прогресс после каждой пачки.
+
+        Yields:
+            dict: Счетчики строк; последний элемент содержит done=True и список ошибок
+        """
+        started = time.perf_counter()
+
+        def progress(**extra):
+            elapsed = time.perf_counter() - started
+            return {
+                **self.stats,
+                'elapsed_seconds': round(elapsed, 3),
+                'rows_per_second': round(self.stats['processed'] / elapsed, 1) if elapsed else None,
+                **extra,
+            }
+
+        batch = []
+        for row_number, row in enumerate(rows, start=1):
+            batch.append((row_number, row))
+            if len(batch) >= self.batch_size:
+                self._process_batch(batch)
+                batch = []
+                yield progress()
+        if batch:
+            self._process_batch(batch)
+
+        yield progress(done=True, dry_run=self.dry_run, error_details=self.errors)
@@ -0,0 +1,162 @@
+"""
+Выборка участников eventum по логическим выражениям.
+
+Выражение передается как JSON AST:
+    {"and": [expr, ...]}, {"or": [expr, ...]}, {"not": expr}
+    {"group": id}      - участники группы (с учетом вложенных групп)
+    {"event": id}      - участники мероприятия (event_group; без группы - все участники)
+    {"applicant": id}  - подавшие заявку на мероприятие
+    {"tag": id}        - участники хотя бы одного мероприятия с тегом
+
+Например, "(в группе A или на любом мероприятии с тегом T) и не в группе B":
+    {"and": [{"or": [{"group": A}, {"tag": T}]}, {"not": {"group": B}}]}
+
+Перед вычислением из выражения собираются все упомянутые группы, мероприятия
+и теги, и нужные данные загружаются несколькими запросами на все выражение
+сразу. Выражение вычисляется в памяти над множествами ID участников из
+EventumGroupGraph, результат - отсортированный список ID, который отдается
+страницами без передачи больших списков ID в БД.
+"""
+from bisect import bisect_right
+
+from .utils import EventumGroupGraph
+
+# Ограничения на размер выражения
+MAX_QUERY_NODES = 200
+MAX_QUERY_DEPTH = 20
+
+LEAF_KEYS = ('group', 'event', 'applicant', 'tag')
+
+
+class QueryError(ValueError):
+    """Некорректное выражение (сообщение отдается клиенту)."""
+
+
+class ParticipantQuery:
+    """Разобранное выражение и данные eventum, необходимые для его вычисления."""
+
+    def __init__(self, eventum, expression, group_graph=None):
+        self.eventum = eventum
+        self.expression = expression
+        self.leaves = {key: set() for key in LEAF_KEYS}
+        self._nodes = 0
+        self._validate(expression, depth=1)
+
+        self.group_graph = group_graph or EventumGroupGraph(eventum)
+        self.all_participant_ids = frozenset(self.group_graph.all_participant_ids)
+        self._load()
+
+    def _validate(self, node, depth):
+        self._nodes += 1
+        if self._nodes > MAX_QUERY_NODES:
+            raise QueryError(f'Expression is too large (max {MAX_QUERY_NODES} nodes)')
+        if depth > MAX_QUERY_DEPTH:
+            raise QueryError(f'Expression is too deep (max depth {MAX_QUERY_DEPTH})')
+        if not isinstance(node, dict) or len(node) != 1:
+            raise QueryError('Each expression node must be an object with exactly one key')
+
+        key, value = next(iter(node.items()))
+        if key in ('and', 'or'):
+            if not isinstance(value, list) or not value:
+                raise QueryError(f'"{key}" expects a non-empty list of expressions')
+            for item in value:
+                self._validate(item, depth + 1)
+        elif key == 'not':
+            self._validate(value, depth + 1)
+        elif key in LEAF_KEYS:
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise QueryError(f'"{key}" expects an integer ID')
+            self.leaves[key].add(value)
+        else:
+            raise QueryError(f'Unknown expression key "{key}"')
+
+    def _load(self):
+        """Загружает мероприятия, теги и заявки, упомянутые в выражении."""
+        from .models import Event, EventRegistration, EventTag
+
+        for group_id in self.leaves['group']:
+            if self.group_graph.get_group(group_id) is None:
+                raise QueryError(f'Group {group_id} not found')
+
+        tag_ids = self.leaves['tag']
+        if tag_ids:
+            found = set(EventTag.objects.filter(eventum=self.eventum, id__in=tag_ids).values_list('id', flat=True))
+            if found != tag_ids:
+                raise QueryError(f'Tag {min(tag_ids - found)} not found')
+
+        # {event_id: event_group_id} для мероприятий и мероприятий тегов
+        event_ids = self.leaves['event'] | self.leaves['applicant']
+        self.event_groups = {}
+        self.tag_events = {tag_id: set() for tag_id in tag_ids}
+        if event_ids:
+            rows = Event.objects.filter(eventum=self.eventum, id__in=event_ids).values_list('id', 'event_group_id')
+            self.event_groups.update(rows)
+            missing = event_ids - set(self.event_groups)
+            if missing:
+                raise QueryError(f'Event {min(missing)} not found')
+        if tag_ids:
+            rows = Event.tags.through.objects.filter(
+                eventtag_id__in=tag_ids, event__eventum=self.eventum
+            ).values_list('eventtag_id', 'event_id', 'event__event_group_id')
+            for tag_id, event_id, event_group_id in rows:
+                self.tag_events[tag_id].add(event_id)
+                self.event_groups[event_id] = event_group_id
+
+        self.applicants = {event_id: set() for event_id in self.leaves['applicant']}
+        if self.applicants:
+            rows = EventRegistration.applicants.through.objects.filter(
+                eventregistration__event_id__in=self.applicants
+            ).values_list('eventregistration__event_id', 'participant_id')
+            for event_id, participant_id in rows:
+                self.applicants[event_id].add(participant_id)
+
+    def _event_participant_ids(self, event_id):
+        event_group_id = self.event_groups[event_id]
+        if event_group_id is None:
+            return self.all_participant_ids
+        return self.group_graph.get_participant_ids(event_group_id)
+
+    def _evaluate(self, node):
+        key, value = next(iter(node.items()))
+        if key == 'and':
+            result = set(self._evaluate(value[0]))
+            for item in value[1:]:
+                if not result:
+                    break
+                result &= self._evaluate(item)
+            return result
+        if key == 'or':
+            result = set()
+            for item in value:
+                result |= self._evaluate(item)
+            return result
+        if key == 'not':
+            return self.all_participant_ids - self._evaluate(value)
+        if key == 'group':
+            return self.group_graph.get_participant_ids(value)
+        if key == 'event':
+            return self._event_participant_ids(value)
+        if key == 'applicant':
+            return self.applicants[value]
+        # tag
+        result = set()
+        for event_id in self.tag_events[value]:
+            result |= self._event_participant_ids(event_id)
+        return result
+
+    def evaluate(self):
+        """Отсортированный список ID участников, удовлетворяющих выражению."""
+        return sorted(self._evaluate(self.expression) & self.all_participant_ids)
+
+
+def page_participant_ids(participant_ids, after=None, limit=100):
+    """
+    Страница отсортированного списка ID после ID after.
+
+    Returns:
+        tuple: (ID страницы, ID для следующей страницы или None)
+    """
+    start = bisect_right(participant_ids, after) if after is not None else 0
+    page = participant_ids[start:start + limit]
+    next_after = page[-1] if start + limit < len(participant_ids) else None
+    return page, next_after
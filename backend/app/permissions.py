@@ -1,7 +1,7 @@
 from rest_framework import permissions
 from django.http import Http404
 from .models import UserRole, Participant
-from .auth_utils import get_eventum_from_request, get_user_role_in_eventum
+from .auth_utils import get_eventum_from_request, get_viewer_context
 
 
 class IsEventumOrganizer(permissions.BasePermission):
@@ -15,7 +15,7 @@ class IsEventumOrganizer(permissions.BasePermission):
         
         try:
             eventum = get_eventum_from_request(request, view)
-            user_role = get_user_role_in_eventum(request.user, eventum)
+            user_role = get_viewer_context(request, eventum).role
             return user_role == 'organizer'
         except Http404:
             return False
@@ -41,7 +41,7 @@ class IsEventumOrganizerOrReadOnlyForList(permissions.BasePermission):
         # Для конкретного eventum'а проверяем права организатора
         try:
             eventum = get_eventum_from_request(request, view)
-            user_role = get_user_role_in_eventum(request.user, eventum)
+            user_role = get_viewer_context(request, eventum).role
             return user_role == 'organizer'
         except Http404:
             return False
@@ -58,7 +58,7 @@ class IsEventumParticipant(permissions.BasePermission):
         
         try:
             eventum = get_eventum_from_request(request, view)
-            user_role = get_user_role_in_eventum(request.user, eventum)
+            user_role = get_viewer_context(request, eventum).role
             return user_role in ['organizer', 'participant']
         except Http404:
             return False
@@ -75,7 +75,7 @@ class IsEventumOrganizerOrReadOnly(permissions.BasePermission):
         
         try:
             eventum = get_eventum_from_request(request, view)
-            user_role = get_user_role_in_eventum(request.user, eventum)
+            user_role = get_viewer_context(request, eventum).role
             
             # Организаторы могут все
             if user_role == 'organizer':
@@ -106,7 +106,7 @@ class IsEventumOrganizerOrPublicReadOnly(permissions.BasePermission):
         
         try:
             eventum = get_eventum_from_request(request, view)
-            user_role = get_user_role_in_eventum(request.user, eventum)
+            user_role = get_viewer_context(request, eventum).role
             return user_role == 'organizer'
         except Http404:
             return False
@@ -1,3 +1,4 @@
+from rest_framework.negotiation import DefaultContentNegotiation
 from rest_framework.renderers import BaseRenderer
 
 
@@ -41,3 +42,14 @@ class ICalendarApplicationRenderer(BaseRenderer):
         else:
             # Если данные не строка и не байты, пытаемся преобразовать в строку
             return str(data).encode(self.charset)
+
+
+class FlatFormatContentNegotiation(DefaultContentNegotiation):
+    """
+    Параметр ?format=flat выбирает плоское представление данных, а не renderer,
+    поэтому для него renderer выбирается обычным образом по заголовку Accept.
+    """
+    def filter_renderers(self, renderers, format):
+        if format == 'flat':
+            return renderers
+        return super().filter_renderers(renderers, format)
@@ -0,0 +1,278 @@
+"""
+Интервальные структуры для работы с расписанием eventum.
+
+Все интервалы полуоткрытые: [start, end). Мероприятие, которое заканчивается
+ровно в момент начала другого, с ним не пересекается.
+"""
+import heapq
+from bisect import bisect_left, bisect_right
+
+from .utils import EventumGroupGraph
+
+
+class IntervalIndex:
+    """
+    Отсортированный по времени начала набор интервалов.
+
+    Хранит начала интервалов в отсортированном списке и префиксный максимум
+    концов, поэтому поиск пересечений с [start, end) выполняется двумя
+    бинарными поисками и просмотром только потенциальных кандидатов.
+    """
+
+    def __init__(self, intervals=()):
+        """
+        Args:
+            intervals: Итерируемое из кортежей (start, end, key)
+        """
+        self._items = sorted(intervals, key=lambda item: (item[0], item[1]))
+        self._rebuild()
+
+    def _rebuild(self):
+        self._starts = [item[0] for item in self._items]
+        self._max_ends = []
+        current_max = None
+        for item in self._items:
+            if current_max is None or item[1] > current_max:
+                current_max = item[1]
+            self._max_ends.append(current_max)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def copy(self):
+        """Независимая копия (без повторной сортировки)."""
+        result = object.__new__(type(self))
+        result._items = list(self._items)
+        result._starts = list(self._starts)
+        result._max_ends = list(self._max_ends)
+        return result
+
+    def add(self, start, end, key):
+        """Добавляет интервал, сохраняя порядок."""
+        position = bisect_right(self._starts, start)
+        self._items.insert(position, (start, end, key))
+        self._rebuild()
+
+    def remove(self, key):
+        """Удаляет все интервалы с указанным ключом."""
+        items = [item for item in self._items if item[2] != key]
+        if len(items) != len(self._items):
+            self._items = items
+            self._rebuild()
+
+    def overlapping(self, start, end):
+        """
+        Возвращает интервалы, пересекающиеся с [start, end).
+
+        Returns:
+            list: Кортежи (start, end, key) в порядке начала
+        """
+        # Кандидаты начинаются строго раньше конца запрошенного интервала
+        upper = bisect_left(self._starts, end)
+        # Префиксный максимум концов не убывает: всё левее lower закончилось до start
+        lower = bisect_right(self._max_ends, start, 0, upper)
+        return [item for item in self._items[lower:upper] if item[1] > start]
+
+    def starting_after(self, moment):
+        """Итератор по интервалам, начинающимся строго после moment, в порядке начала."""
+        # Обход по индексам без копирования хвоста списка: потребителю обычно нужны первые элементы
+        items = self._items
+        return (items[position] for position in range(bisect_right(self._starts, moment), len(items)))
+
+    def active_at(self, moment):
+        """Интервалы, содержащие момент moment (start <= moment < end)."""
+        upper = bisect_right(self._starts, moment)
+        lower = bisect_right(self._max_ends, moment, 0, upper)
+        return [item for item in self._items[lower:upper] if item[1] > moment]
+
+    def has_overlap(self, start, end):
+        """Проверяет, пересекается ли [start, end) хотя бы с одним интервалом."""
+        return bool(self.overlapping(start, end))
+
+
+def get_registration_members(eventum, events, group_graph=None):
+    """
+    Возвращает зарегистрированных участников для мероприятий с регистрацией.
+
+    Для регистрации по кнопке участники берутся из event_group через граф групп,
+    для регистрации по заявкам - из applicants (один запрос на все мероприятия).
+
+    Args:
+        eventum: Объект Eventum
+        events: Мероприятия с загруженными registration (select_related)
+        group_graph: Уже построенный EventumGroupGraph или None
+
+    Returns:
+        dict: {event_id: set(participant_id)}
+    """
+    from .models import EventRegistration
+
+    application_registration_ids = {}
+    members = {}
+    for event in events:
+        registration = event.registration
+        if registration.registration_type == EventRegistration.RegistrationType.APPLICATION:
+            application_registration_ids[registration.id] = event.id
+            members[event.id] = set()
+        elif event.event_group_id:
+            if group_graph is None:
+                group_graph = EventumGroupGraph(eventum)
+            members[event.id] = set(group_graph.get_participant_ids(event.event_group_id))
+        else:
+            members[event.id] = set()
+
+    if application_registration_ids:
+        applicant_rows = EventRegistration.applicants.through.objects.filter(
+            eventregistration_id__in=application_registration_ids.keys()
+        ).values_list('eventregistration_id', 'participant_id')
+        for registration_id, participant_id in applicant_rows:
+            members[application_registration_ids[registration_id]].add(participant_id)
+
+    return members
+
+
+def _registration_events(eventum):
+    from .models import Event
+
+    return Event.objects.filter(
+        eventum=eventum,
+        registration__isnull=False
+    ).select_related('registration')
+
+
+def build_participant_index(eventum, participant_id, start=None, end=None, exclude_event_id=None, group_graph=None):
+    """
+    Строит интервальный индекс мероприятий, на которые записан участник.
+
+    Если передано окно [start, end), загружаются только мероприятия,
+    пересекающиеся с ним - этого достаточно для проверки одной записи.
+
+    Returns:
+        IntervalIndex: Интервалы с ключом - объектом Event
+    """
+    events = _registration_events(eventum)
+    if start is not None and end is not None:
+        events = events.filter(start_time__lt=end, end_time__gt=start)
+    if exclude_event_id is not None:
+        events = events.exclude(pk=exclude_event_id)
+
+    events = list(events)
+    if not events:
+        return IntervalIndex()
+
+    members = get_registration_members(eventum, events, group_graph=group_graph)
+    return IntervalIndex(
+        (event.start_time, event.end_time, event)
+        for event in events
+        if participant_id in members[event.id]
+    )
+
+
+def find_registration_conflicts(eventum, group_graph=None):
+    """
+    Находит все пары пересекающихся по времени мероприятий у участников eventum.
+
+    Проход сканирующей прямой по мероприятиям с регистрацией, отсортированным
+    по началу: в куче держатся ещё не закончившиеся мероприятия, и для каждой
+    пары пересекающихся мероприятий конфликтующие участники находятся
+    пересечением множеств зарегистрированных.
+
+    Returns:
+        list: [(participant_id, first_event, second_event)], first_event начинается раньше
+    """
+    events = sorted(_registration_events(eventum), key=lambda event: (event.start_time, event.end_time, event.id))
+    if not events:
+        return []
+
+    members = get_registration_members(eventum, events, group_graph=group_graph)
+
+    conflicts = []
+    active = []  # куча (end_time, event_id, event)
+    for event in events:
+        while active and active[0][0] <= event.start_time:
+            heapq.heappop(active)
+
+        event_members = members[event.id]
+        if event_members:
+            for _, _, other in active:
+                for participant_id in members[other.id] & event_members:
+                    conflicts.append((participant_id, other, event))
+
+        heapq.heappush(active, (event.end_time, event.id, event))
+
+    return conflicts
+
+
+def find_location_conflicts(eventum, candidates):
+    """
+    Находит двойные бронирования локаций для новых или изменяемых мероприятий.
+
+    Для одного мероприятия выполняется индексированный запрос пересечений
+    (start_time < end и end_time > start по локациям мероприятия). Для пачки
+    мероприятий все занятые интервалы нужных локаций загружаются одним
+    запросом в IntervalIndex, и пачка проверяется за один проход - как с уже
+    существующими мероприятиями, так и внутри самой пачки.
+
+    Args:
+        eventum: Объект Eventum
+        candidates: Список кортежей (start, end, location_ids, event_id), где event_id -
+                    ID изменяемого мероприятия или None для нового
+
+    Returns:
+        list: Словари {'index', 'location_id', 'event_id', 'other_index'}: index - позиция
+              кандидата, event_id - существующее мероприятие или other_index - другой кандидат
+    """
+    from .models import Event
+
+    through = Event.locations.through
+    location_ids = {location_id for _, _, ids, _ in candidates for location_id in ids}
+    if not location_ids:
+        return []
+    candidate_event_ids = {event_id for _, _, _, event_id in candidates if event_id}
+
+    conflicts = []
+    if len(candidates) == 1:
+        start, end, ids, event_id = candidates[0]
+        rows = through.objects.filter(
+            event__eventum=eventum,
+            location_id__in=ids,
+            event__start_time__lt=end,
+            event__end_time__gt=start,
+        ).exclude(event_id__in=candidate_event_ids).order_by('location_id', 'event_id').values_list('event_id', 'location_id')
+        return [
+            {'index': 0, 'location_id': location_id, 'event_id': other_event_id, 'other_index': None}
+            for other_event_id, location_id in rows
+        ]
+
+    existing = {}
+    rows = through.objects.filter(
+        event__eventum=eventum,
+        location_id__in=location_ids,
+    ).exclude(event_id__in=candidate_event_ids).values_list(
+        'event__start_time', 'event__end_time', 'event_id', 'location_id'
+    )
+    for start, end, event_id, location_id in rows:
+        existing.setdefault(location_id, []).append((start, end, event_id))
+    existing = {location_id: IntervalIndex(items) for location_id, items in existing.items()}
+
+    batch = {}
+    for index, (start, end, ids, _) in enumerate(candidates):
+        for location_id in set(ids):
+            batch.setdefault(location_id, []).append((start, end, index))
+    batch = {location_id: IntervalIndex(items) for location_id, items in batch.items()}
+
+    for index, (start, end, ids, _) in enumerate(candidates):
+        for location_id in sorted(set(ids)):
+            location_existing = existing.get(location_id)
+            if location_existing is not None:
+                for _, _, other_event_id in location_existing.overlapping(start, end):
+                    conflicts.append({'index': index, 'location_id': location_id, 'event_id': other_event_id, 'other_index': None})
+            # Каждая пара кандидатов учитывается один раз
+            for _, _, other_index in batch[location_id].overlapping(start, end):
+                if other_index > index:
+                    conflicts.append({'index': index, 'location_id': location_id, 'event_id': None, 'other_index': other_index})
+
+    return conflicts
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from rest_framework.relations import MANY_RELATION_KWARGS
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.db import transaction
 from django.utils.text import slugify
 from datetime import datetime
 from transliterate import translit
@@ -12,6 +13,9 @@ from .models import (
     ParticipantGroupEventRelation
 )
 from .utils import get_group_participant_ids
+from .waves import EventumWaveIndex
+from .caching import bump_eventum_versions
+from .schedule import find_location_conflicts
 
 
 class LocalDateTimeField(serializers.DateTimeField):
@@ -123,7 +127,7 @@ class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
 class EventumSerializer(serializers.ModelSerializer):
     class Meta:
         model = Eventum
-        fields = ['id', 'name', 'slug', 'description', 'image_url', 'registration_open', 'schedule_visible']
+        fields = ['id', 'name', 'slug', 'description', 'image_url', 'registration_open', 'schedule_visible', 'forbid_overlapping_registrations', 'forbid_location_double_booking']
         # Убираем slug из read_only_fields, чтобы можно было передавать его при создании
     
     def create(self, validated_data):
@@ -477,57 +481,165 @@ class ParticipantGroupSerializer(serializers.ModelSerializer):
         if eventum:
             validated_data['eventum'] = eventum
         
-        # Создаем группу
-        group = super().create(validated_data)
-        
-        # Создаем связи с участниками
-        for relation_data in participant_relations_data:
-            relation_data['group_id'] = group.id
-            serializer = ParticipantGroupParticipantRelationSerializer(data=relation_data, context=self.context)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-        
-        # Создаем связи с группами
-        for relation_data in group_relations_data:
-            relation_data['group_id'] = group.id
-            serializer = ParticipantGroupGroupRelationSerializer(data=relation_data, context=self.context)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+        with transaction.atomic():
+            group = super().create(validated_data)
+            changed = self._sync_participant_relations(group, participant_relations_data)
+            changed = self._sync_group_relations(group, group_relations_data) or changed
         
+        if changed:
+            # bulk-операции не вызывают сигналы - обновляем версию состава вручную
+            bump_eventum_versions(group.eventum_id, membership=True)
         return group
     
     def update(self, instance, validated_data):
-        """Обновление группы с обработкой вложенных связей"""
+        """
+        Обновление группы с обработкой вложенных связей.
+        
+        Переданный список связей - новое состояние: он сравнивается с текущими
+        связями, и в БД попадает только разница (удаленные, новые и связи со
+        смененным типом). Связи, которые не изменились, не пересоздаются.
+        """
         participant_relations_data = validated_data.pop('participant_relations', None)
         group_relations_data = validated_data.pop('group_relations', None)
         
-        # Обновляем основные поля группы
-        instance = super().update(instance, validated_data)
-        
-        # Обновляем связи с участниками, если они предоставлены
-        if participant_relations_data is not None:
-            # Удаляем существующие связи
-            instance.participant_relations.all().delete()
-            # Создаем новые связи
-            for relation_data in participant_relations_data:
-                relation_data['group_id'] = instance.id
-                serializer = ParticipantGroupParticipantRelationSerializer(data=relation_data, context=self.context)
-                serializer.is_valid(raise_exception=True)
-                serializer.save()
-        
-        # Обновляем связи с группами, если они предоставлены
-        if group_relations_data is not None:
-            # Удаляем существующие связи
-            instance.group_relations.all().delete()
-            # Создаем новые связи
-            for relation_data in group_relations_data:
-                relation_data['group_id'] = instance.id
-                serializer = ParticipantGroupGroupRelationSerializer(data=relation_data, context=self.context)
-                serializer.is_valid(raise_exception=True)
-                serializer.save()
-        
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            changed = False
+            if participant_relations_data is not None:
+                changed = self._sync_participant_relations(instance, participant_relations_data)
+            if group_relations_data is not None:
+                changed = self._sync_group_relations(instance, group_relations_data) or changed
+        
+        if changed:
+            # bulk-операции не вызывают сигналы - обновляем версию состава вручную
+            bump_eventum_versions(instance.eventum_id, membership=True)
         return instance
     
+    @staticmethod
+    def _desired_relations(model, relations_data, key_field, field_name):
+        """{ID цели: тип связи} из переданных связей модели model; повторы цели запрещены."""
+        desired = {}
+        for relation_data in relations_data:
+            key = relation_data[key_field]
+            if key in desired:
+                raise serializers.ValidationError({field_name: f'Duplicate {key_field} {key}'})
+            desired[key] = relation_data.get('relation_type', model.RelationType.INCLUSIVE)
+        return desired
+    
+    @staticmethod
+    def _apply_relations_diff(model, group, key_field, existing, desired):
+        """
+        Приводит связи группы к desired одним удалением, одним bulk_create и
+        не более чем двумя update (по одному на тип связи). Удаленные связи
+        увеличивают версию членства через post_delete, созданные и измененные -
+        через общий bump вызывающего кода.
+        
+        Args:
+            existing: {ID цели: (ID связи, тип связи)} текущих связей группы
+            desired: {ID цели: тип связи}
+        
+        Returns:
+            bool: Были ли изменения
+        """
+        delete_ids = [relation_id for key, (relation_id, _) in existing.items() if key not in desired]
+        retype = {}
+        for key, (relation_id, relation_type) in existing.items():
+            if key in desired and desired[key] != relation_type:
+                retype.setdefault(desired[key], []).append(relation_id)
+        to_create = [
+            model(group=group, relation_type=relation_type, **{key_field: key})
+            for key, relation_type in desired.items() if key not in existing
+        ]
+        
+        if delete_ids:
+            # Одним DELETE по ID; сигналы post_delete отправляются для каждой связи
+            model.objects.filter(id__in=delete_ids).delete()
+        for relation_type, relation_ids in retype.items():
+            model.objects.filter(id__in=relation_ids).update(relation_type=relation_type)
+        if to_create:
+            model.objects.bulk_create(to_create)
+        return bool(delete_ids or retype or to_create)
+    
+    def _sync_participant_relations(self, group, relations_data):
+        """Синхронизирует связи группы с участниками с переданным списком."""
+        desired = self._desired_relations(
+            ParticipantGroupParticipantRelation, relations_data, 'participant_id', 'participant_relations'
+        )
+        
+        existing = {
+            participant_id: (relation_id, relation_type)
+            for relation_id, participant_id, relation_type in ParticipantGroupParticipantRelation.objects.filter(
+                group=group
+            ).values_list('id', 'participant_id', 'relation_type')
+        }
+        new_ids = set(desired) - set(existing)
+        if new_ids:
+            eventum_participant_ids = set(
+                Participant.objects.filter(eventum_id=group.eventum_id).values_list('id', flat=True)
+            )
+            missing = new_ids - eventum_participant_ids
+            if missing:
+                raise serializers.ValidationError({
+                    'participant_relations': f'Participant with ID {min(missing)} does not exist in this eventum'
+                })
+        
+        return self._apply_relations_diff(
+            ParticipantGroupParticipantRelation, group, 'participant_id', existing, desired
+        )
+    
+    def _sync_group_relations(self, group, relations_data):
+        """
+        Синхронизирует связи группы с другими группами с переданным списком.
+        
+        Группы eventum и все связи между ними загружаются двумя запросами,
+        проверка принадлежности eventum и циклов выполняется в памяти.
+        """
+        desired = self._desired_relations(
+            ParticipantGroupGroupRelation, relations_data, 'target_group_id', 'group_relations'
+        )
+        if group.id in desired:
+            raise serializers.ValidationError({'group_relations': 'A group cannot reference itself'})
+        
+        existing = {}
+        edges = {}
+        rows = ParticipantGroupGroupRelation.objects.filter(
+            group__eventum_id=group.eventum_id
+        ).values_list('id', 'group_id', 'target_group_id', 'relation_type')
+        for relation_id, group_id, target_group_id, relation_type in rows:
+            if group_id == group.id:
+                existing[target_group_id] = (relation_id, relation_type)
+            else:
+                edges.setdefault(group_id, []).append(target_group_id)
+        
+        new_ids = set(desired) - set(existing)
+        if new_ids:
+            eventum_group_ids = set(
+                ParticipantGroup.objects.filter(eventum_id=group.eventum_id).values_list('id', flat=True)
+            )
+            missing = new_ids - eventum_group_ids
+            if missing:
+                raise serializers.ValidationError({
+                    'group_relations': f'Group with ID {min(missing)} does not exist in this eventum'
+                })
+            
+            # Цикл появится, если из какой-либо новой цели достижима сама группа
+            visited = set()
+            to_check = list(new_ids)
+            while to_check:
+                current_group_id = to_check.pop()
+                if current_group_id == group.id:
+                    raise serializers.ValidationError({
+                        'group_relations': 'Creating these relations would create a cycle'
+                    })
+                if current_group_id in visited:
+                    continue
+                visited.add(current_group_id)
+                to_check.extend(edges.get(current_group_id, ()))
+        
+        return self._apply_relations_diff(
+            ParticipantGroupGroupRelation, group, 'target_group_id', existing, desired
+        )
+    
     def to_representation(self, instance):
         """Переопределяем для оптимизации запросов к связям"""
         data = super().to_representation(instance)
@@ -558,17 +670,16 @@ class BaseEventSerializer(serializers.ModelSerializer):
     registrations_count = serializers.SerializerMethodField()
     participants_count = serializers.SerializerMethodField()
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Кэш для вычислений волны
-        self._wave_cache = {}
-    
     def get_registrations_count(self, obj):
         # Используем предварительно вычисленное значение из annotate
         if hasattr(obj, 'registrations_count'):
             return obj.registrations_count
         # Fallback: проверяем наличие регистрации и получаем количество
         if hasattr(obj, 'registration'):
+            # Для мероприятий волны количество уже известно из агрегатов волны
+            wave_data = self._get_wave_data(obj)
+            if wave_data['wave_id'] is not None:
+                return len(wave_data['event_participant_ids'])
             all_participant_ids = self.context.get('all_participant_ids')
             return obj.registration.get_registered_count(all_participant_ids)
         return 0
@@ -579,48 +690,48 @@ class BaseEventSerializer(serializers.ModelSerializer):
             return obj.participants_count
         return 0
     
+    def _get_wave_index(self, obj):
+        """Индекс волн eventum, общий для всех сериализаторов в рамках запроса"""
+        wave_index = self.context.get('wave_index')
+        if wave_index is None or wave_index.eventum.id != obj.eventum_id:
+            wave_index = EventumWaveIndex(obj.eventum, group_graph=self.context.get('group_graph'))
+            self.context['wave_index'] = wave_index
+        return wave_index
+
     def _get_wave_data(self, obj):
-        """Получает данные волны с кэшированием для оптимизации"""
-        cache_key = f"wave_{obj.id}"
-        if cache_key not in self._wave_cache:
-            wave = None
-            assigned_participant_ids = set()
-            participants_with_unassigned_registrations = set()
-            
-            # Получаем волну для текущего мероприятия через регистрацию
-            event_registration = getattr(obj, 'registration', None)
-            if event_registration:
-                # Получаем первую волну, связанную с этой регистрацией
-                waves = event_registration.waves.all()
-                if waves.exists():
-                    wave = waves.first()
-            
-            if wave:
-                # Получаем ID всех участников, уже записанных на мероприятия волны
-                for registration in wave.registrations.all():
-                    event = registration.event
-                    # Теперь participant_type определяется наличием event_group
-                    # Если есть event_group - это REGISTRATION, иначе - ALL
-                    if event.event_group_id and event.id != obj.id:
-                        # Для типа REGISTRATION проверяем, зарегистрированы ли участники
-                        if registration.registration_type == EventRegistration.RegistrationType.BUTTON:
-                            # Участники в event_group
-                            assigned_participant_ids.update(
-                                event.event_group.get_participants().values_list('id', flat=True)
-                            )
-                        else:
-                            # Участники в applicants
-                            assigned_participant_ids.update(
-                                registration.applicants.values_list('id', flat=True)
-                            )
-            
-            self._wave_cache[cache_key] = {
-                'wave': wave,
-                'assigned_participant_ids': assigned_participant_ids,
-                'participants_with_unassigned_registrations': participants_with_unassigned_registrations
+        """Получает данные волны мероприятия из агрегатов, вычисленных один раз на волну"""
+        aggregates = self._get_wave_index(obj).get_event_aggregates(obj.id)
+        if aggregates is None:
+            return {
+                'wave_id': None,
+                'event_participant_ids': set(),
+                'assigned_participant_ids': set(),
+                'participants_with_unassigned_registrations': set()
             }
-        
-        return self._wave_cache[cache_key]
+
+        return {
+            'wave_id': aggregates.wave_id,
+            'event_participant_ids': aggregates.get_members(obj.id),
+            'assigned_participant_ids': aggregates.assigned_elsewhere(obj.id),
+            'participants_with_unassigned_registrations': set()
+        }
+
+    def _get_registration_participant_ids(self, obj, wave_data):
+        """ID участников, записанных на мероприятие через регистрацию"""
+        if wave_data['wave_id'] is not None:
+            return wave_data['event_participant_ids']
+
+        registration = getattr(obj, 'registration', None)
+        if not registration:
+            return set()
+        if registration.registration_type == EventRegistration.RegistrationType.BUTTON:
+            if not obj.event_group_id:
+                return set()
+            return self._get_wave_index(obj).group_graph.get_participant_ids(obj.event_group_id)
+        prefetched = getattr(registration, '_prefetched_objects_cache', {})
+        if 'applicants' in prefetched:
+            return {applicant.id for applicant in prefetched['applicants']}
+        return set(registration.applicants.values_list('id', flat=True))
 
 class EventBasicInfoSerializer(BaseEventSerializer):
     """Максимально оптимизированный сериализатор для событий"""
@@ -650,31 +761,15 @@ class EventFullInfoSerializer(EventBasicInfoSerializer):
         if registrations_count == 0:
             return 0
         
-        # Используем кэшированные данные волны
+        # Используем агрегаты волны
         wave_data = self._get_wave_data(obj)
         
-        if not wave_data['wave']:
+        if wave_data['wave_id'] is None:
             # Если нет волны, все участники доступны
             return registrations_count
         
-        # Получаем ID участников текущего события через регистрацию
-        current_event_participant_ids = set()
-        if hasattr(obj, 'registration') and obj.registration:
-            if obj.registration.registration_type == EventRegistration.RegistrationType.BUTTON:
-                # Для типа button участники в event_group
-                if obj.event_group:
-                    current_event_participant_ids = set(
-                        obj.event_group.get_participants().values_list('id', flat=True)
-                    )
-            else:
-                # Для типа application участники в applicants
-                current_event_participant_ids = set(
-                    obj.registration.applicants.values_list('id', flat=True)
-                )
-        
         # Подсчитываем доступных участников
-        available_count = len(current_event_participant_ids - wave_data['assigned_participant_ids'])
-        return available_count
+        return len(wave_data['event_participant_ids'] - wave_data['assigned_participant_ids'])
 
     def get_available_without_unassigned_events(self, obj):
         """Количество участников, которые подали заявку, не попали на другие мероприятия волны 
@@ -684,35 +779,18 @@ class EventFullInfoSerializer(EventBasicInfoSerializer):
         if registrations_count == 0:
             return 0
         
-        # Используем кэшированные данные волны
+        # Используем агрегаты волны
         wave_data = self._get_wave_data(obj)
         
-        if not wave_data['wave']:
+        if wave_data['wave_id'] is None:
             # Если нет волны, все участники доступны
             return registrations_count
         
-        # Получаем ID участников текущего события через регистрацию
-        current_event_participant_ids = set()
-        if hasattr(obj, 'registration') and obj.registration:
-            if obj.registration.registration_type == EventRegistration.RegistrationType.BUTTON:
-                # Для типа button участники в event_group
-                if obj.event_group:
-                    current_event_participant_ids = set(
-                        obj.event_group.get_participants().values_list('id', flat=True)
-                    )
-            else:
-                # Для типа application участники в applicants
-                current_event_participant_ids = set(
-                    obj.registration.applicants.values_list('id', flat=True)
-                )
-        
         # Исключаем участников, которые уже распределены на другие мероприятия волны
         # И участников, которые имеют заявки на нераспределенные мероприятия
         excluded_participants = (wave_data['assigned_participant_ids'] | 
                                 wave_data['participants_with_unassigned_registrations'])
-        available_count = len(current_event_participant_ids - excluded_participants)
-        
-        return available_count
+        return len(wave_data['event_participant_ids'] - excluded_participants)
 
     def get_can_convert(self, obj):
         """Можно ли конвертировать регистрации для этого мероприятия"""
@@ -743,40 +821,18 @@ class EventWithRegistrationInfoSerializer(BaseEventSerializer):
 
     def get_available_participants(self, obj):
         """Количество участников, которые подали заявку и еще не распределены на другие мероприятия волны"""
-        # Получаем участников через регистрацию
-        registration_participant_ids = set()
-        if hasattr(obj, 'registration') and obj.registration:
-            if obj.registration.registration_type == EventRegistration.RegistrationType.BUTTON:
-                    # Для типа button участники в event_group
-                    # ИСПОЛЬЗУЕМ get_group_participant_ids вместо get_participants().values_list() для избежания запросов к БД
-                    if obj.event_group:
-                        registration_participant_ids = self._get_group_participant_ids(
-                            obj.event_group
-                        )
-            else:
-                # Для типа application участники в applicants
-                # ИСПОЛЬЗУЕМ prefetch'нутые данные
-                if hasattr(obj.registration, '_prefetched_objects_cache') and 'applicants' in obj.registration._prefetched_objects_cache:
-                    registration_participant_ids = {app.id for app in obj.registration._prefetched_objects_cache['applicants']}
-                else:
-                    # Fallback: если prefetch не сработал
-                    registration_participant_ids = set(
-                        obj.registration.applicants.values_list('id', flat=True)
-                    )
+        wave_data = self._get_wave_data(obj)
+        registration_participant_ids = self._get_registration_participant_ids(obj, wave_data)
         
         if not registration_participant_ids:
             return 0
         
-        wave_data = self._get_wave_data(obj)
-        
-        if not wave_data['wave']:
+        if wave_data['wave_id'] is None:
             # Если нет волны, все участники доступны
             return len(registration_participant_ids)
         
         # Подсчитываем доступных участников
-        available_count = len(registration_participant_ids - wave_data['assigned_participant_ids'])
-        
-        return available_count
+        return len(registration_participant_ids - wave_data['assigned_participant_ids'])
     
     def get_already_assigned_count(self, obj):
         """Количество участников, которые подали заявку, но уже распределены на другие мероприятия волны"""
@@ -787,33 +843,13 @@ class EventWithRegistrationInfoSerializer(BaseEventSerializer):
     def get_available_without_unassigned_events(self, obj):
         """Количество участников, которые подали заявку, не попали на другие мероприятия волны 
         И не имеют заявок на мероприятия, где еще не было распределения (0 привязанных участников)"""
-        # Получаем участников через регистрацию
-        registration_participant_ids = set()
-        if hasattr(obj, 'registration') and obj.registration:
-            if obj.registration.registration_type == EventRegistration.RegistrationType.BUTTON:
-                    # Для типа button участники в event_group
-                    # ИСПОЛЬЗУЕМ get_group_participant_ids вместо get_participants().values_list() для избежания запросов к БД
-                    if obj.event_group:
-                        registration_participant_ids = self._get_group_participant_ids(
-                            obj.event_group
-                        )
-            else:
-                # Для типа application участники в applicants
-                # ИСПОЛЬЗУЕМ prefetch'нутые данные
-                if hasattr(obj.registration, '_prefetched_objects_cache') and 'applicants' in obj.registration._prefetched_objects_cache:
-                    registration_participant_ids = {app.id for app in obj.registration._prefetched_objects_cache['applicants']}
-                else:
-                    # Fallback: если prefetch не сработал
-                    registration_participant_ids = set(
-                        obj.registration.applicants.values_list('id', flat=True)
-                    )
+        wave_data = self._get_wave_data(obj)
+        registration_participant_ids = self._get_registration_participant_ids(obj, wave_data)
         
         if not registration_participant_ids:
             return 0
         
-        wave_data = self._get_wave_data(obj)
-        
-        if not wave_data['wave']:
+        if wave_data['wave_id'] is None:
             # Если нет волны, все участники доступны
             return len(registration_participant_ids)
         
@@ -821,9 +857,7 @@ class EventWithRegistrationInfoSerializer(BaseEventSerializer):
         # И участников, которые имеют заявки на нераспределенные мероприятия
         excluded_participants = (wave_data['assigned_participant_ids'] | 
                                 wave_data['participants_with_unassigned_registrations'])
-        available_count = len(registration_participant_ids - excluded_participants)
-        
-        return available_count
+        return len(registration_participant_ids - excluded_participants)
     
     def get_can_convert(self, obj):
         """Можно ли конвертировать регистрации для этого мероприятия"""
@@ -1063,27 +1097,31 @@ class LocationSerializer(serializers.ModelSerializer):
         serializer = self.__class__(children, many=True, context=context)
         return serializer.data
     
+    def _get_location_index(self, obj):
+        """Индекс локаций из контекста, если он содержит локацию."""
+        location_index = self.context.get('location_index') if hasattr(self, 'context') else None
+        if location_index is not None and obj.id in location_index:
+            return location_index
+        return None
+
     def get_full_path(self, obj):
         """Возвращает полный путь локации от корня до текущей локации"""
-        path = []
-        current = obj
-        
-        # Собираем путь от текущей локации до корня
-        while current:
-            path.insert(0, current.name)
-            current = current.parent
-        
-        return ', '.join(path)
+        location_index = self._get_location_index(obj)
+        if location_index is not None:
+            return location_index.full_path(obj.id)
+
+        return ', '.join([*(item.name for item in obj.get_ancestors()), obj.name])
     
     def get_effective_address(self, obj):
         """Возвращает адрес локации или адрес ближайшего родителя с адресом"""
-        current = obj
-        
+        location_index = self._get_location_index(obj)
+        if location_index is not None:
+            return location_index.effective_address(obj.id)
+
         # Ищем адрес у текущей локации или у ближайшего родителя
-        while current:
-            if current.address:
-                return current.address
-            current = current.parent
+        for item in [obj, *reversed(obj.get_ancestors())]:
+            if item.address:
+                return item.address
         
         return None
     
@@ -1301,6 +1339,10 @@ class EventSerializer(serializers.ModelSerializer):
 
     def get_registrations_count(self, obj):
         """Получить количество записанных участников"""
+        agenda = self.context.get('agenda')
+        if agenda is not None:
+            return agenda.registered_counts.get(obj.id, 0)
+
         # Проверяем, есть ли настройка регистрации
         if hasattr(obj, 'registration'):
             all_participant_ids = self.context.get('all_participant_ids')
@@ -1342,6 +1384,11 @@ class EventSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         participant_id = self.context.get('participant_id')
         
+        # Индекс мероприятий участников (AgendaIndex) уже содержит ответ
+        agenda = self.context.get('agenda')
+        if agenda is not None and participant_id:
+            return agenda.is_registered(participant_id, obj.id)
+        
         # ИСПОЛЬЗУЕМ participant из контекста вместо запроса к БД
         # Сначала проверяем, есть ли уже загруженный participant в контексте
         participant = self.context.get('current_participant')
@@ -1398,6 +1445,10 @@ class EventSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         participant_id = self.context.get('participant_id')
         
+        agenda = self.context.get('agenda')
+        if agenda is not None and participant_id:
+            return agenda.is_participant(participant_id, obj.id)
+        
         # ИСПОЛЬЗУЕМ participant из контекста вместо запроса к БД
         # Сначала проверяем, есть ли уже загруженный participant в контексте
         participant = self.context.get('current_participant')
@@ -1439,6 +1490,10 @@ class EventSerializer(serializers.ModelSerializer):
     
     def get_participants_count(self, obj):
         """Получить количество участников по группе (всегда, если группа есть)"""
+        agenda = self.context.get('agenda')
+        if agenda is not None:
+            return agenda.participant_counts.get(obj.id, 0)
+        
         # Если группы нет, возвращаем 0
         if not obj.event_group:
             return 0
@@ -1474,9 +1529,52 @@ class EventSerializer(serializers.ModelSerializer):
         """Валидация на уровне объекта"""
         # participant_type теперь вычисляется автоматически из event_group
         # max_participants теперь только в EventRegistration, не валидируем здесь
-        
+        self._validate_location_double_booking(data)
         return data
 
+    def _validate_location_double_booking(self, data):
+        """Запрет пересекающихся мероприятий в одной локации (если включен в eventum)"""
+        eventum = self.context.get('eventum')
+        if not getattr(eventum, 'forbid_location_double_booking', False):
+            return
+        # Массовый импорт проверяет все мероприятия вместе, см. EventViewSet.bulk_import
+        if self.context.get('skip_location_conflicts'):
+            return
+        if self.instance is not None and not ({'locations', 'start_time', 'end_time'} & data.keys()):
+            return
+
+        start = data.get('start_time', getattr(self.instance, 'start_time', None))
+        end = data.get('end_time', getattr(self.instance, 'end_time', None))
+        if 'locations' in data:
+            locations = data['locations'] or []
+        elif self.instance is not None:
+            locations = list(self.instance.locations.all())
+        else:
+            locations = []
+        if not locations or start is None or end is None:
+            return
+
+        conflicts = find_location_conflicts(
+            eventum,
+            [(start, end, [location.id for location in locations], getattr(self.instance, 'pk', None))]
+        )
+        if not conflicts:
+            return
+
+        location_names = {location.id: location.name for location in locations}
+        events = {
+            event['id']: event
+            for event in Event.objects.filter(id__in={item['event_id'] for item in conflicts}).values('id', 'name', 'start_time', 'end_time')
+        }
+        raise serializers.ValidationError({
+            'location_ids': [
+                f"Локация {location_names[item['location_id']]} уже занята мероприятием "
+                f"{events[item['event_id']]['name']} ({events[item['event_id']]['start_time']:%d.%m %H:%M}"
+                f"–{events[item['event_id']]['end_time']:%H:%M})"
+                for item in conflicts
+            ]
+        })
+
     def validate_location_ids(self, value):
         """Валидация location_ids - локации должны принадлежать тому же eventum"""
         if not value:
@@ -1730,3 +1828,112 @@ class EventRegistrationSerializer(serializers.ModelSerializer):
                         all_participant_ids.add(participant_relation.participant_id)
         
         return len(all_participant_ids)
+
+
+class EventRegistrationSetupItemSerializer(serializers.Serializer):
+    """Настройка регистрации для одного мероприятия в массовой операции"""
+    event_id = serializers.IntegerField()
+    registration_type = serializers.ChoiceField(
+        choices=EventRegistration.RegistrationType.choices,
+        default=EventRegistration.RegistrationType.BUTTON
+    )
+    max_participants = serializers.IntegerField(min_value=0, required=False, allow_null=True, default=None)
+    allowed_group = serializers.IntegerField(required=False, allow_null=True, default=None)
+
+
+class EventRegistrationBulkSetupSerializer(serializers.Serializer):
+    """
+    Массовая настройка регистрации: для каждого мероприятия создает event_group
+    (если ее еще нет), привязывает ее к мероприятию и создает EventRegistration.
+    Все проверки выполняются в памяти по данным, загруженным одним набором запросов,
+    а записи создаются через bulk_create/bulk_update.
+    """
+    registrations = EventRegistrationSetupItemSerializer(many=True, allow_empty=False)
+
+    def validate_registrations(self, items):
+        eventum = self.context['eventum']
+
+        event_ids = [item['event_id'] for item in items]
+        allowed_group_ids = {item['allowed_group'] for item in items if item['allowed_group'] is not None}
+
+        events = {
+            event.id: event
+            for event in Event.objects.filter(eventum=eventum, id__in=event_ids).only(
+                'id', 'name', 'eventum_id', 'event_group_id'
+            )
+        }
+        registered_event_ids = set(
+            EventRegistration.objects.filter(event_id__in=events.keys()).values_list('event_id', flat=True)
+        )
+        existing_group_ids = set(
+            ParticipantGroup.objects.filter(eventum=eventum, id__in=allowed_group_ids).values_list('id', flat=True)
+        ) if allowed_group_ids else set()
+
+        errors = []
+        seen_event_ids = set()
+        for item in items:
+            item_errors = {}
+            event_id = item['event_id']
+            if event_id not in events:
+                item_errors['event_id'] = f'Event with ID {event_id} does not exist in this eventum'
+            elif event_id in registered_event_ids:
+                item_errors['event_id'] = 'Event already has a registration'
+            elif event_id in seen_event_ids:
+                item_errors['event_id'] = 'Event is listed more than once'
+            seen_event_ids.add(event_id)
+
+            if item['allowed_group'] is not None and item['allowed_group'] not in existing_group_ids:
+                item_errors['allowed_group'] = 'Group must belong to the same eventum'
+            errors.append(item_errors)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        self._events = events
+        return items
+
+    def create(self, validated_data):
+        eventum = self.context['eventum']
+        items = validated_data['registrations']
+        events = self._events
+
+        with transaction.atomic():
+            # Группы мероприятий создаем только для мероприятий, у которых их еще нет
+            events_without_group = [
+                events[item['event_id']]
+                for item in items
+                if not events[item['event_id']].event_group_id
+            ]
+            created_groups = ParticipantGroup.objects.bulk_create([
+                ParticipantGroup(eventum=eventum, name=event.name, is_event_group=True)
+                for event in events_without_group
+            ])
+            for event, group in zip(events_without_group, created_groups):
+                event.event_group_id = group.id
+            if events_without_group:
+                Event.objects.bulk_update(events_without_group, ['event_group'])
+
+            registrations = EventRegistration.objects.bulk_create([
+                EventRegistration(
+                    event_id=item['event_id'],
+                    registration_type=item['registration_type'],
+                    max_participants=item['max_participants'],
+                    allowed_group_id=item['allowed_group'],
+                )
+                for item in items
+            ])
+
+            # bulk-операции не вызывают сигналы - обновляем версии данных eventum явно
+            bump_eventum_versions(eventum.id, schedule=True, membership=True)
+
+        return {
+            'registrations': [
+                {
+                    'id': registration.id,
+                    'event_id': registration.event_id,
+                    'event_group_id': events[registration.event_id].event_group_id,
+                }
+                for registration in registrations
+            ],
+            'created_group_ids': [group.id for group in created_groups],
+        }
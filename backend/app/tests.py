@@ -1,22 +1,37 @@
-from datetime import timedelta
+import json
+from datetime import datetime, timedelta
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from . import caching
+from .auth_utils import ViewerContext
+from .authentication import QueryTokenAuthentication, get_tokens_for_user
+from .caching import get_eventum_by_slug
 from .models import (
     Event,
+    EventRegistration,
     EventTag,
+    EventWave,
     Eventum,
     Location,
     Participant,
+    ParticipantGroup,
+    ParticipantGroupGroupRelation,
+    ParticipantGroupParticipantRelation,
     UserProfile,
     UserRole,
 )
+from .pagination import KeysetPagination
+from .schedule import IntervalIndex
+from .waves import WaveAggregates
 
 
 class SlugGenerationTests(TestCase):
@@ -167,6 +182,20 @@ class LocationModelValidationTests(TestCase):
         with self.assertRaises(ValidationError):
             self.root.full_clean()
 
+    def test_materialized_path_follows_subtree_moves(self):
+        other_root = Location.objects.create(eventum=self.eventum, name="Other Venue", kind=Location.Kind.VENUE)
+        building = Location.objects.create(eventum=self.eventum, name="Building", kind=Location.Kind.BUILDING, parent=self.root)
+        room = Location.objects.create(eventum=self.eventum, name="Room", kind=Location.Kind.ROOM, parent=building)
+        self.assertEqual(room.path, f"/{self.root.id}/{building.id}/{room.id}/")
+
+        building.parent = other_root
+        building.save()
+
+        room.refresh_from_db()
+        self.assertEqual(room.path, f"/{other_root.id}/{building.id}/{room.id}/")
+        self.assertEqual(list(other_root.get_descendants().order_by('id')), [building, room])
+        self.assertEqual([item.name for item in room.get_ancestors()], ["Other Venue", "Building"])
+
     def test_slug_conflict_is_resolved_on_save(self):
         Location.objects.create(eventum=self.eventum, name="Hall", slug="shared")
         duplicate = Location.objects.create(eventum=self.eventum, name="Other Hall", slug="shared")
@@ -240,6 +269,8 @@ class APISlugAndValidationTests(APITestCase):
 
 class PerformanceQueryTests(APITestCase):
     def setUp(self):
+        # Ключи кэша - (ID eventum, версия), а SQLite повторно использует ID между тестами
+        cache.clear()
         self.user = UserProfile.objects.create_user(vk_id=9001, name="Perf User")
         self.eventum = Eventum.objects.create(name="Performance Eventum")
         UserRole.objects.create(user=self.user, eventum=self.eventum, role='organizer')
@@ -272,6 +303,76 @@ class PerformanceQueryTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 5)
 
+    def test_viewer_context_loads_role_and_participant_once(self):
+        participant = Participant.objects.create(eventum=self.eventum, user=self.user, name="Perf User")
+        viewer = ViewerContext(self.user, self.eventum)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(viewer.role, 'organizer')
+            self.assertEqual(viewer.participant.id, participant.id)
+            self.assertEqual(viewer.participant.eventum, self.eventum)
+            self.assertEqual(viewer.participant.user, self.user)
+
+        outsider = UserProfile.objects.create_user(vk_id=9002, name="Outsider")
+        with self.assertNumQueries(1):
+            self.assertIsNone(ViewerContext(outsider, self.eventum).role)
+
+    def test_membership_is_cached_across_requests_and_invalidated(self):
+        caching._memberships.clear()
+        self.assertEqual(ViewerContext(self.user, self.eventum).role, 'organizer')
+        hits = caching.get_cache_stats()['memberships'].get('hits', 0)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(ViewerContext(self.user, self.eventum).role, 'organizer')
+        self.assertEqual(caching.get_cache_stats()['memberships']['hits'], hits + 1)
+
+        UserRole.objects.filter(user=self.user, eventum=self.eventum).get().delete()
+        self.assertIsNone(ViewerContext(self.user, self.eventum).role)
+
+        Participant.objects.create(eventum=self.eventum, user=self.user, name="Perf User")
+        self.assertEqual(ViewerContext(self.user, self.eventum).role, 'participant')
+
+    def test_relinked_participant_drops_previous_user_membership(self):
+        member = UserProfile.objects.create_user(vk_id=9003, name="Member")
+        participant = Participant.objects.create(eventum=self.eventum, user=member, name="Member")
+        self.assertEqual(ViewerContext(member, self.eventum).role, 'participant')
+
+        participant.user = None
+        participant.save()
+        self.assertIsNone(ViewerContext(member, self.eventum).role)
+
+    def test_healthz_hides_cache_stats_from_anonymous_callers(self):
+        self.client.logout()
+        response = self.client.get(reverse('health_check'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('caches', response.json())
+
+    def test_eventum_slug_lookup_is_cached_and_invalidated(self):
+        get_eventum_by_slug(self.eventum.slug)
+        with self.assertNumQueries(0):
+            eventum = get_eventum_by_slug(self.eventum.slug)
+        self.assertEqual(eventum.id, self.eventum.id)
+        self.assertTrue(eventum.registration_open)
+
+        self.eventum.registration_open = False
+        self.eventum.save()
+        self.assertFalse(get_eventum_by_slug(self.eventum.slug).registration_open)
+        self.assertIsNone(get_eventum_by_slug('missing-eventum'))
+
+    @override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'eventum-tests'}},
+        EVENTUM_LOCAL_CACHE_TIMEOUT=0,
+    )
+    def test_eventum_changed_by_another_worker_is_seen_with_local_cache(self):
+        caching._eventums.clear()
+        self.assertTrue(get_eventum_by_slug(self.eventum.slug).registration_open)
+
+        # Изменение в другом воркере: инвалидация до этого процесса не доходит
+        Eventum.objects.filter(pk=self.eventum.pk).update(registration_open=False, membership_version=7)
+        eventum = get_eventum_by_slug(self.eventum.slug)
+        self.assertFalse(eventum.registration_open)
+        self.assertEqual(eventum.membership_version, 7)
+
     def test_locations_tree_builds_single_query_map(self):
         parent = Location.objects.create(eventum=self.eventum, name="Venue", kind=Location.Kind.VENUE)
         buildings = [
@@ -288,11 +389,46 @@ class PerformanceQueryTests(APITestCase):
                 )
 
         url = reverse('location-tree', kwargs={'eventum_slug': self.eventum.slug})
-        with self.assertNumQueries(4):
+        with self.assertNumQueries(2):
             response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
+        self.assertEqual([item['name'] for item in response.data[0]['children']], ["Building 0", "Building 1", "Building 2"])
+        self.assertEqual(response.data[0]['children'][0]['children'][0]['full_path'], "Venue, Building 0, Room Building 0-0")
+
+        response = self.client.get(url, {'format': 'flat'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 13)
+        self.assertEqual(response.data[1]['parent_id'], parent.id)
+        self.assertNotIn('children', response.data[0])
+
+    def test_token_user_is_built_from_token_id(self):
+        caching._users.clear()
+        authentication = QueryTokenAuthentication()
+        token = get_tokens_for_user(self.user).access_token
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        with self.assertNumQueries(0):
+            user, _ = authentication.authenticate(request)
+            self.assertEqual(user.id, self.user.id)
+            self.assertTrue(user.is_authenticated)
+
+        UserProfile.objects.filter(pk=self.user.pk).update(name="Renamed User")
+        with self.assertNumQueries(1):
+            self.assertEqual((user.name, user.vk_id), ("Renamed User", 9001))
+            self.assertTrue(user.is_active)
+
+        with self.assertRaises(InvalidToken):
+            authentication.authenticate(APIRequestFactory().get('/', HTTP_AUTHORIZATION="Bearer broken"))
+        self.assertIsNone(authentication.authenticate(APIRequestFactory().get('/', {'token': 'broken'})))
+
+    def test_token_of_deleted_user_is_rejected(self):
+        token = get_tokens_for_user(self.user).access_token
+        self.user.delete()
+
+        response = self.client.get(reverse('user_profile'), HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
     def test_user_roles_endpoint_avoids_n_plus_one(self):
         for idx in range(5):
@@ -300,7 +436,7 @@ class PerformanceQueryTests(APITestCase):
             UserRole.objects.create(user=self.user, eventum=new_eventum, role='organizer')
 
         url = reverse('user_roles')
-        with self.assertNumQueries(2):
+        with self.assertNumQueries(1):
             response = self.client.get(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -366,3 +502,849 @@ class PerformanceQueryTests(APITestCase):
             response = self.client.put(url, payload, format='json')
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class RegistrationConflictTests(APITestCase):
+    def setUp(self):
+        self.eventum = Eventum.objects.create(name="Conflict Eventum", forbid_overlapping_registrations=True)
+        self.user = UserProfile.objects.create_user(vk_id=9101, name="Conflict User")
+        self.participant = Participant.objects.create(eventum=self.eventum, user=self.user, name="Conflict User")
+        self.organizer = UserProfile.objects.create_user(vk_id=9102, name="Conflict Organizer")
+        UserRole.objects.create(user=self.organizer, eventum=self.eventum, role='organizer')
+
+        start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        self.morning = self._create_event("Morning", start, start + timedelta(hours=2))
+        self.overlapping = self._create_event("Overlapping", start + timedelta(hours=1), start + timedelta(hours=3))
+        self.adjacent = self._create_event("Adjacent", start + timedelta(hours=2), start + timedelta(hours=4))
+
+    def _create_event(self, name, start_time, end_time):
+        event = Event.objects.create(eventum=self.eventum, name=name, start_time=start_time, end_time=end_time)
+        EventRegistration.objects.create(
+            event=event,
+            registration_type=EventRegistration.RegistrationType.APPLICATION,
+        )
+        return event
+
+    def _register(self, event):
+        url = reverse('event-register', kwargs={'eventum_slug': self.eventum.slug, 'pk': event.id})
+        return self.client.post(url)
+
+    def test_interval_index_uses_half_open_intervals(self):
+        index = IntervalIndex([(0, 10, 'a'), (2, 3, 'b'), (10, 12, 'c')])
+
+        self.assertEqual([item[2] for item in index.overlapping(9, 11)], ['a', 'c'])
+        self.assertEqual([item[2] for item in index.overlapping(4, 9)], ['a'])
+        self.assertFalse(index.has_overlap(12, 20))
+
+    def test_overlapping_registration_is_rejected(self):
+        self.client.force_authenticate(self.user)
+
+        self.assertEqual(self._register(self.morning).status_code, status.HTTP_201_CREATED)
+
+        response = self._register(self.overlapping)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([item['id'] for item in response.data['conflicts']], [self.morning.id])
+
+        self.assertEqual(self._register(self.adjacent).status_code, status.HTTP_201_CREATED)
+
+    def test_organizer_report_lists_conflicts(self):
+        self.morning.registration.applicants.add(self.participant)
+        self.overlapping.registration.applicants.add(self.participant)
+        self.adjacent.registration.applicants.add(self.participant)
+
+        self.client.force_authenticate(self.organizer)
+        url = reverse('event-registration-conflicts', kwargs={'eventum_slug': self.eventum.slug})
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        pairs = {tuple(item['id'] for item in conflict['events']) for conflict in response.data['conflicts']}
+        self.assertEqual(pairs, {(self.morning.id, self.overlapping.id), (self.overlapping.id, self.adjacent.id)})
+
+
+class WaveAggregatesTests(TestCase):
+    def test_assigned_elsewhere_is_union_of_other_events(self):
+        aggregates = WaveAggregates(
+            wave_id=1,
+            event_members={10: {1, 2}, 20: {2, 3}, 30: {4}},
+            counted_event_ids=[10, 20],
+        )
+
+        self.assertEqual(aggregates.assigned_elsewhere(10), {2, 3})
+        self.assertEqual(aggregates.assigned_elsewhere(20), {1, 2})
+        self.assertEqual(aggregates.assigned_elsewhere(30), {1, 2, 3})
+
+    def test_serializer_loads_wave_once(self):
+        from .serializers import EventWithRegistrationInfoSerializer
+
+        eventum = Eventum.objects.create(name="Wave Eventum")
+        participants = [Participant.objects.create(eventum=eventum, name=f"P{idx}") for idx in range(3)]
+        wave = EventWave.objects.create(eventum=eventum, name="Wave")
+        events = []
+        for idx in range(4):
+            event = Event.objects.create(
+                eventum=eventum,
+                name=f"Wave Event {idx}",
+                start_time=timezone.now(),
+                end_time=timezone.now() + timedelta(hours=1),
+            )
+            event.event_group = ParticipantGroup.objects.create(eventum=eventum, name=f"Wave Event {idx}", is_event_group=True)
+            event.save()
+            registration = EventRegistration.objects.create(
+                event=event,
+                registration_type=EventRegistration.RegistrationType.APPLICATION,
+            )
+            registration.applicants.set(participants[:idx])
+            wave.registrations.add(registration)
+            events.append(event)
+
+        events = list(Event.objects.filter(eventum=eventum).select_related('eventum', 'registration').order_by('id'))
+        with self.assertNumQueries(2):
+            data = EventWithRegistrationInfoSerializer(events, many=True).data
+
+        self.assertEqual([item['available_participants'] for item in data], [0, 0, 0, 1])
+
+    def test_wave_summary_uses_fixed_number_of_queries(self):
+        eventum = Eventum.objects.create(name="Summary Eventum")
+        organizer = UserProfile.objects.create_user(vk_id=9201, name="Summary Organizer")
+        UserRole.objects.create(user=organizer, eventum=eventum, role='organizer')
+        participants = [Participant.objects.create(eventum=eventum, name=f"S{idx}") for idx in range(3)]
+
+        for wave_idx in range(2):
+            wave = EventWave.objects.create(eventum=eventum, name=f"Wave {wave_idx}")
+            for idx in range(3):
+                event = Event.objects.create(
+                    eventum=eventum,
+                    name=f"Summary {wave_idx}-{idx}",
+                    start_time=timezone.now(),
+                    end_time=timezone.now() + timedelta(hours=1),
+                )
+                registration = EventRegistration.objects.create(
+                    event=event,
+                    registration_type=EventRegistration.RegistrationType.APPLICATION,
+                    max_participants=idx + 1,
+                )
+                registration.applicants.set(participants[:idx])
+                wave.registrations.add(registration)
+
+        self.client = APIClient()
+        self.client.force_authenticate(organizer)
+        url = reverse('eventwave-summary', kwargs={'eventum_slug': eventum.slug})
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual([item['registered_count'] for item in response.data[0]['registrations']], [0, 1, 2])
+        self.assertEqual([item['max_participants'] for item in response.data[1]['registrations']], [1, 2, 3])
+
+
+class MembershipMatrixTests(TestCase):
+    def test_matrix_aggregates(self):
+        from .analytics import MembershipMatrix
+
+        matrix = MembershipMatrix([1, 2, 3, 4], {10: [1, 2], 20: [2, 3], 30: [2]})
+
+        self.assertEqual(matrix.co_occurrence(), [(10, 20, 1), (10, 30, 1), (20, 30, 1)])
+        self.assertEqual(matrix.empty_rows(), [4])
+        self.assertEqual(matrix.row_count_distribution(), {0: 1, 1: 2, 3: 1})
+
+    def test_wave_report_endpoint(self):
+        eventum = Eventum.objects.create(name="Matrix Eventum")
+        organizer = UserProfile.objects.create_user(vk_id=9301, name="Matrix Organizer")
+        UserRole.objects.create(user=organizer, eventum=eventum, role='organizer')
+        participants = [Participant.objects.create(eventum=eventum, name=f"M{idx}") for idx in range(3)]
+        wave = EventWave.objects.create(eventum=eventum, name="Matrix Wave")
+        for idx in range(2):
+            event = Event.objects.create(
+                eventum=eventum,
+                name=f"Matrix {idx}",
+                start_time=timezone.now() + timedelta(hours=idx),
+                end_time=timezone.now() + timedelta(hours=idx + 1),
+            )
+            registration = EventRegistration.objects.create(
+                event=event,
+                registration_type=EventRegistration.RegistrationType.APPLICATION,
+            )
+            registration.applicants.set(participants[idx:idx + 2])
+            wave.registrations.add(registration)
+
+        client = APIClient()
+        client.force_authenticate(organizer)
+        url = reverse('event-membership-matrix', kwargs={'eventum_slug': eventum.slug})
+        response = client.get(url, {'wave': wave.id})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['count'] for item in response.data['co_occurrence']], [1])
+        self.assertEqual(len(response.data['unassigned']), 3)
+        self.assertEqual(
+            response.data['applications_distribution'],
+            [{'applications_count': 1, 'participants_count': 2}, {'applications_count': 2, 'participants_count': 1}],
+        )
+
+
+class RegistrationBulkSetupTests(APITestCase):
+    def setUp(self):
+        self.eventum = Eventum.objects.create(name="Bulk Setup Eventum")
+        self.organizer = UserProfile.objects.create_user(vk_id=9401, name="Bulk Organizer")
+        UserRole.objects.create(user=self.organizer, eventum=self.eventum, role='organizer')
+        self.client.force_authenticate(self.organizer)
+        self.url = reverse('eventregistration-bulk-setup', kwargs={'eventum_slug': self.eventum.slug})
+        self.events = [
+            Event.objects.create(
+                eventum=self.eventum,
+                name=f"Workshop {idx}",
+                start_time=timezone.now(),
+                end_time=timezone.now() + timedelta(hours=1),
+            )
+            for idx in range(5)
+        ]
+
+    def test_bulk_setup_creates_groups_and_registrations(self):
+        allowed_group = ParticipantGroup.objects.create(eventum=self.eventum, name="Allowed")
+        payload = {'registrations': [
+            {'event_id': event.id, 'max_participants': 10, 'allowed_group': allowed_group.id}
+            for event in self.events
+        ]}
+
+        with self.assertNumQueries(10):
+            response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['created_group_ids']), 5)
+        for event in self.events:
+            event.refresh_from_db()
+            self.assertTrue(event.event_group.is_event_group)
+            self.assertEqual(event.registration.max_participants, 10)
+
+    def test_bulk_setup_reports_all_errors(self):
+        EventRegistration.objects.create(
+            event=self.events[0],
+            registration_type=EventRegistration.RegistrationType.APPLICATION,
+        )
+        payload = {'registrations': [
+            {'event_id': self.events[0].id},
+            {'event_id': self.events[1].id},
+            {'event_id': 999999},
+        ]}
+
+        response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.data['registrations']
+        self.assertIn('event_id', errors[0])
+        self.assertEqual(errors[1], {})
+        self.assertIn('event_id', errors[2])
+        self.assertFalse(EventRegistration.objects.filter(event=self.events[1]).exists())
+
+
+class CalendarFeedTests(APITestCase):
+    def setUp(self):
+        from app.agenda import _agenda_cache
+
+        cache.clear()
+        _agenda_cache.clear()
+        self.eventum = Eventum.objects.create(name="Calendar Eventum")
+        self.participant = Participant.objects.create(eventum=self.eventum, name="Calendar Participant")
+        start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        self.venue = Location.objects.create(eventum=self.eventum, name="Venue", kind=Location.Kind.VENUE, address="Main st. 1")
+        self.room = Location.objects.create(eventum=self.eventum, name="Hall", kind=Location.Kind.BUILDING, parent=self.venue)
+        self.event = Event.objects.create(eventum=self.eventum, name="Opening", start_time=start, end_time=start + timedelta(hours=1))
+        self.event.locations.add(self.room)
+        self.url = reverse('participant_calendar_ics_with_id', kwargs={'eventum_slug': self.eventum.slug, 'participant_id': self.participant.id})
+
+    def test_calendar_body_is_stable_and_supports_etag(self):
+        first = self.client.get(self.url)
+        second = self.client.get(self.url)
+
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.content, second.content)
+        self.assertIn('Место: Venue\\, Hall (Main st. 1)', first.content.decode().replace('\r\n ', ''))
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_changes_with_schedule_version(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.name = "Renamed"
+            self.event.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'Renamed', response.content)
+
+    def test_location_index_describes_shared_prefix(self):
+        from app.locations import LocationIndex
+
+        second = Location.objects.create(eventum=self.eventum, name="Hall B", kind=Location.Kind.BUILDING, parent=self.venue, address="Side st. 2")
+        index = LocationIndex.build(self.eventum)
+
+        self.assertEqual(index.full_path(self.room.id), 'Venue, Hall')
+        self.assertEqual(index.effective_address(self.room.id), 'Main st. 1')
+        self.assertEqual(
+            index.describe((self.room.id, second.id)),
+            'Место: Venue; Hall (Main st. 1); Hall B (Side st. 2)'
+        )
+        self.assertEqual(
+            index.describe((self.venue.id, self.room.id)),
+            'Место: Venue (Main st. 1); Venue; Hall'
+        )
+
+    def test_fragment_assembly_matches_full_render(self):
+        from app.ics import assemble_calendar, build_calendar, build_event_component, render_calendar_header, render_event_fragments
+
+        later = Event.objects.create(
+            eventum=self.eventum, name="Closing",
+            start_time=self.event.start_time + timedelta(hours=2), end_time=self.event.end_time + timedelta(hours=2)
+        )
+        full = build_calendar("Name", "Description")
+        full.add_component(build_event_component(self.event, self.eventum, 'Место: Venue, Hall (Main st. 1)'))
+        full.add_component(build_event_component(later, self.eventum))
+
+        fragments = render_event_fragments(self.eventum)
+        assembled = assemble_calendar(
+            render_calendar_header("Name", "Description"),
+            [fragments[self.event.id], fragments[later.id]]
+        )
+        self.assertEqual(assembled, full.to_ical())
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'ics-fragments'}})
+    def test_event_change_rerenders_only_its_fragment(self):
+        from app.ics import get_event_fragments
+
+        start = self.event.start_time + timedelta(days=1)
+        later = Event.objects.create(eventum=self.eventum, name="Closing", start_time=start, end_time=start + timedelta(hours=1))
+        get_event_fragments(Eventum.objects.get(pk=self.eventum.pk), [self.event.id, later.id])
+
+        # Без изменения updated_at блок мероприятия берется из кэша
+        Event.objects.filter(pk=later.pk).update(name="Not rendered")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.name = "Renamed"
+            self.event.save()
+
+        opening, closing = get_event_fragments(Eventum.objects.get(pk=self.eventum.pk), [self.event.id, later.id])
+        self.assertIn(b'SUMMARY:Renamed', opening)
+        self.assertIn(b'SUMMARY:Closing', closing)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'ics-slug'}})
+    def test_slug_change_rerenders_fragment_uids(self):
+        from app.ics import get_event_fragments
+
+        get_event_fragments(Eventum.objects.get(pk=self.eventum.pk), [self.event.id])
+        # Смена slug без сигналов: версия расписания и updated_at не меняются
+        Eventum.objects.filter(pk=self.eventum.pk).update(slug="renamed-calendar")
+
+        fragment, = get_event_fragments(Eventum.objects.get(pk=self.eventum.pk), [self.event.id])
+        self.assertIn(f'UID:event-{self.event.id}-renamed-calendar@eventum.local'.encode(), fragment)
+
+    def test_export_calendars_matches_participant_feeds(self):
+        import os
+        import tempfile
+        import zipfile
+        from app.calendar_export import export_calendars
+        from app.ics import render_participant_calendar
+
+        other = Participant.objects.create(eventum=self.eventum, name="Other Participant")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive_path = os.path.join(tmp_dir, 'calendars.zip')
+            stats = export_calendars(self.eventum, archive_path, workers=2, chunk_size=1)
+
+            self.assertEqual(stats['participants_count'], 2)
+            with zipfile.ZipFile(archive_path) as archive:
+                for participant in (self.participant, other):
+                    self.assertEqual(
+                        archive.read(f'eventum-{self.eventum.slug}-{participant.id}.ics'),
+                        render_participant_calendar(self.eventum, participant)
+                    )
+
+    def test_calendar_export_reuses_running_job_and_cleans_old_exports(self):
+        import os
+        import tempfile
+        import uuid
+        from app.calendar_export import get_export_paths, write_export_status
+
+        organizer = UserProfile.objects.create_user(vk_id=9701, name="Export Organizer")
+        UserRole.objects.create(user=organizer, eventum=self.eventum, role='organizer')
+        self.client.force_authenticate(organizer)
+
+        with tempfile.TemporaryDirectory() as tmp_dir, override_settings(CALENDAR_EXPORT_ROOT=tmp_dir):
+            old_job, running_job = uuid.uuid4(), uuid.uuid4()
+            old_archive, old_status = get_export_paths(self.eventum, old_job.hex)
+            write_export_status(old_status, status='done')
+            open(old_archive, 'wb').close()
+            os.utime(old_status, (0, 0))
+            _, running_status = get_export_paths(self.eventum, running_job.hex)
+            write_export_status(running_status, status='running')
+
+            response = self.client.post(reverse('calendar_export_start', kwargs={'slug': self.eventum.slug}))
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(response.data['job_id'], str(running_job))
+            self.assertFalse(os.path.exists(old_status) or os.path.exists(old_archive))
+
+            # Статус есть, а архив удален - 404, а не ошибка сервера
+            write_export_status(running_status, status='done')
+            response = self.client.get(reverse('calendar_export_download', kwargs={'slug': self.eventum.slug, 'job_id': running_job}))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_public_feed_filters_by_location_subtree_and_tag(self):
+        tag = EventTag.objects.create(eventum=self.eventum, name="Workshop")
+        start = self.event.start_time + timedelta(days=1)
+        tagged = Event.objects.create(eventum=self.eventum, name="Tagged", start_time=start, end_time=start + timedelta(hours=1))
+        tagged.tags.add(tag)
+        url = reverse('calendar_feed_ics', kwargs={'eventum_slug': self.eventum.slug})
+
+        response = self.client.get(url, {'location': self.venue.id})
+        body = b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'SUMMARY:Opening', body)
+        self.assertNotIn(b'SUMMARY:Tagged', body)
+
+        response = self.client.get(url, {'tag': tag.id})
+        body = b''.join(response.streaming_content)
+        self.assertIn(b'SUMMARY:Tagged', body)
+        self.assertNotIn(b'SUMMARY:Opening', body)
+
+        response = self.client.get(url, {'all': 1})
+        self.assertEqual(b''.join(response.streaming_content).count(b'BEGIN:VEVENT'), 2)
+
+        response = self.client.get(url, {'all': 1}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class LocationOccupancyTests(APITestCase):
+    def setUp(self):
+        from app.occupancy import _occupancy_cache
+
+        cache.clear()
+        _occupancy_cache.clear()
+        self.eventum = Eventum.objects.create(name="Occupancy Eventum")
+        self.venue = Location.objects.create(eventum=self.eventum, name="Venue", kind=Location.Kind.VENUE)
+        self.building = Location.objects.create(eventum=self.eventum, name="Building", kind=Location.Kind.BUILDING, parent=self.venue)
+        self.room_a = Location.objects.create(eventum=self.eventum, name="Room A", kind=Location.Kind.ROOM, parent=self.building)
+        self.room_b = Location.objects.create(eventum=self.eventum, name="Room B", kind=Location.Kind.ROOM, parent=self.building)
+        self.start = datetime(2030, 1, 1, 10, 0)
+        self.event = Event.objects.create(eventum=self.eventum, name="Lecture", start_time=self.start, end_time=self.start + timedelta(hours=1))
+        self.event.locations.add(self.room_a)
+
+    def test_free_locations_and_timeline(self):
+        url = reverse('location-free', kwargs={'eventum_slug': self.eventum.slug})
+        response = self.client.get(url, {'start': self.start.isoformat(), 'end': (self.start + timedelta(minutes=30)).isoformat()})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data], [self.room_b.id])
+
+        url = reverse('location-timeline', kwargs={'eventum_slug': self.eventum.slug, 'pk': self.building.id})
+        response = self.client.get(url)
+        self.assertEqual([item['id'] for item in response.data['events']], [self.event.id])
+
+    def test_index_is_refreshed_incrementally(self):
+        from app.occupancy import get_occupancy_index
+
+        index = get_occupancy_index(self.eventum)
+        self.assertFalse(index.is_free(self.room_a.id, self.start, self.start + timedelta(minutes=10)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.locations.set([self.room_b])
+        self.eventum.refresh_from_db()
+
+        refreshed = get_occupancy_index(self.eventum)
+        self.assertTrue(refreshed.is_free(self.room_a.id, self.start, self.start + timedelta(minutes=10)))
+        self.assertFalse(refreshed.is_free(self.room_b.id, self.start, self.start + timedelta(minutes=10)))
+        # Индекс, уже отданный другим потокам, не изменяется
+        self.assertIsNot(refreshed, index)
+        self.assertFalse(index.is_free(self.room_a.id, self.start, self.start + timedelta(minutes=10)))
+        self.assertTrue(index.is_free(self.room_b.id, self.start, self.start + timedelta(minutes=10)))
+
+
+class LocationDoubleBookingTests(APITestCase):
+    def setUp(self):
+        self.user = UserProfile.objects.create_user(vk_id=7301, name="Booking Organizer")
+        self.client.force_authenticate(user=self.user)
+        self.eventum = Eventum.objects.create(name="Booking Eventum", forbid_location_double_booking=True)
+        UserRole.objects.create(user=self.user, eventum=self.eventum, role='organizer')
+        self.room = Location.objects.create(eventum=self.eventum, name="Room", kind=Location.Kind.VENUE)
+        self.start = datetime(2030, 1, 1, 10, 0)
+        self.event = Event.objects.create(eventum=self.eventum, name="Existing", start_time=self.start, end_time=self.start + timedelta(hours=1))
+        self.event.locations.add(self.room)
+
+    def _payload(self, name, offset_minutes):
+        start = self.start + timedelta(minutes=offset_minutes)
+        return {
+            'name': name,
+            'start_time': start.isoformat(),
+            'end_time': (start + timedelta(minutes=30)).isoformat(),
+            'location_ids': [self.room.id],
+        }
+
+    def test_overlapping_event_in_same_location_is_rejected(self):
+        url = reverse('event-list', kwargs={'eventum_slug': self.eventum.slug})
+
+        response = self.client.post(url, self._payload("Overlap", 30), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('location_ids', response.data)
+
+        response = self.client.post(url, self._payload("After", 60), format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_bulk_import_reports_all_conflicts(self):
+        url = reverse('event-bulk-import', kwargs={'eventum_slug': self.eventum.slug})
+        payload = {'events': [self._payload("A", 30), self._payload("B", 40), self._payload("C", 120)], 'dry_run': True}
+
+        response = self.client.post(url, payload, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        pairs = {(item['index'], item['event_id'], item['other_index']) for item in response.data['conflicts']}
+        self.assertEqual(pairs, {(0, self.event.id, None), (1, self.event.id, None), (0, None, 1)})
+        self.assertEqual(Event.objects.filter(eventum=self.eventum).count(), 1)
+
+
+class NowNextTests(APITestCase):
+    def setUp(self):
+        from app.now_next import _snapshots
+
+        _snapshots.clear()
+        self.eventum = Eventum.objects.create(name="Now Next Eventum")
+        self.hall = Location.objects.create(eventum=self.eventum, name="Hall", kind=Location.Kind.VENUE)
+        self.other = Location.objects.create(eventum=self.eventum, name="Other", kind=Location.Kind.VENUE)
+        now = timezone.now().replace(microsecond=0)
+        self.current = Event.objects.create(eventum=self.eventum, name="Current", start_time=now - timedelta(minutes=10), end_time=now + timedelta(minutes=20))
+        self.current.locations.add(self.hall)
+        self.upcoming = Event.objects.create(eventum=self.eventum, name="Upcoming", start_time=now + timedelta(hours=1), end_time=now + timedelta(hours=2))
+        self.upcoming.locations.add(self.other)
+
+    def test_eventum_now_next(self):
+        response = self.client.get(reverse('eventum_now_next', kwargs={'slug': self.eventum.slug}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['now']], [self.current.id])
+        self.assertEqual([item['id'] for item in response.data['next']], [self.upcoming.id])
+
+    def test_location_now_next_filters_subtree(self):
+        url = reverse('location-now-next', kwargs={'eventum_slug': self.eventum.slug, 'pk': self.other.id})
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['now'], [])
+        self.assertEqual([item['id'] for item in response.data['next']], [self.upcoming.id])
+
+
+class ParticipantAgendaTests(APITestCase):
+    def setUp(self):
+        from app.agenda import _agenda_cache
+
+        cache.clear()
+        _agenda_cache.clear()
+        self.eventum = Eventum.objects.create(name="Agenda Eventum")
+        self.user = UserProfile.objects.create_user(vk_id=9501, name="Agenda User")
+        self.participant = Participant.objects.create(eventum=self.eventum, user=self.user, name="Agenda User")
+        self.other = Participant.objects.create(eventum=self.eventum, name="Other")
+        start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+
+        # Участник входит в группу мероприятия через вложенную группу
+        team = ParticipantGroup.objects.create(eventum=self.eventum, name="Team")
+        ParticipantGroupParticipantRelation.objects.create(group=team, participant=self.participant)
+        self.button_event = self._create_event("Button", start + timedelta(hours=2), EventRegistration.RegistrationType.BUTTON)
+        ParticipantGroupGroupRelation.objects.create(group=self.button_event.event_group, target_group=team)
+
+        self.application_event = self._create_event("Application", start, EventRegistration.RegistrationType.APPLICATION)
+        self.application_event.registration.applicants.add(self.participant)
+        self.public_event = Event.objects.create(
+            eventum=self.eventum, name="Public", start_time=start + timedelta(hours=1), end_time=start + timedelta(hours=2)
+        )
+
+    def _create_event(self, name, start_time, registration_type):
+        event = Event.objects.create(eventum=self.eventum, name=name, start_time=start_time, end_time=start_time + timedelta(hours=1))
+        event.event_group = ParticipantGroup.objects.create(eventum=self.eventum, name=name, is_event_group=True)
+        event.save()
+        ParticipantGroupParticipantRelation.objects.create(group=event.event_group, participant=self.other)
+        EventRegistration.objects.create(event=event, registration_type=registration_type)
+        return event
+
+    def test_my_registrations_include_nested_groups(self):
+        self.client.force_authenticate(self.user)
+        url = reverse('participant-my-registrations', kwargs={'eventum_slug': self.eventum.slug})
+        # eventum, членство, построение индекса (7), локации, мероприятия и 3 prefetch
+        with self.assertNumQueries(14):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data], [self.button_event.id, self.application_event.id])
+        self.assertTrue(all(item['is_registered'] for item in response.data))
+        self.assertEqual(response.data[0]['registrations_count'], 2)
+
+    def test_schedule_lists_public_and_group_events_by_start(self):
+        from app.agenda import AgendaIndex
+
+        agenda = AgendaIndex.build(self.eventum)
+        self.assertEqual(
+            agenda.schedule_event_ids(self.participant.id),
+            [self.public_event.id, self.button_event.id]
+        )
+        # Участник event_group мероприятия с регистрацией по заявке без заявки не записан
+        self.assertEqual(agenda.registered_event_ids(self.other.id), [self.button_event.id])
+        self.assertTrue(agenda.is_registered(self.other.id, self.application_event.id))
+
+    def test_available_events_apply_registration_rules(self):
+        start = self.button_event.start_time + timedelta(days=1)
+        button = EventRegistration.RegistrationType.BUTTON
+        open_event = self._create_event("Open", start, button)
+        full_event = self._create_event("Full", start, button)
+        full_event.registration.max_participants = 1
+        full_event.registration.save()
+        restricted = self._create_event("Restricted", start, button)
+        restricted.registration.allowed_group = ParticipantGroup.objects.create(eventum=self.eventum, name="Allowed")
+        restricted.registration.save()
+        ParticipantGroupParticipantRelation.objects.create(group=restricted.registration.allowed_group, participant=self.other)
+        same_wave = self._create_event("Same wave", start, EventRegistration.RegistrationType.APPLICATION)
+        wave = EventWave.objects.create(eventum=self.eventum, name="Wave")
+        wave.registrations.add(self.application_event.registration, same_wave.registration)
+
+        self.client.force_authenticate(self.user)
+        url = reverse('event-available', kwargs={'eventum_slug': self.eventum.slug})
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['events']], [open_event.id])
+        self.assertEqual(response.data['events'][0]['registered_count'], 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Изменение волны меняет версию данных eventum и список доступных мероприятий
+        with self.captureOnCommitCallbacks(execute=True):
+            wave.registrations.remove(same_wave.registration)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['events']], [open_event.id, same_wave.id])
+
+
+class ParticipantListTests(APITestCase):
+    def setUp(self):
+        self.eventum = Eventum.objects.create(name="Paging Eventum")
+        self.organizer = UserProfile.objects.create_user(vk_id=9601, name="Paging Organizer")
+        UserRole.objects.create(user=self.organizer, eventum=self.eventum, role='organizer')
+        self.client.force_authenticate(self.organizer)
+        self.url = reverse('participant-list', kwargs={'eventum_slug': self.eventum.slug})
+
+        linked_user = UserProfile.objects.create_user(vk_id=9602, name="Anna Linked")
+        self.participants = [
+            Participant.objects.create(eventum=self.eventum, user=linked_user, name="Anna Linked"),
+            Participant.objects.create(eventum=self.eventum, name="Anna"),
+            Participant.objects.create(eventum=self.eventum, name="Boris"),
+            Participant.objects.create(eventum=self.eventum, name="Anna"),
+            Participant.objects.create(eventum=self.eventum, name="Vera"),
+        ]
+
+    def test_keyset_pages_follow_name_and_id(self):
+        names = []
+        params = {'page_size': 2}
+        while True:
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            names.extend((item['name'], item['id']) for item in response.data['results'])
+            if not response.data['next_cursor']:
+                break
+            params = {'page_size': 2, 'cursor': response.data['next_cursor']}
+
+        anna_ids = sorted([self.participants[1].id, self.participants[3].id])
+        self.assertEqual([name for name, _ in names], ["Anna", "Anna", "Anna Linked", "Boris", "Vera"])
+        self.assertEqual([participant_id for _, participant_id in names[:2]], anna_ids)
+
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(self.client.get(self.url, {'cursor': 'broken'}).status_code, status.HTTP_404_NOT_FOUND)
+        for values in (["a", "x"], [1, 2], ["a", True]):
+            cursor = KeysetPagination().encode_cursor(values)
+            self.assertEqual(self.client.get(self.url, {'cursor': cursor}).status_code, status.HTTP_404_NOT_FOUND, values)
+
+    def test_filters_by_name_user_and_group(self):
+        group = ParticipantGroup.objects.create(eventum=self.eventum, name="Group")
+        ParticipantGroupParticipantRelation.objects.create(group=group, participant=self.participants[2])
+
+        response = self.client.get(self.url, {'search': 'ann', 'has_user': 'false'})
+        self.assertEqual([item['id'] for item in response.data], sorted([self.participants[1].id, self.participants[3].id]))
+
+        response = self.client.get(self.url, {'group': group.id, 'page_size': 10})
+        self.assertEqual([item['name'] for item in response.data['results']], ["Boris"])
+        self.assertEqual(self.client.get(self.url, {'group': 0}).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ParticipantGroupRelationsTests(APITestCase):
+    def setUp(self):
+        self.eventum = Eventum.objects.create(name="Groups Eventum")
+        self.organizer = UserProfile.objects.create_user(vk_id=9701, name="Groups Organizer")
+        UserRole.objects.create(user=self.organizer, eventum=self.eventum, role='organizer')
+        self.client.force_authenticate(self.organizer)
+        self.participants = [
+            Participant.objects.create(eventum=self.eventum, name=f"Member {index}") for index in range(4)
+        ]
+        self.group = ParticipantGroup.objects.create(eventum=self.eventum, name="Group")
+        self.url = reverse('participantgroup-detail', kwargs={'eventum_slug': self.eventum.slug, 'pk': self.group.id})
+
+    def test_patch_applies_only_the_difference(self):
+        kept, retyped, removed, added = self.participants
+        kept_relation = ParticipantGroupParticipantRelation.objects.create(group=self.group, participant=kept)
+        ParticipantGroupParticipantRelation.objects.create(group=self.group, participant=retyped)
+        ParticipantGroupParticipantRelation.objects.create(group=self.group, participant=removed)
+
+        payload = {'participant_relations': [
+            {'participant_id': kept.id},
+            {'participant_id': retyped.id, 'relation_type': 'exclusive'},
+            {'participant_id': added.id},
+        ]}
+        self.eventum.refresh_from_db()
+        version = self.eventum.membership_version
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        relations = dict(self.group.participant_relations.values_list('participant_id', 'relation_type'))
+        self.assertEqual(relations, {kept.id: 'inclusive', retyped.id: 'exclusive', added.id: 'inclusive'})
+        self.assertTrue(ParticipantGroupParticipantRelation.objects.filter(id=kept_relation.id).exists())
+        self.eventum.refresh_from_db()
+        # Сохранение группы, одна синхронизация связей и post_delete удаленной связи;
+        # созданные и измененные связи сигналов не отправляют
+        self.assertEqual(self.eventum.membership_version, version + 3)
+
+    def test_invalid_relations_are_rejected_without_changes(self):
+        other = Participant.objects.create(eventum=Eventum.objects.create(name="Other"), name="Stranger")
+        response = self.client.patch(self.url, {'participant_relations': [{'participant_id': other.id}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        child = ParticipantGroup.objects.create(eventum=self.eventum, name="Child")
+        ParticipantGroupGroupRelation.objects.create(group=self.group, target_group=child)
+        child_url = reverse('participantgroup-detail', kwargs={'eventum_slug': self.eventum.slug, 'pk': child.id})
+        response = self.client.patch(child_url, {'group_relations': [{'target_group_id': self.group.id}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(child.group_relations.exists())
+
+
+class ParticipantQueryTests(APITestCase):
+    def setUp(self):
+        self.eventum = Eventum.objects.create(name="Query Eventum")
+        self.organizer = UserProfile.objects.create_user(vk_id=9701, name="Query Organizer")
+        UserRole.objects.create(user=self.organizer, eventum=self.eventum, role='organizer')
+        self.client.force_authenticate(self.organizer)
+        self.url = reverse('participant-query', kwargs={'eventum_slug': self.eventum.slug})
+
+        self.participants = [Participant.objects.create(eventum=self.eventum, name=f"Q{idx}") for idx in range(5)]
+        self.group_a = ParticipantGroup.objects.create(eventum=self.eventum, name="A")
+        self.group_b = ParticipantGroup.objects.create(eventum=self.eventum, name="B")
+        for participant in self.participants[:2]:
+            ParticipantGroupParticipantRelation.objects.create(group=self.group_a, participant=participant)
+        ParticipantGroupParticipantRelation.objects.create(group=self.group_b, participant=self.participants[1])
+
+        workshop_group = ParticipantGroup.objects.create(eventum=self.eventum, name="Workshop", is_event_group=True)
+        ParticipantGroupParticipantRelation.objects.create(group=workshop_group, participant=self.participants[3])
+        self.tag = EventTag.objects.create(eventum=self.eventum, name="workshop")
+        event = Event.objects.create(
+            eventum=self.eventum,
+            name="Workshop",
+            start_time=timezone.now(),
+            end_time=timezone.now() + timedelta(hours=1),
+            event_group=workshop_group,
+        )
+        event.tags.add(self.tag)
+        self.event = event
+
+    def test_expression_combines_groups_and_tags(self):
+        expression = {'and': [
+            {'or': [{'group': self.group_a.id}, {'tag': self.tag.id}]},
+            {'not': {'group': self.group_b.id}},
+        ]}
+        expected = [self.participants[0].id, self.participants[3].id]
+
+        response = self.client.post(self.url, {'expression': expression}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([item['id'] for item in response.data['results']], expected)
+
+        response = self.client.post(self.url, {'expression': expression, 'page_size': 1}, format='json')
+        self.assertEqual([item['id'] for item in response.data['results']], expected[:1])
+        response = self.client.post(
+            self.url, {'expression': expression, 'page_size': 1, 'after': response.data['next_after']}, format='json'
+        )
+        self.assertEqual([item['id'] for item in response.data['results']], expected[1:])
+        self.assertIsNone(response.data['next_after'])
+
+    def test_invalid_expression_is_rejected(self):
+        for expression in ({'group': 0}, {'xor': []}, {'and': []}, {'group': 'A'}):
+            response = self.client.post(self.url, {'expression': expression}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, expression)
+
+
+    @override_settings(KEYSET_MAX_PAGE_SIZE=2)
+    def test_filter_by_events_loads_participants_by_id(self):
+        url = reverse('participant-filter-by-events', kwargs={'eventum_slug': self.eventum.slug})
+
+        response = self.client.post(url, {'filter_type': 'not_participating', 'event_ids': [self.event.id]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data], [p.id for p in self.participants if p != self.participants[3]])
+
+        response = self.client.post(url, {'filter_type': 'participating', 'event_ids': [0]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class ParticipantImportTests(APITestCase):
+    def setUp(self):
+        self.eventum = Eventum.objects.create(name="Import Eventum")
+        self.organizer = UserProfile.objects.create_user(vk_id=9801, name="Import Organizer")
+        UserRole.objects.create(user=self.organizer, eventum=self.eventum, role='organizer')
+        self.client.force_authenticate(self.organizer)
+        self.url = reverse('participant-bulk-import', kwargs={'eventum_slug': self.eventum.slug})
+
+    def _import(self, payload):
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        return json.loads(lines[-1])
+
+    def test_rows_are_created_updated_and_validated(self):
+        linked = UserProfile.objects.create_user(vk_id=9802, name="Linked User")
+        fresh = UserProfile.objects.create_user(vk_id=9803, name="Fresh User")
+        existing = Participant.objects.create(eventum=self.eventum, user=linked, name="Old Name")
+        Participant.objects.create(eventum=self.eventum, name="Guest")
+
+        rows = [
+            {'vk_id': 9802, 'name': "New Name"},
+            {'vk_id': 9803},
+            {'name': "Guest"},
+            {'name': "Walk-in"},
+            {'vk_id': 9803, 'name': "Again"},
+            {'vk_id': 1},
+            {'name': ""},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self._import({'participants': rows})
+
+        self.assertTrue(result['done'])
+        self.assertEqual(
+            (result['created'], result['updated'], result['unchanged'], result['errors']), (2, 1, 1, 3)
+        )
+        self.assertEqual([error['row'] for error in result['error_details']], [5, 6, 7])
+
+        existing.refresh_from_db()
+        self.assertEqual(existing.name, "New Name")
+        self.assertEqual(Participant.objects.get(eventum=self.eventum, user=fresh).name, "Fresh User")
+        self.assertTrue(Participant.objects.filter(eventum=self.eventum, name="Walk-in", user__isnull=True).exists())
+        self.eventum.refresh_from_db()
+        self.assertEqual(self.eventum.membership_version, 1)
+
+    def test_interrupted_import_updates_version_for_committed_batches(self):
+        from app.participant_import import ParticipantImporter
+
+        progress = ParticipantImporter(self.eventum, batch_size=1).run([{'name': "First"}, {'name': "Second"}])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(next(progress)['created'], 1)
+            # Клиент отключился: генератор закрыт до конца импорта
+            progress.close()
+
+        self.eventum.refresh_from_db()
+        self.assertEqual(self.eventum.membership_version, 1)
+        self.assertEqual(list(Participant.objects.filter(eventum=self.eventum).values_list('name', flat=True)), ["First"])
+
+    def test_dry_run_saves_nothing(self):
+        result = self._import({'participants': [{'name': "Dry"}], 'dry_run': True})
+
+        self.assertEqual(result['created'], 1)
+        self.assertFalse(Participant.objects.filter(eventum=self.eventum).exists())
@@ -24,6 +24,11 @@ from .views import (
     search_users,
     participant_calendar_ics,
     participant_calendar_webcal,
+    calendar_feed_ics,
+    eventum_now_next,
+    calendar_export_start,
+    calendar_export_status,
+    calendar_export_download,
     ParticipantGroupViewSet,
     ParticipantGroupParticipantRelationViewSet,
     ParticipantGroupGroupRelationViewSet,
@@ -59,9 +64,14 @@ urlpatterns = [
     path('eventums/<slug:slug>/organizers/', eventum_organizers, name='eventum_organizers'),
     path('eventums/<slug:slug>/organizers/<int:role_id>/', remove_eventum_organizer, name='remove_eventum_organizer'),
     path('eventums/<slug:slug>/registration-stats/', eventum_registration_stats, name='eventum_registration_stats'),
+    path('eventums/<slug:slug>/now-next/', eventum_now_next, name='eventum_now_next'),
     path('eventums/<slug:eventum_slug>/calendar.ics', participant_calendar_ics, name='participant_calendar_ics'),
     path('eventums/<slug:eventum_slug>/calendar/<int:participant_id>.ics', participant_calendar_ics, name='participant_calendar_ics_with_id'),
+    path('eventums/<slug:eventum_slug>/calendar/feed.ics', calendar_feed_ics, name='calendar_feed_ics'),
     path('eventums/<slug:eventum_slug>/calendar/webcal', participant_calendar_webcal, name='participant_calendar_webcal'),
+    path('eventums/<slug:slug>/calendar/export/', calendar_export_start, name='calendar_export_start'),
+    path('eventums/<slug:slug>/calendar/export/<uuid:job_id>/', calendar_export_status, name='calendar_export_status'),
+    path('eventums/<slug:slug>/calendar/export/<uuid:job_id>/download/', calendar_export_download, name='calendar_export_download'),
     # Upload image endpoint
     path('eventums/<slug:eventum_slug>/upload-image/', upload_image, name='upload_image'),
     
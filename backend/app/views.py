@@ -3,19 +3,17 @@ from rest_framework.decorators import action, api_view, permission_classes, auth
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.pagination import PageNumberPagination
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from rest_framework_simplejwt.tokens import RefreshToken
 from django.shortcuts import get_object_or_404
 from django.http import Http404, HttpResponse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from django.conf import settings
 from django.db.models import Prefetch, Count
 from django.db import connection, reset_queries
 import requests
 import json
-from icalendar import Calendar, Event as ICalEvent
-from datetime import datetime
 import uuid
 import time
 from urllib.parse import urlsplit, urlunsplit
@@ -26,12 +24,26 @@ from .serializers import (
     UserProfileSerializer, UserRoleSerializer, VKAuthSerializer, CustomTokenObtainPairSerializer,
     LocationSerializer, EventWaveSerializer, EventRegistrationSerializer,
     ParticipantGroupSerializer, ParticipantGroupParticipantRelationSerializer, ParticipantGroupGroupRelationSerializer,
-    ParticipantGroupEventRelationSerializer
+    ParticipantGroupEventRelationSerializer, EventRegistrationBulkSetupSerializer
 )
 from .permissions import IsEventumOrganizer, IsEventumParticipant, IsEventumOrganizerOrReadOnly, IsEventumOrganizerOrReadOnlyForList, IsEventumOrganizerOrPublicReadOnly
 from .utils import log_execution_time, csrf_exempt_class_api, get_group_participant_ids, EventumGroupGraph
-from .auth_utils import EventumMixin, require_authentication, require_eventum_role, get_eventum_from_request
+from .authentication import get_tokens_for_user
+from .auth_utils import EventumMixin, require_authentication, require_eventum_role, get_eventum_from_request, get_viewer_context
 from .base_views import EventumScopedViewSet
+from .schedule import build_participant_index, find_location_conflicts, find_registration_conflicts
+from .waves import build_wave_summary
+from .analytics import build_membership_report, get_scope_events
+from .agenda import get_agenda_index
+from .caching import get_eventum_version_key
+from .ics import get_calendar_validators, get_participant_calendar
+from .locations import get_location_index, get_location_payload
+from .pagination import KeysetPagination
+from .participant_import import IMPORT_FORMATS, ParticipantImporter, read_rows
+from .participant_query import ParticipantQuery, QueryError, page_participant_ids
+from .renderers import FlatFormatContentNegotiation
+from .occupancy import get_occupancy_index
+from .now_next import get_now_next
 import logging
 import mimetypes
 import boto3
@@ -92,8 +104,7 @@ class EventumViewSet(EventumMixin, viewsets.ModelViewSet):
         
         # Проверяем права доступа: только участники и организаторы могут просматривать eventum
         if request.user.is_authenticated:
-            from .auth_utils import get_user_role_in_eventum
-            user_role = get_user_role_in_eventum(request.user, eventum)
+            user_role = get_viewer_context(request, eventum).role
             # Если пользователь не является участником и не является организатором, возвращаем 403
             if user_role not in ['organizer', 'participant']:
                 return Response(
@@ -125,7 +136,7 @@ class ParticipantViewSet(EventumScopedViewSet):
     queryset = Participant.objects.select_related('user', 'eventum').all()
     serializer_class = ParticipantSerializer
     permission_classes = [IsEventumOrganizerOrReadOnly]  # Организаторы CRUD, участники только чтение
-    pagination_class = PageNumberPagination
+    pagination_class = KeysetPagination  # По (name, id), включается параметрами page_size/cursor
     
     def get_queryset(self):
         """Оптимизированный queryset для списка участников"""
@@ -148,6 +159,78 @@ class ParticipantViewSet(EventumScopedViewSet):
             group_relations_prefetch
         )
     
+    def _get_registered_participant_ids(self, event, group_graph):
+        """ID участников, записанных на мероприятие (та же логика, что is_registered в EventSerializer)"""
+        registration = getattr(event, 'registration', None)
+        if registration is None:
+            return set()
+        participant_ids = set(group_graph.get_participant_ids(event.event_group_id)) if event.event_group_id else set()
+        if registration.registration_type == EventRegistration.RegistrationType.APPLICATION:
+            participant_ids.update(registration.applicants.values_list('id', flat=True))
+        return participant_ids
+    
+    def _filter_participants(self, queryset):
+        """
+        Фильтры списка участников из query-параметров:
+        search (префикс имени), has_user, group (с учетом вложенных групп) и
+        event (записанные на мероприятие).
+        
+        Returns:
+            tuple: (queryset, error_response)
+        """
+        params = self.request.query_params
+        eventum = self.get_eventum()
+        
+        search = params.get('search', '').strip()
+        if search:
+            queryset = queryset.filter(name__istartswith=search)
+        
+        has_user = params.get('has_user')
+        if has_user is not None:
+            if has_user.lower() not in ('true', 'false'):
+                return None, Response({'error': 'has_user must be true or false'}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(user__isnull=has_user.lower() == 'false')
+        
+        group_param = params.get('group')
+        event_param = params.get('event')
+        if not group_param and not event_param:
+            return queryset, None
+        
+        # Состав групп вычисляется движком групп один раз на запрос
+        group_graph = EventumGroupGraph(eventum)
+        if group_param:
+            try:
+                group_id = int(group_param)
+            except ValueError:
+                group_id = None
+            if group_id is None or group_graph.get_group(group_id) is None:
+                return None, Response({'error': 'Group not found'}, status=status.HTTP_404_NOT_FOUND)
+            queryset = queryset.filter(id__in=group_graph.get_participant_ids(group_id))
+        
+        if event_param:
+            try:
+                event = Event.objects.select_related('registration').get(id=int(event_param), eventum=eventum)
+            except (ValueError, Event.DoesNotExist):
+                return None, Response({'error': 'Event not found'}, status=status.HTTP_404_NOT_FOUND)
+            queryset = queryset.filter(id__in=self._get_registered_participant_ids(event, group_graph))
+        
+        return queryset, None
+    
+    def list(self, request, *args, **kwargs):
+        """Список участников с фильтрами и keyset-пагинацией (см. KeysetPagination)"""
+        queryset, error_response = self._filter_participants(self.get_queryset())
+        if error_response:
+            return error_response
+        queryset = queryset.order_by(*self.paginator.ordering)
+        
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+    
     @action(detail=False, methods=['get'])
     @require_authentication
     def me(self, request, eventum_slug=None):
@@ -195,85 +278,42 @@ class ParticipantViewSet(EventumScopedViewSet):
         except Participant.DoesNotExist:
             return Response({'error': 'User is not a participant in this eventum'}, status=status.HTTP_404_NOT_FOUND)
     
-    @action(detail=False, methods=['get'])
-    @require_authentication
-    def my_registrations(self, request, eventum_slug=None):
-        """Получить мероприятия, на которые зарегистрирован текущий участник"""
-        from django.db.models import Q, Exists, OuterRef, Prefetch
-        from .models import Participant, ParticipantGroupParticipantRelation, ParticipantGroupGroupRelation
-        
-        eventum = self.get_eventum()
-        
-        try:
-            participant = Participant.objects.get(user=request.user, eventum=eventum)
-        except Participant.DoesNotExist:
-            return Response({'error': 'User is not a participant in this eventum'}, status=status.HTTP_404_NOT_FOUND)
-        
-        # Получаем события, на которые участник зарегистрирован или подал заявку
-        # Для типа button: участник в event_group
-        # Для типа application: участник в applicants
-        button_events = Event.objects.filter(
-            eventum=eventum,
-            registration__registration_type=EventRegistration.RegistrationType.BUTTON,
-            event_group__participant_relations__participant=participant,
-            event_group__participant_relations__relation_type=ParticipantGroupParticipantRelation.RelationType.INCLUSIVE
-        ).distinct()
-        
-        application_events = Event.objects.filter(
-            eventum=eventum,
-            registration__registration_type=EventRegistration.RegistrationType.APPLICATION,
-            registration__applicants=participant
-        ).distinct()
-        
-        # Объединяем результаты
+    def _get_registrations_response(self, request, eventum, participant):
+        """
+        Мероприятия, на которые участник записан или подал заявку.
         
-        events = (button_events | application_events).distinct().select_related(
-            'eventum', 'event_group'
+        ID мероприятий берутся из индекса мероприятий участников (с учетом
+        вложенных групп), сами мероприятия загружаются одним запросом по ID;
+        признаки регистрации и счетчики сериализатор берет из того же индекса.
+        """
+        agenda = get_agenda_index(eventum)
+        events = Event.objects.filter(
+            eventum=eventum, id__in=agenda.registered_event_ids(participant.id)
+        ).select_related(
+            'eventum', 'event_group', 'registration'
         ).prefetch_related(
-            'locations', 'tags', 'registration',
-            'registration__applicants',  # Для проверки is_registered для APPLICATION типа
-            # КРИТИЧНО: загружаем все participant_relations и group_relations
-            # чтобы избежать N+1 запросов в has_participant
-            Prefetch(
-                'event_group__participant_relations',
-                queryset=ParticipantGroupParticipantRelation.objects.select_related('participant')
-            ),
-            Prefetch(
-                'event_group__group_relations',
-                queryset=ParticipantGroupGroupRelation.objects.select_related('target_group').prefetch_related(
-                    Prefetch(
-                        'target_group__participant_relations',
-                        queryset=ParticipantGroupParticipantRelation.objects.select_related('participant')
-                    ),
-                    Prefetch(
-                        'target_group__group_relations',
-                        queryset=ParticipantGroupGroupRelation.objects.select_related('target_group').prefetch_related(
-                            Prefetch(
-                                'target_group__participant_relations',
-                                queryset=ParticipantGroupParticipantRelation.objects.select_related('participant')
-                            ),
-                            Prefetch(
-                                'target_group__group_relations',
-                                queryset=ParticipantGroupGroupRelation.objects.select_related('target_group')
-                            ),
-                        )
-                    ),
-                )
-            ),
-        ).order_by('-start_time')
-        
-        # Загружаем всех участников eventum для вычисления групп
-        all_participants = Participant.objects.filter(eventum=eventum).values_list('id', flat=True)
+            'locations', 'tags', 'participants'
+        ).order_by('-start_time', '-id')
         
-        # Передаём participant в контекст для правильного вычисления is_participant и is_registered
         serializer = EventSerializer(events, many=True, context={
             'request': request,
             'participant_id': participant.id,
-            'current_participant': participant,  # Для оптимизации
-            'all_participant_ids': set(all_participants)  # Для оптимизации
+            'current_participant': participant,
+            'agenda': agenda,
+            'location_index': get_location_index(eventum),
         })
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'])
+    @require_authentication
+    def my_registrations(self, request, eventum_slug=None):
+        """Получить мероприятия, на которые зарегистрирован текущий участник"""
+        eventum = self.get_eventum()
+        participant = self.get_viewer().participant
+        if participant is None:
+            return Response({'error': 'User is not a participant in this eventum'}, status=status.HTTP_404_NOT_FOUND)
+        return self._get_registrations_response(request, eventum, participant)
+    
     @action(detail=True, methods=['get'], permission_classes=[IsEventumOrganizer])
     def registrations(self, request, eventum_slug=None, pk=None):
         """Получить мероприятия, на которые зарегистрирован конкретный участник (только для организаторов)"""
@@ -284,73 +324,7 @@ class ParticipantViewSet(EventumScopedViewSet):
         except Participant.DoesNotExist:
             return Response({'error': 'Participant not found'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Получаем события, на которые участник зарегистрирован или подал заявку
-        from django.db.models import Q, Prefetch
-        from .models import ParticipantGroupParticipantRelation, ParticipantGroupGroupRelation
-        
-        button_events = Event.objects.filter(
-            eventum=eventum,
-            registration__registration_type=EventRegistration.RegistrationType.BUTTON,
-            event_group__participant_relations__participant=participant,
-            event_group__participant_relations__relation_type=ParticipantGroupParticipantRelation.RelationType.INCLUSIVE
-        ).distinct()
-        
-        application_events = Event.objects.filter(
-            eventum=eventum,
-            registration__registration_type=EventRegistration.RegistrationType.APPLICATION,
-            registration__applicants=participant
-        ).distinct()
-        
-        # Объединяем результаты
-        
-        events = (button_events | application_events).distinct().select_related(
-            'eventum', 'event_group'
-        ).prefetch_related(
-            'locations', 'tags', 'registration',
-            'registration__applicants',  # Для проверки is_registered для APPLICATION типа
-            # КРИТИЧНО: загружаем все participant_relations и group_relations
-            # чтобы избежать N+1 запросов в has_participant
-            Prefetch(
-                'event_group__participant_relations',
-                queryset=ParticipantGroupParticipantRelation.objects.select_related('participant')
-            ),
-            Prefetch(
-                'event_group__group_relations',
-                queryset=ParticipantGroupGroupRelation.objects.select_related('target_group').prefetch_related(
-                    Prefetch(
-                        'target_group__participant_relations',
-                        queryset=ParticipantGroupParticipantRelation.objects.select_related('participant')
-                    ),
-                    Prefetch(
-                        'target_group__group_relations',
-                        queryset=ParticipantGroupGroupRelation.objects.select_related('target_group').prefetch_related(
-                            Prefetch(
-                                'target_group__participant_relations',
-                                queryset=ParticipantGroupParticipantRelation.objects.select_related('participant')
-                            ),
-                            Prefetch(
-                                'target_group__group_relations',
-                                queryset=ParticipantGroupGroupRelation.objects.select_related('target_group')
-                            ),
-                        )
-                    ),
-                )
-            ),
-        ).order_by('-start_time')
-        
-        # Загружаем всех участников eventum для вычисления групп
-        from .models import Participant
-        all_participants = Participant.objects.filter(eventum=eventum).values_list('id', flat=True)
-        
-        # Передаём ID участника в контекст, чтобы is_registered проверял регистрацию именно этого участника
-        # Также передаем participant объект и all_participant_ids для оптимизации
-        serializer = EventSerializer(events, many=True, context={
-            'request': request, 
-            'participant_id': participant.id,
-            'current_participant': participant,  # Для оптимизации
-            'all_participant_ids': set(all_participants)  # Для оптимизации
-        })
-        return Response(serializer.data)
+        return self._get_registrations_response(request, eventum, participant)
     
     @action(detail=False, methods=['post'], permission_classes=[IsEventumOrganizer])
     def filter_by_events(self, request, eventum_slug=None):
@@ -368,49 +342,99 @@ class ParticipantViewSet(EventumScopedViewSet):
         if not event_ids:
             return Response({'error': 'event_ids is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Проверяем, что все мероприятия принадлежат данному eventum
-        events = Event.objects.filter(id__in=event_ids, eventum=eventum)
-        
-        if events.count() != len(event_ids):
-            return Response({'error': 'Some events do not belong to this eventum'}, 
-                          status=status.HTTP_400_BAD_REQUEST)
+        try:
+            event_ids = {int(event_id) for event_id in event_ids}
+        except (TypeError, ValueError):
+            return Response({'error': 'event_ids must be a list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # "Участвует хотя бы в одном из мероприятий" или его отрицание;
+        # мероприятия другого eventum движок запросов отклоняет
+        expression = {'or': [{'event': event_id} for event_id in sorted(event_ids)]}
+        if filter_type == 'not_participating':
+            expression = {'not': expression}
+        try:
+            participant_ids = ParticipantQuery(eventum, expression).evaluate()
+        except QueryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Участники загружаются страницами по ID, как в query, а не всем eventum
+        participants = []
+        after = None
+        while True:
+            page_ids, after = page_participant_ids(participant_ids, after=after, limit=settings.KEYSET_MAX_PAGE_SIZE)
+            if page_ids:
+                participants.extend(self.get_queryset().filter(id__in=page_ids).order_by('id'))
+            if after is None:
+                break
         
-        # Создаем граф групп для eventum один раз на запрос
-        group_graph = EventumGroupGraph(eventum)
-        all_participant_ids = group_graph.all_participant_ids
+        serializer = self.get_serializer(participants, many=True)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsEventumOrganizer])
+    def bulk_import(self, request, eventum_slug=None):
+        """
+        Массовый импорт участников: файл (file, CSV или JSONL) или JSON
+        {"participants": [{"name": ..., "vk_id": ...}], "dry_run": false}.
         
-        # Загружаем события с их event_group
-        events = events.select_related('event_group')
+        Прогресс отдается потоком NDJSON: строка со счетчиками после каждой пачки
+        и итоговая строка с done=true и ошибками строк.
+        """
+        import io
+        import os
+        from django.http import StreamingHttpResponse
         
-        # Собираем ID участников, которые участвуют в указанных мероприятиях
-        participating_participant_ids = set()
+        eventum = self.get_eventum()
+        dry_run = request.data.get('dry_run') in (True, 'true', '1', 1)
+        
+        upload = request.FILES.get('file')
+        if upload is not None:
+            input_format = request.data.get('format') or os.path.splitext(upload.name)[1].lstrip('.').lower()
+            if input_format not in IMPORT_FORMATS:
+                return Response({'error': 'format must be csv or jsonl'}, status=status.HTTP_400_BAD_REQUEST)
+            rows = read_rows(io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''), input_format)
+        else:
+            rows = request.data.get('participants')
+            if not isinstance(rows, list) or not rows:
+                return Response({'error': 'file or participants list is required'}, status=status.HTTP_400_BAD_REQUEST)
+            rows = [row if isinstance(row, dict) else None for row in rows]
+        
+        importer = ParticipantImporter(eventum, dry_run=dry_run)
+        lines = (json.dumps(progress, ensure_ascii=False) + '\n' for progress in importer.run(rows))
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsEventumOrganizer])
+    def query(self, request, eventum_slug=None):
+        """
+        Участники по логическому выражению над группами, мероприятиями,
+        заявками и тегами (формат выражения - в app/participant_query.py).
+        Результат отдается страницами по ID: after - последний ID предыдущей страницы.
+        """
+        eventum = self.get_eventum()
+        expression = request.data.get('expression')
+        if expression is None:
+            return Response({'error': 'expression is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        for event in events:
-            if event.event_group:
-                # Используем граф групп для получения участников
-                participant_ids = group_graph.get_participant_ids(event.event_group.id)
-                participating_participant_ids.update(participant_ids)
-            else:
-                # Если нет event_group, все участники eventum участвуют
-                participating_participant_ids.update(all_participant_ids)
-        
-        if filter_type == 'participating':
-            # Участники, которые участвуют хотя бы в одном из указанных мероприятий
-            participants = Participant.objects.filter(
-                id__in=participating_participant_ids,
-                eventum=eventum
-            )
-        else:  # not_participating
-            # Участники, которые НЕ участвуют ни в одном из указанных мероприятий
-            participants = Participant.objects.filter(
-                eventum=eventum
-            ).exclude(id__in=participating_participant_ids)
+        try:
+            page_size = int(request.data.get('page_size', settings.KEYSET_PAGE_SIZE))
+            after = request.data.get('after')
+            after = int(after) if after is not None else None
+        except (TypeError, ValueError):
+            return Response({'error': 'page_size and after must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        page_size = max(1, min(page_size, settings.KEYSET_MAX_PAGE_SIZE))
         
-        # Оптимизируем запрос
-        participants = participants.select_related('user', 'eventum')
+        try:
+            participant_ids = ParticipantQuery(eventum, expression).evaluate()
+        except QueryError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
+        page_ids, next_after = page_participant_ids(participant_ids, after=after, limit=page_size)
+        participants = self.get_queryset().filter(id__in=page_ids).order_by('id') if page_ids else []
         serializer = self.get_serializer(participants, many=True)
-        return Response(serializer.data)
+        return Response({
+            'count': len(participant_ids),
+            'next_after': next_after,
+            'results': serializer.data,
+        })
     
 
 class ParticipantGroupViewSet(EventumScopedViewSet):
@@ -751,6 +775,18 @@ class EventWaveViewSet(EventumScopedViewSet, viewsets.ModelViewSet):
         """Переопределяем retrieve"""
         return super().retrieve(request, *args, **kwargs)
 
+    @action(detail=False, methods=['get'])
+    def summary(self, request, eventum_slug=None):
+        """
+        Компактная сводка по волнам: ID регистраций и мероприятий, вместимость,
+        количество записанных и доступность для текущего участника.
+        Подробности мероприятий загружаются отдельно через events/.
+        """
+        eventum = self.get_eventum()
+        participant, _ = self._get_participant_for_context(eventum)
+        participant_id = participant.id if participant else None
+        return Response(build_wave_summary(eventum, participant_id=participant_id))
+
 
 class EventRegistrationViewSet(EventumScopedViewSet, viewsets.ModelViewSet):
     """ViewSet для управления регистрациями на мероприятия"""
@@ -777,6 +813,17 @@ class EventRegistrationViewSet(EventumScopedViewSet, viewsets.ModelViewSet):
         """Переопределяем, чтобы не передавать eventum (его нет в модели EventRegistration)"""
         serializer.save()
 
+    @action(detail=False, methods=['post'], permission_classes=[IsEventumOrganizer])
+    def bulk_setup(self, request, eventum_slug=None):
+        """Массово настроить регистрацию для списка мероприятий"""
+        serializer = EventRegistrationBulkSetupSerializer(
+            data=request.data,
+            context={'eventum': self.get_eventum(), 'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        result = serializer.save()
+        return Response(result, status=status.HTTP_201_CREATED)
+
 
 @csrf_exempt_class_api
 class EventViewSet(EventumScopedViewSet, viewsets.ModelViewSet):
@@ -859,11 +906,10 @@ class EventViewSet(EventumScopedViewSet, viewsets.ModelViewSet):
         if not request.user.is_authenticated:
             return None, Response({'error': 'Not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
         
-        try:
-            participant = Participant.objects.get(user=request.user, eventum=eventum)
-            return participant, None
-        except Participant.DoesNotExist:
+        participant = get_viewer_context(request, eventum).participant
+        if participant is None:
             return None, Response({'error': 'User is not a participant in this eventum'}, status=status.HTTP_404_NOT_FOUND)
+        return participant, None
 
     @action(detail=True, methods=['post'], permission_classes=[IsEventumParticipant])
     def register(self, request, eventum_slug=None, pk=None):
@@ -893,10 +939,37 @@ class EventViewSet(EventumScopedViewSet, viewsets.ModelViewSet):
             allowed_participants = registration.allowed_group.get_participants()
             if not allowed_participants.filter(id=participant.id).exists():
                 return Response({'error': 'You are not allowed to register for this event'}, status=status.HTTP_403_FORBIDDEN)
-        
+
         # Атомарная операция регистрации
         try:
             with transaction.atomic():
+                # Проверяем пересечения с другими записями участника (если включено в eventum).
+                # Строка участника блокируется, чтобы параллельные записи того же участника
+                # выполняли проверку по очереди и видели записи друг друга
+                if eventum.forbid_overlapping_registrations:
+                    Participant.objects.select_for_update().only('id').get(pk=participant.pk)
+                    participant_index = build_participant_index(
+                        eventum,
+                        participant.id,
+                        start=event.start_time,
+                        end=event.end_time,
+                        exclude_event_id=event.id
+                    )
+                    overlapping = participant_index.overlapping(event.start_time, event.end_time)
+                    if overlapping:
+                        return Response({
+                            'error': 'Event overlaps with your other registrations',
+                            'conflicts': [
+                                {
+                                    'id': other.id,
+                                    'name': other.name,
+                                    'start_time': other.start_time.isoformat(),
+                                    'end_time': other.end_time.isoformat()
+                                }
+                                for _, _, other in overlapping
+                            ]
+                        }, status=status.HTTP_400_BAD_REQUEST)
+
                 if registration.registration_type == EventRegistration.RegistrationType.BUTTON:
                     # Для типа button: добавляем участника в event_group
                     if not event.event_group:
@@ -999,14 +1072,146 @@ class EventViewSet(EventumScopedViewSet, viewsets.ModelViewSet):
             logger.error(f"Error during event unregistration: {str(e)}")
             return Response({'error': 'Failed to unregister from event'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsEventumParticipant])
+    def available(self, request, eventum_slug=None):
+        """
+        Мероприятия, на которые текущий участник еще может записаться.
+        
+        Вычисляется в памяти по индексу мероприятий участников; ответ зависит
+        только от версии данных eventum, поэтому при опросе клиент получает
+        304, пока данные не изменились.
+        """
+        eventum = self.get_eventum()
+        participant, error_response = self._get_participant(request, eventum)
+        if error_response:
+            return error_response
+        
+        etag = quote_etag(f"available-{eventum.id}-{participant.id}-{get_eventum_version_key(eventum)}")
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        
+        result = []
+        if eventum.registration_open:
+            agenda = get_agenda_index(eventum)
+            for event_id in agenda.available_event_ids(participant.id, eventum.forbid_overlapping_registrations):
+                name, start_time, end_time = agenda.events[event_id]
+                registration = agenda.registrations[event_id]
+                result.append({
+                    'id': event_id,
+                    'name': name,
+                    'start_time': start_time.isoformat(),
+                    'end_time': end_time.isoformat(),
+                    'registration_type': registration['registration_type'],
+                    'max_participants': registration['max_participants'],
+                    'registered_count': agenda.registered_counts.get(event_id, 0),
+                })
+        
+        response = Response({'registration_open': eventum.registration_open, 'events': result})
+        response['Cache-Control'] = 'no-cache, must-revalidate'
+        response['ETag'] = etag
+        return response
+
+    @action(detail=False, methods=['get'], permission_classes=[IsEventumOrganizer])
+    def registration_conflicts(self, request, eventum_slug=None):
+        """Отчет о пересечениях по времени между записями участников eventum"""
+        eventum = self.get_eventum()
+        group_graph = EventumGroupGraph(eventum)
+        conflicts = find_registration_conflicts(eventum, group_graph=group_graph)
+
+        def serialize_event(event):
+            return {
+                'id': event.id,
+                'name': event.name,
+                'start_time': event.start_time.isoformat(),
+                'end_time': event.end_time.isoformat()
+            }
+
+        result = []
+        for participant_id, first_event, second_event in conflicts:
+            participant = group_graph.participants_map.get(participant_id)
+            result.append({
+                'participant': {
+                    'id': participant_id,
+                    'name': participant.name if participant else None
+                },
+                'events': [serialize_event(first_event), serialize_event(second_event)]
+            })
+
+        result.sort(key=lambda item: (item['participant']['name'] or '', item['participant']['id'], item['events'][0]['start_time']))
+        return Response({'count': len(result), 'conflicts': result})
+
+    @action(detail=False, methods=['post'], permission_classes=[IsEventumOrganizer])
+    def bulk_import(self, request, eventum_slug=None):
+        """
+        Массовый импорт мероприятий расписания: {"events": [...], "dry_run": false}.
+
+        Все мероприятия валидируются вместе, пересечения по локациям (между собой
+        и с уже существующими мероприятиями) находятся за один проход и
+        возвращаются сразу все. При dry_run ничего не сохраняется.
+        """
+        from django.db import transaction
+
+        eventum = self.get_eventum()
+        items = request.data.get('events')
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'events must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = request.data.get('dry_run') in (True, 'true', '1', 1)
+
+        context = {**self.get_serializer_context(), 'skip_location_conflicts': True}
+        serializer = self.get_serializer(data=items, many=True, context=context)
+        if not serializer.is_valid():
+            return Response({'error': 'Invalid events', 'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        conflicts = find_location_conflicts(eventum, [
+            (item['start_time'], item['end_time'], [location.id for location in item.get('locations') or []], None)
+            for item in serializer.validated_data
+        ])
+        blocked = bool(conflicts) and eventum.forbid_location_double_booking
+        if dry_run or blocked:
+            return Response(
+                {'valid': not blocked, 'count': len(items), 'conflicts': conflicts},
+                status=status.HTTP_400_BAD_REQUEST if blocked else status.HTTP_200_OK
+            )
+
+        with transaction.atomic():
+            events = serializer.save(eventum=eventum)
+        return Response(
+            {'created_ids': [event.id for event in events], 'conflicts': conflicts},
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=False, methods=['get'], permission_classes=[IsEventumOrganizer])
+    def membership_matrix(self, request, eventum_slug=None):
+        """
+        Аналитика матрицы участник × мероприятие для волны (?wave=), тега (?tag=)
+        или всех мероприятий с регистрацией: совпадения заявок, участники без мест
+        и распределение количества заявок на участника.
+        """
+        eventum = self.get_eventum()
+
+        scope = {}
+        for param, key in (('wave', 'wave_id'), ('tag', 'tag_id')):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    scope[key] = int(value)
+                except (TypeError, ValueError):
+                    return Response({'error': f'Invalid {param} id'}, status=status.HTTP_400_BAD_REQUEST)
+
+        events = get_scope_events(eventum, **scope)
+        return Response(build_membership_report(eventum, events))
+
 
 
 
 
 class LocationViewSet(EventumScopedViewSet, viewsets.ModelViewSet):
+    """Чтение локаций выполняется из кэшированного индекса локаций eventum (app.locations)"""
     queryset = Location.objects.all().select_related('eventum', 'parent').prefetch_related('children')
     serializer_class = LocationSerializer
     permission_classes = [IsEventumOrganizerOrPublicReadOnly]  # Организаторы CRUD, все остальные только чтение
+    content_negotiation_class = FlatFormatContentNegotiation
 
     def get_queryset(self):
         """Оптимизированный queryset для списка локаций"""
@@ -1015,66 +1220,170 @@ class LocationViewSet(EventumScopedViewSet, viewsets.ModelViewSet):
             'eventum', 'parent'
         ).prefetch_related('children')
 
-    def list(self, request, *args, **kwargs):
-        eventum = self.get_eventum()
-        queryset = self.filter_queryset(self.get_queryset())
-        children_map = self._build_children_map(eventum)
+    def _get_location_index(self):
+        """Кэшированный индекс локаций eventum (один раз на запрос)"""
+        if not hasattr(self, '_location_index'):
+            self._location_index = get_location_index(self.get_eventum())
+        return self._location_index
 
-        page = self.paginate_queryset(queryset)
-        context = {**self.get_serializer_context(), 'children_map': children_map}
-        if page is not None:
-            serializer = self.get_serializer(page, many=True, context=context)
-            return self.get_paginated_response(serializer.data)
+    def _is_flat(self):
+        """?format=flat - узлы с parent_id/children_ids вместо вложенных детей"""
+        return self.request.query_params.get('format') == 'flat'
 
-        serializer = self.get_serializer(queryset, many=True, context=context)
-        return Response(serializer.data)
+    def _get_location_id(self):
+        """ID локации из URL; 404, если локации нет в eventum"""
+        try:
+            location_id = int(self.kwargs.get('pk'))
+        except (TypeError, ValueError):
+            raise NotFound('Location not found')
+        if location_id not in self._get_location_index():
+            raise NotFound('Location not found')
+        return location_id
+
+    def _payload_response(self, name, build):
+        """Ответ из кэша готовых представлений локаций (по версии расписания)"""
+        flat = self._is_flat()
+        data = get_location_payload(
+            self.get_eventum(),
+            f"{name}:{'flat' if flat else 'nested'}",
+            lambda location_index: build(location_index, flat)
+        )
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        return self._payload_response(
+            'list',
+            lambda location_index, flat: location_index.serialize_many(location_index.nodes, flat=flat)
+        )
 
     def retrieve(self, request, *args, **kwargs):
-        eventum = self.get_eventum()
-        instance = self.get_object()
-        children_map = self._build_children_map(eventum)
-        context = {**self.get_serializer_context(), 'children_map': children_map}
-        serializer = self.get_serializer(instance, context=context)
-        return Response(serializer.data)
+        location_index = self._get_location_index()
+        return Response(location_index.serialize(self._get_location_id(), flat=self._is_flat()))
 
     @action(detail=False, methods=['get'])
     def tree(self, request, eventum_slug=None):
-        """Получить дерево локаций (только корневые элементы с детьми)"""
-        eventum = self.get_eventum()
-        children_map = self._build_children_map(eventum)
-        root_locations = children_map.get(None, [])
-        context = {**self.get_serializer_context(), 'children_map': children_map}
-        serializer = self.get_serializer(root_locations, many=True, context=context)
-        return Response(serializer.data)
+        """Получить дерево локаций (только корневые элементы с детьми; ?format=flat - все узлы в порядке обхода)"""
+        def build(location_index, flat):
+            root_ids = location_index.children.get(None, [])
+            if flat:
+                return location_index.serialize_many(location_index.walk(root_ids), flat=True)
+            return location_index.serialize_many(root_ids)
+
+        return self._payload_response('tree', build)
 
     @action(detail=True, methods=['get'])
     def children(self, request, eventum_slug=None, pk=None):
         """Получить дочерние локации"""
+        location_index = self._get_location_index()
+        location_id = self._get_location_id()
+        return Response(location_index.serialize_many(location_index.children.get(location_id, []), flat=self._is_flat()))
+    
+    @action(detail=False, methods=['get'])
+    def free(self, request, eventum_slug=None):
+        """Свободные локации в интервале [start, end) (?start=&end=, опционально ?kind=)"""
+        eventum = self.get_eventum()
+        start, end, error = self._parse_interval(request, required=True)
+        if error is not None:
+            return error
+
+        occupancy = get_occupancy_index(eventum)
+        location_index = occupancy.location_index
+        kind = request.query_params.get('kind')
+        location_ids = None
+        if kind:
+            location_ids = Location.objects.filter(eventum=eventum, kind=kind).values_list('id', flat=True)
+
+        free_ids = occupancy.free_locations(start, end, location_ids=location_ids)
+        result = [
+            {
+                'id': location_id,
+                'name': location_index.names[location_id],
+                'parent_id': location_index.parents[location_id],
+                'full_path': location_index.full_path(location_id),
+            }
+            for location_id in free_ids
+        ]
+        result.sort(key=lambda item: (item['full_path'], item['id']))
+        return Response(result)
+
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, eventum_slug=None, pk=None):
+        """
+        Занятость локации: мероприятия в ней и в ее потомках в порядке начала
+        (?start=&end= - ограничить интервал, ?include_children=0 - только сама локация)
+        """
         eventum = self.get_eventum()
         location = self.get_object()
-        children_map = self._build_children_map(eventum)
-        children = children_map.get(location.id, [])
-        context = {**self.get_serializer_context(), 'children_map': children_map}
-        serializer = self.get_serializer(children, many=True, context=context)
-        return Response(serializer.data)
-    
+        start, end, error = self._parse_interval(request, required=False)
+        if error is not None:
+            return error
+
+        occupancy = get_occupancy_index(eventum)
+        include_descendants = request.query_params.get('include_children', '1') not in ('0', 'false')
+        items = occupancy.timeline(location.id, start, end, include_descendants=include_descendants)
+        return Response({
+            'location_id': location.id,
+            'events': [
+                {
+                    'id': event_id,
+                    'name': occupancy.events[event_id][0],
+                    'start_time': event_start.isoformat(),
+                    'end_time': event_end.isoformat(),
+                    'location_ids': list(occupancy.events[event_id][3]),
+                }
+                for event_start, event_end, event_id in items
+            ],
+        })
+
+    @action(detail=True, methods=['get'], url_path='now-next', permission_classes=[AllowAny])
+    def now_next(self, request, eventum_slug=None, pk=None):
+        """Текущие и ближайшие мероприятия в локации и ее потомках (для экранов на площадке)"""
+        try:
+            location_id = int(pk)
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid location id'}, status=status.HTTP_400_BAD_REQUEST)
+        return _now_next_response(request, self.get_eventum(), location_id)
+
+    @staticmethod
+    def _parse_interval(request, required):
+        """Разбирает ?start=&end= в локальное время: (start, end, ответ с ошибкой или None)"""
+        from datetime import datetime
+
+        values = {}
+        for name in ('start', 'end'):
+            raw = request.query_params.get(name)
+            if not raw:
+                if required:
+                    return None, None, Response({'error': f'{name} parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+                values[name] = None
+                continue
+            try:
+                value = datetime.fromisoformat(raw)
+            except ValueError:
+                return None, None, Response({'error': f'Invalid {name} datetime: {raw}'}, status=status.HTTP_400_BAD_REQUEST)
+            if timezone.is_aware(value):
+                value = timezone.make_naive(value)
+            values[name] = value
+
+        if values['start'] and values['end'] and values['end'] <= values['start']:
+            return None, None, Response({'error': 'end must be after start'}, status=status.HTTP_400_BAD_REQUEST)
+        return values['start'], values['end'], None
+
     @action(detail=False, methods=['get'])
     def by_kind(self, request, eventum_slug=None):
         """Получить локации по типу"""
-        eventum = self.get_eventum()
         kind = request.query_params.get('kind')
         
         if not kind:
             return Response({'error': 'kind parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        locations = Location.objects.filter(eventum=eventum, kind=kind)
-        serializer = self.get_serializer(locations, many=True)
-        return Response(serializer.data)
+        location_index = self._get_location_index()
+        location_ids = [location_id for location_id, node in location_index.nodes.items() if node['kind'] == kind]
+        return Response(location_index.serialize_many(location_ids, flat=self._is_flat()))
     
     @action(detail=False, methods=['get'])
     def valid_parents(self, request, eventum_slug=None):
         """Получить список валидных родительских локаций для указанного типа"""
-        eventum = self.get_eventum()
         kind = request.query_params.get('kind')
         exclude_id = request.query_params.get('exclude_id')
         
@@ -1091,55 +1400,21 @@ class LocationViewSet(EventumScopedViewSet, viewsets.ModelViewSet):
         }
         
         allowed_kinds = valid_parent_kinds.get(kind, [])
+        location_index = self._get_location_index()
         
-        # Получаем локации подходящих типов
-        queryset = Location.objects.filter(eventum=eventum, kind__in=allowed_kinds)
-        
-        # Исключаем текущую локацию (если редактируем)
-        if exclude_id:
-            queryset = queryset.exclude(id=exclude_id)
-        
-        # Исключаем локации, которые уже являются детьми текущей локации (если редактируем)
+        # Исключаем текущую локацию и ее потомков (если редактируем)
+        excluded_ids = frozenset()
         if exclude_id:
             try:
-                current_location = Location.objects.get(id=exclude_id)
-                # Получаем всех потомков текущей локации
-                descendants = self._get_descendants(current_location)
-                if descendants:
-                    queryset = queryset.exclude(id__in=descendants)
-            except Location.DoesNotExist:
-                pass
+                excluded_ids = location_index.descendants(int(exclude_id))
+            except ValueError:
+                return Response({'error': 'exclude_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
         
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
-    
-    def _get_descendants(self, location):
-        """Рекурсивно получает всех потомков локации"""
-        descendants = []
-        children = location.children.all()
-
-        for child in children:
-            descendants.append(child.id)
-            descendants.extend(self._get_descendants(child))
-
-        return descendants
-
-    def _build_children_map(self, eventum):
-        """Строит карту дочерних элементов для всех локаций eventum."""
-        locations = list(
-            Location.objects.filter(eventum=eventum)
-            .select_related('parent')
-            .order_by('id')
-        )
-
-        children_map = {}
-        for location in locations:
-            children_map.setdefault(location.parent_id, []).append(location)
-
-        for location_list in children_map.values():
-            location_list.sort(key=lambda item: item.name.lower())
-
-        return children_map
+        location_ids = [
+            location_id for location_id, node in location_index.nodes.items()
+            if node['kind'] in allowed_kinds and location_id not in excluded_ids
+        ]
+        return Response(location_index.serialize_many(location_ids, flat=self._is_flat()))
 
 
 # Аутентификация через VK
@@ -1359,7 +1634,7 @@ class VKAuthView(TokenObtainPairView):
                 user.save()
             
             # Создаем JWT токены
-            refresh = RefreshToken.for_user(user)
+            refresh = get_tokens_for_user(user)
             
             logger.info(f"VK Auth successful for user: {user.name} (ID: {user.id})")
             
@@ -1464,8 +1739,7 @@ def dev_user_auth(request):
         dev_user = UserProfile.objects.get(vk_id=999999999)
         
         # Создаем JWT токены для пользователя разработчика
-        from rest_framework_simplejwt.tokens import RefreshToken
-        refresh = RefreshToken.for_user(dev_user)
+        refresh = get_tokens_for_user(dev_user)
         
         return Response({
             'access': str(refresh.access_token),
@@ -1514,9 +1788,8 @@ def eventum_details(request, slug=None):
         eventum = get_eventum_from_request(request, kwargs={'slug': slug})
         
         # Проверяем права доступа: только участники и организаторы могут просматривать eventum
-        from .auth_utils import get_user_role_in_eventum
         if request.user.is_authenticated:
-            user_role = get_user_role_in_eventum(request.user, eventum)
+            user_role = get_viewer_context(request, eventum).role
             # Если пользователь не является участником и не является организатором, возвращаем 403
             if user_role not in ['organizer', 'participant']:
                 return Response(
@@ -1834,216 +2107,20 @@ def participant_calendar_ics(request, eventum_slug=None, participant_id=None):
         if not participant_id:
             return Response({'error': 'participant_id is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Используем фиксированный интервал обновления 5 минут
-        refresh_interval_minutes = 5
-        
         # Получаем участника
         try:
-            participant = Participant.objects.select_related('eventum').get(id=participant_id, eventum=eventum)
+            participant = Participant.objects.get(id=participant_id, eventum=eventum)
         except Participant.DoesNotExist:
             return Response({'error': f'Participant with ID {participant_id} not found in this eventum'}, status=status.HTTP_404_NOT_FOUND)
         
-        # Используем ту же логику, что и в EventSerializer.get_is_participant
-        # Если event_group is None - участник участвует (все участники eventum)
-        # Если event_group существует - проверяем через связи группы
+        # Календарь меняется только вместе с версией данных eventum:
+        # отвечаем 304, если у клиента уже актуальная версия
+        etag, last_modified = get_calendar_validators(eventum, participant.id)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
         
-        # Создаем граф групп для eventum один раз на запрос
-        group_graph = EventumGroupGraph(eventum)
-        
-        # Получаем все события eventum
-        all_events = Event.objects.filter(
-            eventum=eventum
-        ).select_related(
-            'eventum', 'event_group'
-        ).prefetch_related(
-            'tags',
-            'locations',
-        )
-        
-        # Фильтруем события в Python, используя ту же логику, что и в EventSerializer.get_is_participant
-        filtered_events = []
-        for event in all_events:
-            # Если есть event_group, проверяем участие через него
-            if event.event_group:
-                if group_graph.has_participant(event.event_group.id, participant_id):
-                    filtered_events.append(event)
-            else:
-                # Для мероприятий без регистрации (без event_group)
-                # все участники eventum должны видеть такие мероприятия
-                filtered_events.append(event)
-        
-        # Создаем iCalendar календарь
-        cal = Calendar()
-        cal.add('prodid', '-//Eventum//Eventum Calendar//RU')
-        cal.add('version', '2.0')
-        cal.add('calscale', 'GREGORIAN')
-        cal.add('method', 'PUBLISH')
-        cal.add('X-WR-CALNAME', f'{eventum.name} - {participant.name}')
-        cal.add('X-WR-CALDESC', f'Календарь мероприятий для участника {participant.name}')
-        
-        # Добавляем рекомендуемый интервал обновления
-        # Формат: PT{minutes}M означает "Period Time {minutes} Minutes"
-        cal.add('REFRESH-INTERVAL', f'PT{refresh_interval_minutes}M')
-        # X-PUBLISHED-TTL - нестандартное свойство, но лучше поддерживается macOS Calendar
-        cal.add('X-PUBLISHED-TTL', f'PT{refresh_interval_minutes}M')
-        
-        # Добавляем каждое мероприятие в календарь
-        for event in filtered_events:
-            ical_event = ICalEvent()
-            
-            # Уникальный ID события
-            ical_event.add('uid', f'event-{event.id}-{eventum.slug}@eventum.local')
-            
-            # Название мероприятия
-            ical_event.add('summary', event.name)
-            
-            # Описание мероприятия
-            description_parts = []
-            if event.description:
-                description_parts.append(event.description)
-            
-            # Добавляем информацию о локациях с оптимизированным отображением
-            if event.locations.exists():
-                location_paths = []
-                locations_data = []
-                
-                # Собираем данные о всех локациях
-                for loc in event.locations.all():
-                    # Получаем полный путь локации от корня до текущей локации
-                    path = []
-                    current = loc
-                    while current:
-                        path.insert(0, current.name)
-                        current = current.parent
-                    location_path = ', '.join(path)
-                    
-                    # Получаем адрес локации (с поиском по иерархии вверх)
-                    address = None
-                    current_for_address = loc
-                    while current_for_address and not address:
-                        if current_for_address.address:
-                            address = current_for_address.address
-                        current_for_address = current_for_address.parent
-                    
-                    locations_data.append({
-                        'path': location_path,
-                        'address': address,
-                        'name': loc.name
-                    })
-                
-                # Оптимизируем отображение - находим общие префиксы
-                if len(locations_data) > 1:
-                    # Находим общий префикс для всех путей (по словам, разделенным запятыми)
-                    common_prefix_parts = []
-                    if locations_data:
-                        first_path_parts = locations_data[0]['path'].split(', ')
-                        for i in range(len(first_path_parts)):
-                            if all(loc['path'].startswith(', '.join(first_path_parts[:i+1])) for loc in locations_data):
-                                common_prefix_parts = first_path_parts[:i+1]
-                            else:
-                                break
-                    
-                    common_prefix = ', '.join(common_prefix_parts) if common_prefix_parts else ""
-                    
-                    # Находим общий адрес (только если все адреса одинаковые и не пустые)
-                    common_address = None
-                    if locations_data and all(loc['address'] == locations_data[0]['address'] for loc in locations_data) and locations_data[0]['address']:
-                        common_address = locations_data[0]['address']
-                    
-                    # Если нет общего адреса, но есть общий префикс, то общий адрес - это адрес от общего префикса
-                    if not common_address and common_prefix:
-                        # Находим адрес для общего префикса
-                        prefix_parts = common_prefix.split(', ')
-                        if len(prefix_parts) > 0:
-                            # Находим локацию, соответствующую последней части префикса
-                            for loc in event.locations.all():
-                                if loc.name == prefix_parts[-1]:
-                                    # Получаем адрес этой локации
-                                    address = None
-                                    current_for_address = loc
-                                    while current_for_address and not address:
-                                        if current_for_address.address:
-                                            address = current_for_address.address
-                                        current_for_address = current_for_address.parent
-                                    if address:
-                                        common_address = address
-                                    break
-                    
-                    # Формируем оптимизированные строки
-                    for loc_data in locations_data:
-                        if common_prefix and loc_data['path'].startswith(common_prefix):
-                            # Убираем общий префикс
-                            remaining_path = loc_data['path'][len(common_prefix):].lstrip(', ')
-                            if remaining_path:
-                                path_to_show = remaining_path
-                            else:
-                                path_to_show = loc_data['name']
-                        else:
-                            path_to_show = loc_data['path']
-                        
-                        # Формируем строку с адресом
-                        if loc_data['address'] and loc_data['address'] != common_address:
-                            location_paths.append(f"{path_to_show} ({loc_data['address']})")
-                        elif not common_address and loc_data['address']:
-                            # Если нет общего адреса, но у этой локации есть адрес
-                            location_paths.append(f"{path_to_show} ({loc_data['address']})")
-                        else:
-                            location_paths.append(path_to_show)
-                    
-                    # Добавляем общий префикс и адрес в начало, если они есть
-                    if common_prefix or common_address:
-                        prefix_parts = []
-                        if common_prefix:
-                            prefix_parts.append(common_prefix)
-                        if common_address:
-                            prefix_parts.append(f"({common_address})")
-                        
-                        if prefix_parts:
-                            location_paths.insert(0, ' '.join(prefix_parts))
-                else:
-                    # Если только одна локация, отображаем как обычно
-                    for loc_data in locations_data:
-                        if loc_data['address']:
-                            location_paths.append(f"{loc_data['path']} ({loc_data['address']})")
-                        else:
-                            location_paths.append(loc_data['path'])
-                
-                description_parts.append(f"Место: {'; '.join(location_paths)}")
-            
-            if description_parts:
-                ical_event.add('description', '\n'.join(description_parts))
-            
-            # Время начала и окончания
-            # Проверяем, является ли время строкой или объектом datetime
-            if isinstance(event.start_time, str):
-                start_time = timezone.make_aware(datetime.fromisoformat(event.start_time.replace('Z', '+00:00')))
-            else:
-                start_time = event.start_time
-                
-            if isinstance(event.end_time, str):
-                end_time = timezone.make_aware(datetime.fromisoformat(event.end_time.replace('Z', '+00:00')))
-            else:
-                end_time = event.end_time
-            
-            ical_event.add('dtstart', start_time)
-            ical_event.add('dtend', end_time)
-            
-            # Время создания и последнего изменения
-            now = timezone.now()
-            ical_event.add('dtstamp', now)
-            ical_event.add('created', now)
-            ical_event.add('last-modified', now)
-            
-            # Статус события
-            ical_event.add('status', 'CONFIRMED')
-            
-            # Добавляем событие в календарь
-            cal.add_component(ical_event)
-        
-        # Генерируем содержимое календаря
-        calendar_content = cal.to_ical().decode('utf-8')
-        
-        logger.info(f"iCalendar сгенерирован для участника {participant_id}")
+        calendar_content = get_participant_calendar(eventum, participant)
         
         # Безопасное имя файла (убираем специальные символы)
         safe_filename = f"eventum-{eventum.slug}-{participant.id}.ics"
@@ -2054,10 +2131,12 @@ def participant_calendar_ics(request, eventum_slug=None, participant_id=None):
         
         # Для Safari на iPhone критично использовать простой формат с кавычками
         response['Content-Disposition'] = f'attachment; filename="{safe_filename}"'
-        response['Content-Length'] = str(len(calendar_content.encode('utf-8')))
-        response['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response['Pragma'] = 'no-cache'
-        response['Expires'] = '0'
+        response['Content-Length'] = str(len(calendar_content))
+        # Клиент может хранить ответ, но обязан перепроверять его по ETag/Last-Modified
+        response['Cache-Control'] = 'no-cache, must-revalidate'
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
         response['Access-Control-Allow-Origin'] = '*'
         response['Access-Control-Allow-Methods'] = 'GET'
         response['Access-Control-Allow-Headers'] = 'Content-Type'
@@ -2072,6 +2151,90 @@ def participant_calendar_ics(request, eventum_slug=None, participant_id=None):
         )
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+@log_execution_time("Генерация публичной ленты iCalendar")
+def calendar_feed_ics(request, eventum_slug=None):
+    """
+    Публичная лента iCalendar: мероприятия с тегом (?tag=), в поддереве локации
+    (?location=) или все мероприятия eventum (?all=1). Тег и локацию можно совмещать.
+    """
+    from django.http import StreamingHttpResponse
+    from .ics import get_feed_event_ids, iter_feed_calendar
+
+    eventum = get_eventum_from_request(request, kwargs={'slug': eventum_slug})
+
+    try:
+        tag_id = int(request.GET['tag']) if request.GET.get('tag') else None
+        location_id = int(request.GET['location']) if request.GET.get('location') else None
+    except ValueError:
+        return Response({'error': 'tag and location must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    all_events = request.GET.get('all') in ('1', 'true')
+
+    if tag_id is None and location_id is None and not all_events:
+        return Response({'error': 'tag, location or all=1 is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    names = []
+    tag = None
+    if tag_id is not None:
+        tag = EventTag.objects.filter(eventum=eventum, id=tag_id).only('id', 'name').first()
+        if tag is None:
+            return Response({'error': f'Tag with ID {tag_id} not found in this eventum'}, status=status.HTTP_404_NOT_FOUND)
+        names.append(tag.name)
+
+    location_ids = None
+    if location_id is not None:
+        location_index = get_location_index(eventum)
+        if location_id not in location_index:
+            return Response({'error': f'Location with ID {location_id} not found in this eventum'}, status=status.HTTP_404_NOT_FOUND)
+        location_ids = location_index.descendants(location_id)
+        names.append(location_index.names[location_id])
+
+    # Лента не зависит от состава участников, но ETag строится так же, как у персональных календарей
+    etag, last_modified = get_calendar_validators(eventum, 'feed', tag_id or 0, location_id or 0)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    feed_name = f"{eventum.name} - {', '.join(names)}" if names else eventum.name
+    event_ids = get_feed_event_ids(eventum, tag_id=tag_id, location_ids=location_ids)
+    response = StreamingHttpResponse(
+        iter_feed_calendar(eventum, feed_name, f'Календарь мероприятий: {feed_name}', event_ids),
+        content_type='text/calendar; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="eventum-{eventum.slug}-feed.ics"'
+    response['Cache-Control'] = 'no-cache, must-revalidate'
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+def _now_next_response(request, eventum, location_id=None):
+    """Ответ "сейчас и далее" для eventum или поддерева локации"""
+    try:
+        limit = min(max(int(request.query_params.get('limit', 3)), 1), 20)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    data = get_now_next(eventum, location_id=location_id, limit=limit)
+    if data is None:
+        return Response({'error': f'Location with ID {location_id} not found in this eventum'}, status=status.HTTP_404_NOT_FOUND)
+
+    response = Response(data)
+    response['Cache-Control'] = f"public, max-age={getattr(settings, 'NOW_NEXT_CACHE_TIMEOUT', 15)}"
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def eventum_now_next(request, slug=None):
+    """Текущие и ближайшие мероприятия eventum (для экранов на площадке)"""
+    eventum = get_eventum_from_request(request, kwargs={'slug': slug})
+    return _now_next_response(request, eventum)
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def participant_calendar_webcal(request, eventum_slug=None):
@@ -2125,3 +2288,93 @@ def participant_calendar_webcal(request, eventum_slug=None):
         )
 
 
+
+
+@api_view(['POST'])
+@require_eventum_role('organizer')
+def calendar_export_start(request, slug=None):
+    """
+    Запускает выгрузку календарей всех участников в ZIP-архив.
+
+    Выгрузка выполняется отдельным процессом (команда export_calendars),
+    поэтому не занимает воркеры, обслуживающие запросы. Если выгрузка
+    eventum уже выполняется, возвращается ее задача; если на сервере уже
+    выполняется CALENDAR_EXPORT_MAX_JOBS выгрузок, новая не запускается.
+    """
+    import subprocess
+    import sys
+    from .calendar_export import (
+        cleanup_exports, export_lock, get_active_exports, get_export_paths, write_export_status,
+    )
+
+    eventum = request.eventum
+    with export_lock():
+        cleanup_exports()
+        active_exports = get_active_exports()
+        active_job_id = active_exports.get(str(eventum.id))
+        if active_job_id is not None:
+            return Response({'job_id': str(uuid.UUID(active_job_id)), 'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
+        if len(active_exports) >= settings.CALENDAR_EXPORT_MAX_JOBS:
+            return Response({'error': 'Too many calendar exports are running'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+
+        job_id = uuid.uuid4()
+        archive_path, status_path = get_export_paths(eventum, job_id.hex)
+        write_export_status(status_path, status='pending')
+
+        try:
+            subprocess.Popen(
+                [
+                    sys.executable, str(settings.BASE_DIR / 'manage.py'), 'export_calendars', eventum.slug,
+                    '--output', archive_path, '--status-file', status_path,
+                    '--workers', str(settings.CALENDAR_EXPORT_WORKERS),
+                ],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+        except OSError as e:
+            logger.error(f"Failed to start calendar export: {str(e)}", exc_info=True)
+            write_export_status(status_path, status='failed', error='Failed to start export')
+            return Response({'error': 'Failed to start export'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return Response({'job_id': str(job_id), 'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@require_eventum_role('organizer')
+def calendar_export_status(request, slug=None, job_id=None):
+    """Статус выгрузки календарей"""
+    from .calendar_export import get_export_paths, read_export_status
+
+    _, status_path = get_export_paths(request.eventum, job_id.hex)
+    export_status = read_export_status(status_path)
+    if export_status is None:
+        return Response({'error': 'Export job not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'job_id': str(job_id), **export_status})
+
+
+@api_view(['GET'])
+@require_eventum_role('organizer')
+def calendar_export_download(request, slug=None, job_id=None):
+    """Скачивание готового архива с календарями участников"""
+    from django.http import FileResponse
+    from .calendar_export import get_export_paths, read_export_status
+
+    archive_path, status_path = get_export_paths(request.eventum, job_id.hex)
+    export_status = read_export_status(status_path)
+    if export_status is None:
+        return Response({'error': 'Export job not found'}, status=status.HTTP_404_NOT_FOUND)
+    if export_status.get('status') != 'done':
+        return Response({'error': 'Export is not finished', 'status': export_status.get('status')}, status=status.HTTP_409_CONFLICT)
+
+    try:
+        archive = open(archive_path, 'rb')
+    except FileNotFoundError:
+        return Response({'error': 'Export archive not found'}, status=status.HTTP_404_NOT_FOUND)
+    return FileResponse(
+        archive,
+        as_attachment=True,
+        filename=f"eventum-{request.eventum.slug}-calendars.zip",
+        content_type='application/zip',
+    )
@@ -0,0 +1,228 @@
+"""
+Агрегаты волн мероприятий.
+
+Все регистрации, входящие в волны eventum, загружаются одним набором
+запросов, после чего для каждой волны один раз вычисляются множества
+участников по мероприятиям и их объединение. Остальные величины
+(например, "уже распределены на другие мероприятия волны") получаются
+операциями над множествами без обращений к БД.
+"""
+from .utils import EventumGroupGraph
+
+
+class WaveAggregates:
+    """Множества участников мероприятий одной волны."""
+
+    def __init__(self, wave_id, event_members, counted_event_ids):
+        """
+        Args:
+            wave_id: ID волны
+            event_members: {event_id: set(participant_id)} для всех мероприятий волны
+            counted_event_ids: ID мероприятий, участники которых считаются распределенными
+                               (мероприятия с event_group)
+        """
+        self.wave_id = wave_id
+        self.event_members = event_members
+        self.counted_event_ids = set(counted_event_ids)
+
+        # Объединение участников и участники, попавшие больше чем на одно мероприятие
+        self.union = set()
+        self.multiple = set()
+        for event_id in self.counted_event_ids:
+            members = event_members.get(event_id, set())
+            self.multiple |= self.union & members
+            self.union |= members
+
+    def get_members(self, event_id):
+        """Участники мероприятия волны."""
+        return self.event_members.get(event_id, set())
+
+    def assigned_elsewhere(self, event_id):
+        """
+        Участники, распределенные на другие мероприятия волны.
+
+        Объединение по всем мероприятиям, кроме event_id: всё объединение без
+        участников мероприятия плюс те из них, кто есть еще где-то в волне.
+        """
+        if event_id not in self.counted_event_ids:
+            return set(self.union)
+        members = self.get_members(event_id)
+        return (self.union - members) | (members & self.multiple)
+
+
+class EventumWaveIndex:
+    """
+    Индекс волн eventum: какая волна у мероприятия и агрегаты каждой волны.
+
+    Агрегаты вычисляются лениво и только один раз для каждой волны.
+    """
+
+    def __init__(self, eventum, group_graph=None):
+        from .models import EventRegistration, EventWave
+
+        self.eventum = eventum
+        self._group_graph = group_graph
+
+        # Одна строка на пару (волна, регистрация) вместе с данными мероприятия
+        rows = EventWave.registrations.through.objects.filter(
+            eventwave__eventum=eventum
+        ).values_list(
+            'eventwave_id',
+            'eventregistration_id',
+            'eventregistration__event_id',
+            'eventregistration__registration_type',
+            'eventregistration__event__event_group_id',
+        ).order_by('eventwave_id', 'eventregistration_id')
+
+        self.wave_registrations = {}   # {wave_id: [registration_id]}
+        self.event_wave_ids = {}       # {event_id: wave_id} - первая волна мероприятия
+        self.registrations = {}        # {registration_id: (event_id, registration_type, event_group_id)}
+        for wave_id, registration_id, event_id, registration_type, event_group_id in rows:
+            self.wave_registrations.setdefault(wave_id, []).append(registration_id)
+            self.event_wave_ids.setdefault(event_id, wave_id)
+            self.registrations[registration_id] = (event_id, registration_type, event_group_id)
+
+        # Заявки по всем регистрациям типа application одним запросом
+        self.applicants = {}
+        application_ids = [
+            registration_id
+            for registration_id, (_, registration_type, _) in self.registrations.items()
+            if registration_type == EventRegistration.RegistrationType.APPLICATION
+        ]
+        if application_ids:
+            applicant_rows = EventRegistration.applicants.through.objects.filter(
+                eventregistration_id__in=application_ids
+            ).values_list('eventregistration_id', 'participant_id')
+            for registration_id, participant_id in applicant_rows:
+                self.applicants.setdefault(registration_id, set()).add(participant_id)
+
+        self._aggregates = {}
+
+    @property
+    def group_graph(self):
+        if self._group_graph is None:
+            self._group_graph = EventumGroupGraph(self.eventum)
+        return self._group_graph
+
+    def get_wave_id(self, event_id):
+        """ID первой волны, в которую входит регистрация мероприятия, или None."""
+        return self.event_wave_ids.get(event_id)
+
+    def _get_registration_members(self, registration_id):
+        from .models import EventRegistration
+
+        _, registration_type, event_group_id = self.registrations[registration_id]
+        if registration_type == EventRegistration.RegistrationType.BUTTON:
+            if not event_group_id:
+                return set()
+            return self.group_graph.get_participant_ids(event_group_id)
+        return self.applicants.get(registration_id, set())
+
+    def get_aggregates(self, wave_id):
+        """Агрегаты волны (вычисляются один раз)."""
+        if wave_id not in self._aggregates:
+            event_members = {}
+            counted_event_ids = []
+            for registration_id in self.wave_registrations.get(wave_id, []):
+                event_id, _, event_group_id = self.registrations[registration_id]
+                event_members[event_id] = self._get_registration_members(registration_id)
+                if event_group_id:
+                    counted_event_ids.append(event_id)
+            self._aggregates[wave_id] = WaveAggregates(wave_id, event_members, counted_event_ids)
+        return self._aggregates[wave_id]
+
+    def get_event_aggregates(self, event_id):
+        """Агрегаты волны мероприятия или None, если мероприятие не входит в волну."""
+        wave_id = self.get_wave_id(event_id)
+        if wave_id is None:
+            return None
+        return self.get_aggregates(wave_id)
+
+
+def build_wave_summary(eventum, participant_id=None):
+    """
+    Компактная сводка по волнам eventum.
+
+    Для каждой волны возвращает ID регистраций и мероприятий, вместимость,
+    количество записанных и доступность для зрителя. Число запросов не зависит
+    от количества волн и мероприятий: волны, связи волна-регистрация,
+    регистрации со счетчиком заявок (COUNT в SQL) и, при необходимости,
+    граф групп для регистраций по кнопке и allowed_group.
+
+    Args:
+        eventum: Объект Eventum
+        participant_id: ID участника, для которого вычисляется is_accessible
+
+    Returns:
+        list: Сводка по волнам в порядке ID
+    """
+    from django.db.models import Count
+    from .models import EventRegistration, EventWave
+
+    waves = list(EventWave.objects.filter(eventum=eventum).order_by('id').values('id', 'name'))
+
+    wave_registration_ids = {}
+    through_rows = EventWave.registrations.through.objects.filter(
+        eventwave__eventum=eventum
+    ).order_by('eventregistration_id').values_list('eventwave_id', 'eventregistration_id')
+    for wave_id, registration_id in through_rows:
+        wave_registration_ids.setdefault(wave_id, []).append(registration_id)
+
+    registrations = {
+        row['id']: row
+        for row in EventRegistration.objects.filter(
+            event__eventum=eventum,
+            waves__isnull=False
+        ).values(
+            'id', 'event_id', 'registration_type', 'max_participants', 'allowed_group_id', 'event__event_group_id'
+        ).annotate(applicants_count=Count('applicants', distinct=True))
+    }
+
+    group_graph = None
+    needs_graph = any(
+        (row['registration_type'] == EventRegistration.RegistrationType.BUTTON and row['event__event_group_id'])
+        or (row['allowed_group_id'] and participant_id is not None)
+        for row in registrations.values()
+    )
+    if needs_graph:
+        group_graph = EventumGroupGraph(eventum)
+
+    summary_by_registration = {}
+    for registration_id, row in registrations.items():
+        if row['registration_type'] == EventRegistration.RegistrationType.BUTTON:
+            registered_count = group_graph.get_participant_count(row['event__event_group_id']) if row['event__event_group_id'] else 0
+        else:
+            registered_count = row['applicants_count']
+
+        if row['allowed_group_id'] is None:
+            is_accessible = True
+        elif participant_id is None:
+            is_accessible = False
+        else:
+            is_accessible = group_graph.has_participant(row['allowed_group_id'], participant_id)
+
+        summary_by_registration[registration_id] = {
+            'id': registration_id,
+            'event_id': row['event_id'],
+            'registration_type': row['registration_type'],
+            'max_participants': row['max_participants'],
+            'allowed_group': row['allowed_group_id'],
+            'registered_count': registered_count,
+            'is_accessible': is_accessible,
+        }
+
+    result = []
+    for wave in waves:
+        wave_registrations = [
+            summary_by_registration[registration_id]
+            for registration_id in wave_registration_ids.get(wave['id'], [])
+            if registration_id in summary_by_registration
+        ]
+        result.append({
+            'id': wave['id'],
+            'name': wave['name'],
+            'registration_ids': [item['id'] for item in wave_registrations],
+            'event_ids': [item['event_id'] for item in wave_registrations],
+            'registrations': wave_registrations,
+        })
+    return result
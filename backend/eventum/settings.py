@@ -193,6 +193,54 @@ DATABASE_CONNECTION_POOLING = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# По умолчанию используется локальный кэш процесса. Для общего кэша между
+# воркерами gunicorn укажите CACHE_BACKEND и CACHE_LOCATION
+# (например, django.core.cache.backends.redis.RedisCache и redis://...).
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', 'eventum'),
+    }
+}
+
+if CACHE_BACKEND.endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '5000'))}
+
+# Время жизни закэшированных календарей (сек); актуальность обеспечивается версией данных eventum
+ICS_CACHE_TIMEOUT = int(os.getenv('ICS_CACHE_TIMEOUT', '3600'))
+
+# Время жизни строк Eventum в общем кэше (сек) и в памяти процесса (сек) -
+# второе ограничивает задержку, с которой изменения eventum видны другим воркерам.
+# С локальным кэшем процесса (LocMemCache) общий слой не используется
+EVENTUM_CACHE_TIMEOUT = int(os.getenv('EVENTUM_CACHE_TIMEOUT', '300'))
+EVENTUM_LOCAL_CACHE_TIMEOUT = int(os.getenv('EVENTUM_LOCAL_CACHE_TIMEOUT', '5'))
+
+# То же для членства пользователей в eventum (роль организатора, участник) -
+# второе ограничивает задержку, с которой отзыв роли виден другим воркерам
+MEMBERSHIP_CACHE_TIMEOUT = int(os.getenv('MEMBERSHIP_CACHE_TIMEOUT', '300'))
+MEMBERSHIP_LOCAL_CACHE_TIMEOUT = int(os.getenv('MEMBERSHIP_LOCAL_CACHE_TIMEOUT', '5'))
+
+# Время жизни строк пользователей, загруженных при аутентификации, в памяти процесса (сек)
+USER_CACHE_TIMEOUT = int(os.getenv('USER_CACHE_TIMEOUT', '60'))
+
+# Время жизни ответов "сейчас и далее" для экранов на площадке (сек)
+NOW_NEXT_CACHE_TIMEOUT = int(os.getenv('NOW_NEXT_CACHE_TIMEOUT', '15'))
+
+# Каталог для массовых выгрузок календарей участников (export_calendars)
+CALENDAR_EXPORT_ROOT = os.getenv('CALENDAR_EXPORT_ROOT', str(BASE_DIR / 'calendar_exports'))
+# Одновременных выгрузок на сервер и процессов рендеринга в каждой из них
+CALENDAR_EXPORT_MAX_JOBS = int(os.getenv('CALENDAR_EXPORT_MAX_JOBS', '2'))
+CALENDAR_EXPORT_WORKERS = int(os.getenv('CALENDAR_EXPORT_WORKERS', '2'))
+# Через сколько секунд незавершенная выгрузка считается упавшей и удаляется готовая (сек)
+CALENDAR_EXPORT_TIMEOUT = int(os.getenv('CALENDAR_EXPORT_TIMEOUT', '3600'))
+CALENDAR_EXPORT_TTL = int(os.getenv('CALENDAR_EXPORT_TTL', '86400'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -277,8 +325,8 @@ SIMPLE_JWT = {
 # Настройки REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'app.authentication.QueryTokenAuthentication',  # Наш кастомный аутентификатор
-        'rest_framework_simplejwt.authentication.JWTAuthentication',  # Резервный
+        # Bearer-заголовок, query и POST параметры; заменяет JWTAuthentication
+        'app.authentication.QueryTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -295,6 +343,10 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Размер страницы keyset-пагинации (списки участников) по умолчанию и максимальный
+KEYSET_PAGE_SIZE = int(os.getenv('KEYSET_PAGE_SIZE', '100'))
+KEYSET_MAX_PAGE_SIZE = int(os.getenv('KEYSET_MAX_PAGE_SIZE', '1000'))
+
 # Yandex Object Storage (S3-compatible) settings
 # Use AWS_* standard env var names
 AWS_ACCESS_KEY_ID = os.getenv('AWS_ACCESS_KEY_ID')
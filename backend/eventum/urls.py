@@ -7,7 +7,13 @@ from django.http import JsonResponse
 
 def healthz_view(request):
     """Health check endpoint for load balancers and deployment systems"""
-    return JsonResponse({'status': 'ok'}, status=200)
+    from app.caching import get_cache_stats
+
+    data = {'status': 'ok'}
+    # Счетчики кэшей относятся к процессу, обработавшему запрос, и видны только персоналу
+    if request.user.is_authenticated and request.user.is_staff:
+        data['caches'] = get_cache_stats()
+    return JsonResponse(data, status=200)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
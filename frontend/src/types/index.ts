@@ -6,6 +6,8 @@ export interface Eventum {
     image_url?: string;
     registration_open: boolean;
     schedule_visible: boolean;
+    forbid_overlapping_registrations?: boolean;
+  forbid_location_double_booking?: boolean;
     // password_hash мы не получаем на фронтенде, поэтому его здесь нет
 }
 